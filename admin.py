@@ -0,0 +1,264 @@
+# coding: utf-8
+"""Admin Cog: BOT オーナー専用の運用コマンド（プレフィックスコマンドのみ。Slash には出さない）"""
+
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import time
+import tracemalloc
+import zipfile
+
+import discord
+from discord.ext import commands
+
+import bulk_io
+import loop_monitor
+import memory_profile
+import play_stats
+import reaction_db
+import upload_store
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MAX_SEC = 300
+PROFILE_TOP = 60
+TRACEMALLOC_TOP = 40
+# スナップショットの集計から外すフレーム（計測そのものと import の割り当て）
+_TRACEMALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _text_file(text: str, filename: str) -> discord.File:
+    return discord.File(io.BytesIO(text.encode("utf-8")), filename=filename)
+
+
+def _format_profile(profiler: cProfile.Profile, sort: str, seconds: float) -> str:
+    out = io.StringIO()
+    out.write(f"cProfile of the event loop thread for {seconds:.1f}s, sorted by {sort}\n\n")
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(PROFILE_TOP)
+    return out.getvalue()
+
+
+def _format_snapshot(snapshot: tracemalloc.Snapshot, baseline: tracemalloc.Snapshot | None) -> str:
+    snapshot = snapshot.filter_traces(_TRACEMALLOC_FILTERS)
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"traced current {current / 1024 / 1024:.1f} MB / peak {peak / 1024 / 1024:.1f} MB", ""]
+    if baseline is None:
+        stats = snapshot.statistics("lineno")
+        lines.append(f"top {TRACEMALLOC_TOP} allocation sites")
+    else:
+        stats = snapshot.compare_to(baseline.filter_traces(_TRACEMALLOC_FILTERS), "lineno")
+        lines.append(f"top {TRACEMALLOC_TOP} growth since the saved snapshot")
+    lines += [str(s) for s in stats[:TRACEMALLOC_TOP]]
+    if stats:
+        worst = stats[0]
+        lines += ["", f"traceback of the top entry ({len(worst.traceback)} frames):"]
+        lines += worst.traceback.format()
+    return "\n".join(lines)
+
+
+class Admin(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self._profiling = False
+        # $tracemalloc snapshot で保存した比較の基準
+        self._tracemalloc_baseline: tracemalloc.Snapshot | None = None
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command(name="stats")
+    async def stats(self, ctx: commands.Context):
+        """流量制御などの内部カウンタを表示する。"""
+        lines = ["**stats**"]
+        voice = self.bot.get_cog("Voice")
+        if voice is not None:
+            t = voice.trigger_stats()
+            lines += [
+                "リアクショントリガー（起動から累計）",
+                f"・通過 {t['accepted']} / 連打抑止 {t['debounced']} / ユーザー上限 {t['user_limited']} / サーバー上限 {t['guild_limited']}",
+                f"・保持キー数 debounce {t['debounce_keys']} / user {t['user_buckets']} / guild {t['guild_buckets']}",
+            ]
+            v = voice.session_stats()
+            lines += [
+                "VC セッション（起動から累計）",
+                f"・意図しない切断 {v['drops']}（うち監査ログで管理者による切断 {v['kicked']}）/ 再接続 {v['reconnects']} / 断念 {v['gave_up']} / 再接続中 {v['recovering']}",
+                f"・復帰までの時間 平均 {v['recover_sec_avg']:.2f}s / 最大 {v['recover_sec_max']:.2f}s",
+                f"・現在のセッション {v['sessions']}（" + " / ".join(f"{k} {n}" for k, n in v["states"].items()) + "）",
+            ]
+            o = voice.overload.snapshot()
+            d = o["dropped"]
+            lines += [
+                f"過負荷制御 レベル {o['level']}（{o['name']}、起動後の最大 {o['max_level']}、遷移 {o['transitions']} 回）",
+                f"・ループ遅延 {o['lag_ms']:.0f} ms / キュー合計 {o['queued']} / 429 {o['rate_limited_per_min']} 件/分 / 再生を落とす guild {o['shed_guilds']}",
+                f"・落とした件数 自動リアクション {d['auto_reactions']} / キュー上限 {d['queue_full']} / リアクション外し {d['reaction_remove']} / 要求の多い guild {d['shed']}",
+            ]
+        rss = memory_profile.rss_bytes()
+        c = memory_profile.cache_counts(self.bot)
+        lines += [
+            f"メモリ（{getattr(self.bot, 'memory_profile', 'default')}）",
+            f"・RSS {rss / 1024 / 1024 if rss else 0:.1f} MB / キャッシュ メンバー {c['members']} ユーザー {c['users']} メッセージ {c['messages']}",
+        ]
+        if loop_monitor.is_running():
+            lines += ["イベントループ", f"```\n{loop_monitor.report()}\n```"]
+        await ctx.send("\n".join(lines)[:2000])
+
+    @commands.command(name="profile")
+    async def profile(self, ctx: commands.Context, seconds: float = 10.0, sort: str = "cumulative"):
+        """イベントループのスレッドを seconds 秒 cProfile で計測し、上位の関数を添付ファイルで返す。"""
+        if self._profiling:
+            await ctx.send("計測中です。終わってから実行してください。")
+            return
+        if sort not in ("cumulative", "tottime", "ncalls"):
+            await ctx.send("sort は cumulative / tottime / ncalls のどれかです。")
+            return
+        seconds = min(max(seconds, 1.0), PROFILE_MAX_SEC)
+        self._profiling = True
+        profiler = cProfile.Profile()
+        await ctx.send(f"{seconds:.0f} 秒計測します。")
+        t0 = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+            text = await asyncio.to_thread(_format_profile, profiler, sort, time.perf_counter() - t0)
+        finally:
+            self._profiling = False
+        await ctx.send(file=_text_file(text, f"profile-{int(time.time())}.txt"))
+
+    @commands.command(name="tracemalloc")
+    async def tracemalloc_cmd(self, ctx: commands.Context, action: str, frames: int = 10):
+        """start [frames] / snapshot（基準を保存して上位を表示）/ diff（基準からの増加）/ stop。"""
+        if action == "start":
+            if tracemalloc.is_tracing():
+                await ctx.send("すでに計測中です。")
+                return
+            tracemalloc.start(min(max(frames, 1), 50))
+            self._tracemalloc_baseline = None
+            await ctx.send(f"tracemalloc を開始しました（{tracemalloc.get_traceback_limit()} フレーム）。割り当てが遅くなるので、終わったら stop してください。")
+        elif action in ("snapshot", "diff"):
+            if not tracemalloc.is_tracing():
+                await ctx.send("`$tracemalloc start` で開始してください。")
+                return
+            baseline = self._tracemalloc_baseline if action == "diff" else None
+            if action == "diff" and baseline is None:
+                await ctx.send("基準がありません。先に `$tracemalloc snapshot` を実行してください。")
+                return
+            snapshot = tracemalloc.take_snapshot()
+            if action == "snapshot":
+                self._tracemalloc_baseline = snapshot
+            text = await asyncio.to_thread(_format_snapshot, snapshot, baseline)
+            await ctx.send(file=_text_file(text, f"tracemalloc-{action}-{int(time.time())}.txt"))
+        elif action == "stop":
+            tracemalloc.stop()
+            self._tracemalloc_baseline = None
+            await ctx.send("tracemalloc を止めました。")
+        else:
+            await ctx.send("使い方: `$tracemalloc start [frames]` / `snapshot` / `diff` / `stop`")
+
+    @commands.command(name="sizes")
+    async def sizes(self, ctx: commands.Context, top: int = 20):
+        """Voice Cog の内部構造（キュー・キャッシュ・VC など）の件数を guild ごとに表示する。"""
+        voice = self.bot.get_cog("Voice")
+        if voice is None:
+            await ctx.send("Voice Cog が読み込まれていません。")
+            return
+        per_guild, shared = voice.structure_sizes()
+        totals: dict[str, int] = {}
+        for sizes in per_guild.values():
+            for name, n in sizes.items():
+                totals[name] = totals.get(name, 0) + n
+        lines = [
+            f"guilds with state: {len(per_guild)} / connected: {len(self.bot.guilds)}",
+            "total: " + " ".join(f"{k}={v}" for k, v in sorted(totals.items())),
+            "shared: " + " ".join(f"{k}={v}" for k, v in shared.items()),
+            "",
+            f"top {top} guilds by entries:",
+        ]
+        ranked = sorted(per_guild.items(), key=lambda x: -sum(x[1].values()))[:max(top, 1)]
+        for guild_id, sizes in ranked:
+            detail = " ".join(f"{k}={v}" for k, v in sorted(sizes.items()))
+            lines.append(f"  {guild_id}: {sum(sizes.values())}  {detail}")
+        text = "\n".join(lines)
+        if len(text) <= 1900:
+            await ctx.send(f"```\n{text}\n```")
+        else:
+            await ctx.send(file=_text_file(text, "sizes.txt"))
+
+    @commands.command(name="top_sounds")
+    async def top_sounds(self, ctx: commands.Context, guild_id: int | None = None, top: int = 20):
+        """再生回数の多い音声ときっかけになった絵文字を表示する（guild_id を省くと全体。file の音源は guild をまたいで合算）。"""
+        top = max(1, min(top, 100))
+
+        def load():
+            play_stats.flush()
+            return play_stats.top_sounds(guild_id, top), play_stats.top_emojis(guild_id, top)
+
+        sounds, emojis = await asyncio.to_thread(load)
+        lines = [f"top {top} sounds ({'guild ' + str(guild_id) if guild_id is not None else 'all guilds'}):"]
+        for g, kind, sound, plays in sounds:
+            where = f"  [{g}]" if guild_id is None and kind == "upload" else ""
+            lines.append(f"  {plays:8d}  {kind:6} {sound}{where}")
+        lines += ["", f"top {top} emojis:"]
+        lines += [f"  {plays:8d}  {emoji}" for emoji, plays in emojis]
+        text = "\n".join(lines)
+        if len(text) <= 1900:
+            await ctx.send(f"```\n{text}\n```")
+        else:
+            await ctx.send(file=_text_file(text, "top_sounds.txt"))
+
+    @commands.command(name="dbcheck")
+    async def dbcheck(self, ctx: commands.Context):
+        """よく使う問い合わせの EXPLAIN QUERY PLAN を取り、全件走査になっているものを表示する。"""
+        results = await asyncio.to_thread(
+            lambda: upload_store.check_query_plans() + reaction_db.check_query_plans() + play_stats.check_query_plans()
+        )
+        bad = [(label, plan) for label, ok, plan in results if not ok]
+        lines = [f"**dbcheck** {len(results) - len(bad)}/{len(results)} 件が索引で引けています"]
+        for label, plan in bad:
+            lines.append(f"・`{label}`: {plan}")
+        await ctx.send("\n".join(lines)[:2000])
+
+    @commands.command(name="import_dir")
+    async def import_dir(self, ctx: commands.Context, guild_id: int, path: str):
+        """サーバー上のディレクトリ（または zip）の音声を guild_id に一括で取り込む。"""
+        voice = self.bot.get_cog("Voice")
+        normalize = voice._storage_reaction_key if voice is not None else None
+        try:
+            report = await asyncio.to_thread(
+                bulk_io.import_archive, guild_id, path, uploaded_by=ctx.author.id, normalize_key=normalize
+            )
+        except (ValueError, OSError, zipfile.BadZipFile) as e:
+            await ctx.send(f"取り込めませんでした: {e}")
+            return
+        if voice is not None:
+            voice._invalidate_uploads(guild_id)
+            voice._schedule_import_prefetch(guild_id, report["names"])
+        await ctx.send(
+            f"guild {guild_id}: {report['imported']} 件取り込み（{report['bytes'] / 1024 / 1024:.1f} MB、"
+            f"紐付け {report['bindings']} 件、スキップ {len(report['skipped']) + len(report['missing'])} 件、"
+            f"{report['elapsed']:.1f} 秒）"
+        )
+
+    @commands.command(name="export_dir")
+    async def export_dir(self, ctx: commands.Context, guild_id: int, path: str):
+        """guild_id のアップロードと紐付けをサーバー上のディレクトリ（.zip で終わればその zip）に書き出す。"""
+        try:
+            report = await asyncio.to_thread(bulk_io.export_archive, guild_id, path)
+        except OSError as e:
+            await ctx.send(f"書き出せませんでした: {e}")
+            return
+        await ctx.send(
+            f"guild {guild_id}: {report['files']} 件（{report['bytes'] / 1024 / 1024:.1f} MB、紐付け {report['bindings']} 件）を `{path}` に書き出しました。"
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Admin(bot))
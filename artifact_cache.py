@@ -0,0 +1,184 @@
+# coding: utf-8
+"""派生ファイル（デコード済み PCM など）の容量上限付きディスクキャッシュ（最後に再生された順の LRU で追い出す）"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+_STORE_BASE = Path(os.environ.get("UPLOAD_STORE_DIR", "."))
+CACHE_DIR = Path(os.environ.get("ARTIFACT_CACHE_DIR", str(_STORE_BASE / "cache")))
+MAX_BYTES = int(float(os.environ.get("ARTIFACT_CACHE_MB", "1024")) * 1024 * 1024)
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+RENDER_TIMEOUT_SEC = 60
+
+_lock = threading.Lock()
+# key → (path, size)。末尾ほど最近再生されたもの
+_entries: "OrderedDict[str, tuple[Path, int]]" = OrderedDict()
+_total_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "renders": 0, "render_failures": 0}
+
+
+def init() -> None:
+    """キャッシュディレクトリを走査して索引を作る。再生順は mtime（再生のたびに更新）で復元する。"""
+    global _total_bytes
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    found = []
+    for p in CACHE_DIR.glob("*/*"):
+        if p.name.startswith("."):
+            # 書き込み途中で落ちた一時ファイル
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            continue
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        found.append((st.st_mtime, p.stem, p, st.st_size))
+    found.sort()
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+        for _mtime, key, p, size in found:
+            _entries[key] = (p, size)
+            _total_bytes += size
+        _evict_locked()
+    logger.debug("artifact_cache init done entries=%d bytes=%d", len(_entries), _total_bytes)
+
+
+def _evict_locked() -> None:
+    global _total_bytes
+    while _total_bytes > MAX_BYTES and _entries:
+        key, (path, size) = _entries.popitem(last=False)
+        _total_bytes -= size
+        _stats["evictions"] += 1
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("[artifact_cache] could not evict %s: %s", path, e)
+
+
+def _path_for(key: str, suffix: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}{suffix}"
+
+
+def lookup(key: str) -> Path | None:
+    """キャッシュにあればパスを返し、最近使った扱いにする。"""
+    global _total_bytes
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+    path = entry[0]
+    try:
+        os.utime(path)
+    except OSError:
+        # 外から消された
+        with _lock:
+            if _entries.pop(key, None) is not None:
+                _total_bytes -= entry[1]
+        return None
+    return path
+
+
+def put(key: str, suffix: str, producer) -> Path | None:
+    """producer(tmp_path) で書いたファイルをキャッシュに入れる。上限を超えたら古いものから追い出す。"""
+    global _total_bytes
+    path = _path_for(key, suffix)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        producer(tmp)
+        size = tmp.stat().st_size
+        if size > MAX_BYTES:
+            tmp.unlink(missing_ok=True)
+            return None
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+        raise
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= old[1]
+        _entries[key] = (path, size)
+        _total_bytes += size
+        _evict_locked()
+    return path
+
+
+def stats() -> dict[str, int]:
+    with _lock:
+        return dict(_stats, entries=len(_entries), bytes=_total_bytes, max_bytes=MAX_BYTES)
+
+
+# --- デコード済み PCM（48kHz / 16bit / stereo の生データ。再生時に FFmpeg を起動しなくて済む） ---
+
+
+def pcm_key(source_path: str) -> str | None:
+    """元ファイルのパス・サイズ・更新時刻からキーを作る。元ファイルが無ければ None。"""
+    try:
+        st = os.stat(source_path)
+    except OSError:
+        return None
+    raw = f"pcm:{os.path.abspath(source_path)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def lookup_pcm(source_path: str) -> Path | None:
+    key = pcm_key(source_path)
+    return lookup(key) if key else None
+
+
+def has_pcm(source_path: str) -> bool:
+    """デコード済み PCM がキャッシュにあるか。lookup_pcm と違ってヒット・ミスにも最近使った扱いにも数えない（先読みの判定用）。"""
+    key = pcm_key(source_path)
+    if key is None:
+        return False
+    with _lock:
+        return key in _entries
+
+
+def render_pcm(source_path: str) -> Path | None:
+    """FFmpeg で PCM にデコードしてキャッシュに入れる。既にあればそれを返す。"""
+    key = pcm_key(source_path)
+    if key is None:
+        return None
+    with _lock:
+        entry = _entries.get(key)
+    if entry is not None:
+        return entry[0]
+
+    def produce(tmp: Path) -> None:
+        subprocess.run(
+            [FFMPEG, "-nostdin", "-loglevel", "error", "-y", "-i", source_path,
+             "-f", "s16le", "-ar", "48000", "-ac", "2", str(tmp)],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=RENDER_TIMEOUT_SEC,
+        )
+
+    try:
+        path = put(key, ".pcm", produce)
+    except (OSError, subprocess.SubprocessError) as e:
+        with _lock:
+            _stats["render_failures"] += 1
+        logger.warning("[artifact_cache] render_pcm failed %s: %s", source_path, e)
+        return None
+    with _lock:
+        _stats["renders"] += 1
+    return path
@@ -0,0 +1,279 @@
+# coding: utf-8
+"""
+共有の再生スケジューラ（実験的）: すべての VC のフレーム送出を少数のスレッドと 20 ms 刻みのタイマーホイールで回す。
+discord.py の AudioPlayer / VoiceClient の内部（_end / _resumed / _player など）に依存するので、今は bench/audio_pacing.py の
+--engine shared からだけ使い、Cog の再生は discord.py の vc.play のまま。スレッド数とコンテキストスイッチは減るが、
+1 コアあたりのセッション数の上限とジッタで thread を上回る計測が取れていない（README「音声フレームのペース・ジッタ」）。
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+from discord.enums import SpeakingState
+from discord.player import AudioPlayer
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("thread", "shared")
+# スケジューラスレッドの数（セッションは受け持ちの少ないスレッドに割り振る）。Cog の音源は PCM なので
+# 送出のたびにスケジューラスレッドで Opus エンコードが走る（1 フレーム約 0.2 ms）。libopus の呼び出し中は GIL を離すので、
+# 既定は CPU 数だけ立ててエンコードをコアに分散する。1 スレッドで捌けるのはエンコード込みでおよそ 80 セッション
+THREADS = max(1, int(os.environ.get("AUDIO_SCHEDULER_THREADS", "0")) or os.cpu_count() or 1)
+# 1 フレーム目の先読みと、after / cleanup を動かすスレッドの数（FFmpeg の起動・終了待ちでスケジューラを止めないため）
+IO_WORKERS = max(1, int(os.environ.get("AUDIO_SCHEDULER_IO_WORKERS", "4")))
+FRAME = AudioPlayer.DELAY  # 0.02 s
+# ホイールの枠数（1 枠 = 1 フレーム）。予定は最大でも数枠先にしか入れないので 1 周 1.28 秒で足りる
+WHEEL_SLOTS = 64
+# VC が切れている間の再接続確認の間隔（枠数）
+RECONNECT_POLL_TICKS = 5
+
+
+class ScheduledPlayer(AudioPlayer):
+    """
+    discord.py の AudioPlayer と同じ状態（_end / _resumed）と after の呼び方を持つが、自分のスレッドは持たない。
+    VoiceClient の is_playing / stop / pause / resume はこのオブジェクトにそのまま委譲される。
+    """
+
+    def __init__(self, source: discord.AudioSource, client: discord.VoiceClient, *, after, shard: "_Shard"):
+        super().__init__(source, client, after=after)
+        self.name = f"audio-scheduled:{id(self):#x}"
+        self._shard = shard
+        # スケジューラの外で先読みした 1 フレーム目
+        self._pending: bytes | None = None
+        # 切断中に再接続を待つ期限（perf_counter）
+        self._reconnect_deadline: float | None = None
+        # pause 中でホイールから外れている
+        self._parked = False
+        self._done = threading.Event()
+
+    def start(self) -> None:
+        """Thread.start の代わり。1 フレーム目を I/O スレッドで読んでからスケジューラに載せる。"""
+        self._speak(SpeakingState.voice)
+        self._shard.attach(self)
+        _io().submit(self._prime)
+
+    def _prime(self) -> None:
+        try:
+            self._pending = self.source.read()
+        except Exception as exc:
+            self._current_error = exc
+            self._end.set()
+        self._shard.add(self)
+
+    def stop(self) -> None:
+        super().stop()
+        self._shard.wake(self)
+
+    def resume(self, *, update_speaking: bool = True) -> None:
+        super().resume(update_speaking=update_speaking)
+        self._shard.wake(self)
+
+    def is_alive(self) -> bool:
+        return not self._done.is_set()
+
+    def join(self, timeout: float | None = None) -> None:
+        self._done.wait(timeout)
+
+
+class _Shard(threading.Thread):
+    """
+    1 本のスケジューラスレッド。tick k は epoch + k * 20 ms の送出時刻で、ホイールの k % WHEEL_SLOTS 枠に
+    その tick で送るプレイヤーを積む。tick ごとに 1 回だけ起きて、その枠のプレイヤーを 1 フレームずつ進める。
+    処理が遅れたときは AudioPlayer と同じく、追いつくまで待たずに続けて送る。
+    """
+
+    def __init__(self, index: int):
+        super().__init__(daemon=True, name=f"audio-scheduler:{index}")
+        self._wheel: list[list[tuple[int, ScheduledPlayer]]] = [[] for _ in range(WHEEL_SLOTS)]
+        self._lock = threading.Lock()
+        self._incoming: list[ScheduledPlayer] = []
+        self._wakeup = threading.Event()
+        self._epoch = time.perf_counter()
+        self._tick = 0
+        # ホイールに載っている数（pause で外れているものは含まない）
+        self._scheduled = 0
+        self.sessions = 0
+        self.frames = 0
+        self.ticks = 0
+        self.late_ticks = 0
+        self.max_lag_ms = 0.0
+        self.busy_sec = 0.0
+
+    # --- 他スレッドから呼ばれる ---
+
+    def attach(self, player: ScheduledPlayer) -> None:
+        with self._lock:
+            self.sessions += 1
+
+    def add(self, player: ScheduledPlayer) -> None:
+        with self._lock:
+            self._incoming.append(player)
+        self._wakeup.set()
+
+    def wake(self, player: ScheduledPlayer) -> None:
+        """pause で外れていたプレイヤーをホイールに戻す（resume / stop 時）。"""
+        with self._lock:
+            if not player._parked:
+                return
+            player._parked = False
+            self._incoming.append(player)
+        self._wakeup.set()
+
+    # --- スケジューラスレッド ---
+
+    def run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            self._drain()
+            if self._scheduled == 0:
+                self._wakeup.wait()
+                continue
+            now = time.perf_counter()
+            due_at = self._epoch + self._tick * FRAME
+            if due_at > now:
+                time.sleep(due_at - now)
+                continue
+            lag_ms = (now - due_at) * 1000
+            self.ticks += 1
+            if lag_ms > FRAME * 1000:
+                self.late_ticks += 1
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+            self._run_tick(self._tick)
+            self.busy_sec += time.perf_counter() - now
+            self._tick += 1
+
+    def _drain(self) -> None:
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+        if not incoming:
+            return
+        if self._scheduled == 0:
+            # 空いていた間の tick は飛ばす
+            self._tick = max(self._tick, int((time.perf_counter() - self._epoch) / FRAME))
+        for player in incoming:
+            # 送出時刻を tick に揃える（loops は AudioPlayer と同じく開始からのフレーム数）
+            player.loops = 0
+            player._start = self._epoch + self._tick * FRAME
+            self._schedule(self._tick, player)
+
+    def _schedule(self, tick: int, player: ScheduledPlayer) -> None:
+        self._wheel[tick % WHEEL_SLOTS].append((tick, player))
+        self._scheduled += 1
+
+    def _run_tick(self, tick: int) -> None:
+        slot = self._wheel[tick % WHEEL_SLOTS]
+        due = [p for t, p in slot if t <= tick]
+        if len(due) != len(slot):
+            slot[:] = [(t, p) for t, p in slot if t > tick]
+        else:
+            slot.clear()
+        self._scheduled -= len(due)
+        for player in due:
+            try:
+                next_tick = self._step(player, tick)
+            except Exception as exc:
+                player._current_error = exc
+                player.stop()
+                self._finish(player, silence=False)
+                continue
+            if next_tick is not None:
+                self._schedule(next_tick, player)
+
+    def _step(self, player: ScheduledPlayer, tick: int) -> int | None:
+        """1 フレーム進める。次に処理する tick を返す（None ならホイールから外れた）。AudioPlayer._do_run の 1 周分。"""
+        if player._end.is_set():
+            self._finish(player, silence=player.client.is_connected())
+            return None
+        if not player._resumed.is_set():
+            player.send_silence()
+            with self._lock:
+                if not player._resumed.is_set() and not player._end.is_set():
+                    player._parked = True
+                    return None
+            return tick + 1
+
+        client = player.client
+        if not client.is_connected():
+            # AudioPlayer は wait_until_connected で待つが、ここでは止まらずに数枠ごとに確認する
+            now = time.perf_counter()
+            if player._reconnect_deadline is None:
+                player._reconnect_deadline = now + client.timeout
+            elif now >= player._reconnect_deadline:
+                logger.debug("[audio] not connected for %ss, aborting playback", client.timeout)
+                player._end.set()
+                self._finish(player, silence=False)
+                return None
+            return tick + RECONNECT_POLL_TICKS
+        if player._reconnect_deadline is not None:
+            player._reconnect_deadline = None
+            player._speak(SpeakingState.voice)
+            player.loops = 0
+            player._start = self._epoch + tick * FRAME
+
+        data, player._pending = player._pending, None
+        if data is None:
+            data = player.source.read()
+        if not data:
+            if player._current_error is None:
+                source_error = getattr(player.source, "_current_error", None)
+                if source_error:
+                    player._current_error = source_error
+            player.stop()
+            self._finish(player, silence=client.is_connected())
+            return None
+        client.send_audio_packet(data, encode=not player.source.is_opus())
+        player.loops += 1
+        self.frames += 1
+        return tick + 1
+
+    def _finish(self, player: ScheduledPlayer, *, silence: bool) -> None:
+        if silence:
+            player.send_silence()
+        with self._lock:
+            self.sessions -= 1
+        _io().submit(_finalize, player)
+
+
+def _finalize(player: ScheduledPlayer) -> None:
+    # AudioPlayer.run の finally と同じ順序
+    try:
+        player._call_after()
+    finally:
+        try:
+            player.source.cleanup()
+        finally:
+            player._done.set()
+
+
+_shards: list[_Shard] = []
+_shards_lock = threading.Lock()
+_io_pool: ThreadPoolExecutor | None = None
+
+
+def _io() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        with _shards_lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="audio-io")
+    return _io_pool
+
+
+def _pick_shard() -> _Shard:
+    with _shards_lock:
+        if not _shards:
+            for i in range(THREADS):
+                shard = _Shard(i)
+                shard.start()
+                _shards.append(shard)
+        return min(_shards, key=lambda s: s.sessions)
+
+
+def create_player(client, source: discord.AudioSource, *, after=None) -> ScheduledPlayer:
+    """受け持ちの少ないスケジューラスレッドに割り当てたプレイヤー（start() で再生が始まる）。"""
+    return ScheduledPlayer(source, client, after=after, shard=_pick_shard())
@@ -0,0 +1,352 @@
+# coding: utf-8
+"""
+音声フレーム送出のペース・ジッタ計測ベンチマーク。
+
+discord.py 本物の AudioPlayer スレッド（--engine shared なら audio_scheduler の共有スケジューラ）を、
+UDP を送らない偽の VoiceClient に対して多数同時に回し、セッション数ごとに以下を計測する。
+
+・フレーム生成時間（source.read() 1 回あたり）
+・20 ms デッドライン超過（予定送出時刻からの遅れが許容値を超えたフレーム）
+・フレーム間隔のジッタ（20 ms からのずれ）
+・ストリームあたりの CPU 時間（プレイヤースレッド + FFmpeg 子プロセス）
+・スレッド数とコンテキストスイッチの回数
+
+使い方（リポジトリ直下で）:
+    python -m bench.audio_pacing --sessions 1,8,32,64,128 --duration 10
+    python -m bench.audio_pacing --source cog --file sounds/atsumori_std.wav --json bench_output.json
+    python -m bench.audio_pacing --engine shared --sessions 64,256,512 --source pcm
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+import discord
+from discord import opus
+from discord.player import OPUS_SILENCE, AudioPlayer
+
+import artifact_cache
+import audio_scheduler
+import voice
+
+FRAME_DELAY = opus.Encoder.FRAME_LENGTH / 1000.0  # 0.02 s
+SAMPLE_RATE = opus.Encoder.SAMPLING_RATE
+CHANNELS = opus.Encoder.CHANNELS
+
+
+# --- 計測用の偽 VoiceClient ---
+
+
+class _FakeVoiceWebSocket:
+    async def speak(self, state) -> None:
+        pass
+
+
+class _StreamStats:
+    """1 セッション分の計測値。AudioPlayer スレッドからのみ更新される。"""
+
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self.frames = 0
+        self.misses = 0
+        self.first_at: float | None = None
+        self.last_at: float | None = None
+        self.intervals: list[float] = []
+        self.read_times: list[float] = []
+        self.cpu_start: float | None = None
+        self.cpu_end: float | None = None
+
+    def on_packet(self, now: float) -> None:
+        # AudioPlayer は 1 フレーム目の直後だけ 2 フレーム分待つので、2 フレーム目を基準時刻にする
+        if self.frames == 0:
+            self.cpu_start = time.thread_time()
+        elif self.frames == 1:
+            self.first_at = now
+        else:
+            self.intervals.append(now - self.last_at)
+            lateness = now - (self.first_at + (self.frames - 1) * FRAME_DELAY)
+            if lateness > self.tolerance:
+                self.misses += 1
+        self.frames += 1
+        self.last_at = now
+        self.cpu_end = time.thread_time()
+
+
+class FakeVoiceClient:
+    """AudioPlayer が参照する属性だけを持つ VoiceClient 互換。パケットは送らず時刻だけ記録する。"""
+
+    timeout = 1.0
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, stats: _StreamStats, encode: bool):
+        self.ws = _FakeVoiceWebSocket()
+        self.client = SimpleNamespace(loop=loop)
+        self.encoder = opus.Encoder() if encode else None
+        self.stats = stats
+
+    def is_connected(self) -> bool:
+        return True
+
+    def wait_until_connected(self, timeout: float | None = None) -> bool:
+        return True
+
+    def send_audio_packet(self, data: bytes, *, encode: bool = True) -> None:
+        if data == OPUS_SILENCE:
+            # 停止時に連続送出される無音フレームはペース計測の対象外
+            return
+        if encode and self.encoder is not None:
+            self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+        self.stats.on_packet(time.perf_counter())
+
+
+class _TimedLoopingSource(discord.AudioSource):
+    """read() の所要時間を計測し、duration 秒経つまで元のソースを作り直して繰り返す。"""
+
+    def __init__(self, factory, duration: float, stats: _StreamStats):
+        self._factory = factory
+        self._stats = stats
+        self._deadline = time.perf_counter() + duration
+        self._source = factory()
+
+    def read(self) -> bytes:
+        t0 = time.perf_counter()
+        data = self._source.read()
+        if not data and t0 < self._deadline:
+            self._source.cleanup()
+            self._source = self._factory()
+            data = self._source.read()
+        self._stats.read_times.append(time.perf_counter() - t0)
+        if t0 >= self._deadline:
+            return b""
+        return data
+
+    def is_opus(self) -> bool:
+        return self._source.is_opus()
+
+    def cleanup(self) -> None:
+        self._source.cleanup()
+
+
+# --- 入力音源 ---
+
+
+def _write_sine_wav(path: str, seconds: float) -> None:
+    n = int(SAMPLE_RATE * seconds)
+    frames = bytearray()
+    for i in range(n):
+        v = int(8000 * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE))
+        sample = v.to_bytes(2, "little", signed=True)
+        frames += sample * CHANNELS
+    with wave.open(path, "wb") as w:
+        w.setnchannels(CHANNELS)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(bytes(frames))
+
+
+def _wav_to_raw_pcm(wav_path: str, raw_path: str) -> None:
+    with wave.open(wav_path, "rb") as w:
+        if (w.getnchannels(), w.getsampwidth(), w.getframerate()) != (CHANNELS, 2, SAMPLE_RATE):
+            raise SystemExit("--source pcm には 48kHz / 16bit / stereo の wav を指定してください")
+        data = w.readframes(w.getnframes())
+    with open(raw_path, "wb") as f:
+        f.write(data)
+
+
+def _source_factory(kind: str, wav_path: str, raw_path: str):
+    if kind in ("cog", "cog-cached"):
+        return lambda: voice.make_audio_source(wav_path)
+    if kind == "ffmpeg":
+        return lambda: discord.FFmpegPCMAudio(wav_path, stderr=False)
+    if kind == "pcm":
+        return lambda: discord.PCMAudio(open(raw_path, "rb"))
+    raise SystemExit(f"unknown source: {kind}")
+
+
+# --- 計測本体 ---
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+async def _run_level(sessions: int, factory, duration: float, tolerance: float, encode: bool, engine: str) -> dict:
+    loop = asyncio.get_running_loop()
+    done = asyncio.Event()
+    remaining = sessions
+    lock = threading.Lock()
+    errors: list[str] = []
+
+    def after(err):
+        nonlocal remaining
+        if err:
+            errors.append(repr(err))
+        with lock:
+            remaining -= 1
+            if remaining == 0:
+                loop.call_soon_threadsafe(done.set)
+
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+
+    all_stats = []
+    players = []
+    for _ in range(sessions):
+        stats = _StreamStats(tolerance)
+        client = FakeVoiceClient(loop, stats, encode)
+        source = _TimedLoopingSource(factory, duration, stats)
+        if engine == "shared":
+            players.append(audio_scheduler.create_player(client, source, after=after))
+        else:
+            players.append(AudioPlayer(source, client, after=after))
+        all_stats.append(stats)
+    for p in players:
+        p.start()
+    threads = threading.active_count()
+    await done.wait()
+
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    ctx_switches = (self_after.ru_nvcsw + self_after.ru_nivcsw) - (self_before.ru_nvcsw + self_before.ru_nivcsw)
+    child_cpu = (children_after.ru_utime + children_after.ru_stime) - (
+        children_before.ru_utime + children_before.ru_stime
+    )
+
+    frames = sum(s.frames for s in all_stats)
+    misses = sum(s.misses for s in all_stats)
+    intervals = [x for s in all_stats for x in s.intervals]
+    reads = [x for s in all_stats for x in s.read_times]
+    jitter = [abs(x - FRAME_DELAY) for x in intervals]
+    if engine == "shared":
+        # スケジューラスレッドは全ストリームで共有なので、プロセス全体の CPU 時間を頭割りにする
+        thread_cpu = [cpu / sessions]
+    else:
+        thread_cpu = [
+            (s.cpu_end - s.cpu_start) for s in all_stats if s.cpu_start is not None and s.cpu_end is not None
+        ]
+    return {
+        "sessions": sessions,
+        "wall_s": round(wall, 3),
+        "frames": frames,
+        "deadline_misses": misses,
+        "miss_rate": round(misses / frames, 5) if frames else 1.0,
+        "read_ms_p50": round(_percentile(reads, 50) * 1000, 3),
+        "read_ms_p99": round(_percentile(reads, 99) * 1000, 3),
+        "read_ms_max": round(max(reads, default=0.0) * 1000, 3),
+        "jitter_ms_mean": round((sum(jitter) / len(jitter) if jitter else 0.0) * 1000, 3),
+        "jitter_ms_p99": round(_percentile(jitter, 99) * 1000, 3),
+        "interval_ms_max": round(max(intervals, default=0.0) * 1000, 3),
+        "cpu_ms_per_stream_s": round(
+            (sum(thread_cpu) / len(thread_cpu) if thread_cpu else 0.0) / max(duration, 1e-9) * 1000, 3
+        ),
+        "ffmpeg_cpu_ms_per_stream_s": round(child_cpu / sessions / max(duration, 1e-9) * 1000, 3),
+        "process_cpu_pct": round(cpu / wall * 100, 1) if wall else 0.0,
+        "threads": threads,
+        "ctx_switches_per_s": round(ctx_switches / wall) if wall else 0,
+        "errors": errors[:5],
+    }
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sessions", default="1,4,16,32,64,128", help="同時セッション数（カンマ区切りで段階的に増やす）")
+    p.add_argument("--duration", type=float, default=5.0, help="各段階で再生する秒数")
+    p.add_argument("--source", default="cog", choices=("cog", "cog-cached", "ffmpeg", "pcm"), help="計測する AudioSource の種類")
+    p.add_argument("--file", help="再生する wav（省略時は 48kHz stereo のサイン波を生成）")
+    p.add_argument("--tolerance-ms", type=float, default=20.0, help="予定送出時刻からの遅れがこれを超えたらデッドライン超過")
+    p.add_argument("--max-miss-rate", type=float, default=0.01, help="これを超えた段階を「劣化」とみなす")
+    p.add_argument("--max-jitter-ms", type=float, default=10.0, help="p99 ジッタがこれを超えた段階を「劣化」とみなす")
+    p.add_argument("--engine", default="thread", choices=audio_scheduler.ENGINES, help="thread: セッションごとの AudioPlayer、shared: 共有スケジューラ")
+    p.add_argument("--no-encode", action="store_true", help="Opus エンコードを省く（libopus が無い環境では自動で省略）")
+    p.add_argument("--opus-lib", help="読み込む libopus のパス（システムの libopus が見つからないとき）")
+    p.add_argument("--json", dest="json_path", help="結果を JSON で書き出すパス")
+    return p.parse_args(argv)
+
+
+async def _main(args: argparse.Namespace) -> int:
+    encode = not args.no_encode
+    if encode and args.opus_lib:
+        opus.load_opus(args.opus_lib)
+    if encode:
+        try:
+            opus.Encoder()
+        except opus.OpusNotLoaded:
+            print("libopus が見つからないため Opus エンコードを省略します", file=sys.stderr)
+            encode = False
+    if args.source in ("cog", "cog-cached", "ffmpeg") and not shutil.which("ffmpeg"):
+        print("ffmpeg が見つかりません（--source pcm なら ffmpeg なしで計測できます）", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="audio_pacing_") as tmp:
+        wav_path = args.file or os.path.join(tmp, "sine.wav")
+        if not args.file:
+            _write_sine_wav(wav_path, 2.0)
+        raw_path = os.path.join(tmp, "source.pcm")
+        if args.source == "pcm":
+            _wav_to_raw_pcm(wav_path, raw_path)
+        # cog はキャッシュが空の状態（FFmpeg でデコード）、cog-cached はデコード済み PCM がキャッシュにある状態
+        artifact_cache.CACHE_DIR = Path(tmp) / "cache"
+        artifact_cache.init()
+        if args.source == "cog-cached" and artifact_cache.render_pcm(wav_path) is None:
+            print("PCM へのデコードに失敗しました", file=sys.stderr)
+            return 1
+        factory = _source_factory(args.source, wav_path, raw_path)
+
+        levels = [int(x) for x in args.sessions.split(",") if x.strip()]
+        results = []
+        sustainable = 0
+        print(
+            f"{'sessions':>8} {'miss%':>7} {'read p99':>9} {'jit mean':>9} {'jit p99':>8} "
+            f"{'gap max':>8} {'cpu/str':>8} {'ffmpeg':>8} {'proc%':>6} {'threads':>7} {'csw/s':>7}"
+        )
+        for n in levels:
+            r = await _run_level(n, factory, args.duration, args.tolerance_ms / 1000.0, encode, args.engine)
+            results.append(r)
+            print(
+                f"{n:>8} {r['miss_rate'] * 100:>6.2f}% {r['read_ms_p99']:>7.2f}ms {r['jitter_ms_mean']:>7.2f}ms "
+                f"{r['jitter_ms_p99']:>6.2f}ms {r['interval_ms_max']:>6.1f}ms {r['cpu_ms_per_stream_s']:>6.2f}ms "
+                f"{r['ffmpeg_cpu_ms_per_stream_s']:>6.2f}ms {r['process_cpu_pct']:>5.1f} {r['threads']:>7} "
+                f"{r['ctx_switches_per_s']:>7}"
+            )
+            degraded = r["miss_rate"] > args.max_miss_rate or r["jitter_ms_p99"] > args.max_jitter_ms
+            if degraded:
+                break
+            sustainable = n
+
+    print(f"\nsustainable sessions (miss<={args.max_miss_rate:.2%}, jitter p99<={args.max_jitter_ms}ms): {sustainable}")
+    if args.json_path:
+        report = {
+            "benchmark": "audio_pacing",
+            "source": args.source,
+            "engine": args.engine,
+            "encode": encode,
+            "duration_s": args.duration,
+            "tolerance_ms": args.tolerance_ms,
+            "sustainable_sessions": sustainable,
+            "levels": results,
+        }
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(_parse_args(sys.argv[1:]))))
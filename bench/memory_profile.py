@@ -0,0 +1,153 @@
+# coding: utf-8
+"""
+メモリプロファイル（MEMORY_PROFILE=default / low）ごとの RSS と起動処理時間の比較ベンチマーク。
+
+main.Bot を各プロファイルで作り、ゲートウェイから届くのと同じ形の合成ペイロードを
+discord.py の ConnectionState にそのまま流して、キャッシュに載る量と処理時間を計測する。
+プロファイルごとに別プロセスで動かすので RSS は互いに影響しない。
+
+・GUILD_CREATE: guild ごとにチャンネルと VC にいるメンバー（大規模 guild で最初に届く分）
+・起動時の chunk: chunk_guilds_at_startup が有効なプロファイルだけ、全メンバーの GUILD_MEMBERS_CHUNK
+・MESSAGE_CREATE: 指定件数（max_messages の範囲でキャッシュされる）
+
+実運用の起動時間には chunk の往復待ち（guild 数に比例）も加わるが、ここでは解析とキャッシュの分だけを測る。
+実機の値は起動時の "[memory] ..." ログ（on_ready 時点の RSS・キャッシュ件数・経過秒）で確認できる。
+
+使い方（リポジトリ直下で）:
+    python -m bench.memory_profile --guilds 200 --members 2000 --messages 5000
+    python -m bench.memory_profile --guilds 1000 --members 500 --json bench_memory.json
+"""
+
+import argparse
+import gc
+import json
+import subprocess
+import sys
+import time
+
+BOT_ID = 1
+GUILD_ID_BASE = 10**17
+USER_ID_BASE = 2 * 10**17
+
+
+def _user(uid: int) -> dict:
+    return {"id": str(uid), "username": f"user{uid % 100000}", "discriminator": "0", "global_name": None, "avatar": None}
+
+
+def _member(uid: int) -> dict:
+    return {"user": _user(uid), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False, "flags": 0}
+
+
+def _guild_payload(gid: int, members: int, in_voice: int) -> dict:
+    text_id, voice_id = gid + 1, gid + 2
+    voice_uids = [USER_ID_BASE + gid % 10**6 * 10**4 + i for i in range(in_voice)]
+    return {
+        "id": str(gid),
+        "name": f"guild{gid}",
+        "owner_id": str(USER_ID_BASE),
+        "member_count": members,
+        "large": members >= 250,
+        "channels": [
+            {"id": str(text_id), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+            {"id": str(voice_id), "type": 2, "name": "voice", "position": 1, "permission_overwrites": [], "bitrate": 64000, "user_limit": 0},
+        ],
+        "roles": [{"id": str(gid), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}],
+        "emojis": [],
+        "voice_states": [
+            {"user_id": str(uid), "channel_id": str(voice_id), "session_id": "x", "deaf": False, "mute": False,
+             "self_deaf": False, "self_mute": False, "self_video": False, "suppress": False}
+            for uid in voice_uids
+        ],
+        "members": [_member(BOT_ID)] + [_member(uid) for uid in voice_uids],
+        "threads": [],
+    }
+
+
+def _child(profile: str, guilds: int, members: int, in_voice: int, messages: int) -> dict:
+    import discord
+    from discord.member import Member
+
+    import main
+    import memory_profile
+
+    gc.collect()
+    rss0 = memory_profile.rss_bytes() or 0
+    bot = main.Bot(memory_profile_name=profile)
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=_user(BOT_ID))
+    # イベントハンドラは動かさない（ループが無いのと、計測したいのはキャッシュの分だけなので）
+    state.dispatch = lambda *args, **kwargs: None
+    t0 = time.perf_counter()
+    chunk = state._chunk_guilds and state.member_cache_flags.joined
+    for g in range(guilds):
+        gid = GUILD_ID_BASE + g * 1000
+        guild = state._add_guild_from_data(_guild_payload(gid, members, in_voice))
+        if chunk:
+            # process_chunk_requests がキャッシュに入れるのと同じ
+            base = USER_ID_BASE + g * 10**5 + 10**4
+            for i in range(members):
+                guild._add_member(Member(data=_member(base + i), guild=guild, state=state))
+    t_guilds = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    for i in range(messages):
+        gid = GUILD_ID_BASE + (i % guilds) * 1000
+        uid = USER_ID_BASE + (i % guilds) * 10**5 + 10**4 + i % max(1, members)
+        state.parse_message_create({
+            "id": str(10**18 + i), "channel_id": str(gid + 1), "guild_id": str(gid), "content": "♨️ " * 8,
+            "author": _user(uid), "member": {k: v for k, v in _member(uid).items() if k != "user"},
+            "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False, "type": 0,
+        })
+    t_messages = time.perf_counter() - t1
+    gc.collect()
+    rss1 = memory_profile.rss_bytes() or 0
+    return {
+        "profile": profile,
+        "rss_mb": rss1 / 1024 / 1024,
+        "rss_delta_mb": (rss1 - rss0) / 1024 / 1024,
+        "guild_create_sec": t_guilds,
+        "message_sec": t_messages,
+        **memory_profile.cache_counts(bot),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profiles", default="default,low")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--members", type=int, default=2000, help="guild あたりのメンバー数")
+    parser.add_argument("--in-voice", type=int, default=5, help="guild あたりの VC にいるメンバー数")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--json", help="結果を JSON で書き出すパス")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.guilds, args.members, args.in_voice, args.messages)))
+        return
+
+    results = []
+    for profile in args.profiles.split(","):
+        cmd = [
+            sys.executable, "-m", "bench.memory_profile", "--child", profile,
+            "--guilds", str(args.guilds), "--members", str(args.members),
+            "--in-voice", str(args.in_voice), "--messages", str(args.messages),
+        ]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"guilds={args.guilds} members/guild={args.members} in_voice/guild={args.in_voice} messages={args.messages}")
+    print(f"{'profile':8} {'RSS MB':>8} {'+MB':>8} {'guilds s':>9} {'msgs s':>8} {'members':>9} {'users':>9} {'messages':>9}")
+    for r in results:
+        print(
+            f"{r['profile']:8} {r['rss_mb']:8.1f} {r['rss_delta_mb']:8.1f} {r['guild_create_sec']:9.2f} "
+            f"{r['message_sec']:8.2f} {r['members']:9d} {r['users']:9d} {r['messages']:9d}"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
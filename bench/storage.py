@@ -0,0 +1,363 @@
+# coding: utf-8
+"""
+ストレージ層（reaction_db / upload_store）の本番規模マイクロベンチマーク。
+
+合成データで両方の DB を本番規模まで埋めてから（既定 50,000 guild・アップロード 500,000 件・
+リアクション紐付け 1,000,000 件）、公開関数を 1 回ずつ呼んで所要時間を計測する。
+関数は実運用と同じく呼び出しごとに接続を開くので、その分も含めた時間になる。
+
+・cold: 計測前に DB ファイルを OS のページキャッシュから落とし（posix_fadvise）、全 guild から一様に選んだキーで呼ぶ
+・warm: DB ファイルを読んでページキャッシュに載せた状態で、同じ件数を呼ぶ
+・同時アクセス: --threads の各スレッド数で同じ件数を分担して呼ぶ（書き込みは SQLite のロック待ちも含む）
+
+結果（p50 / p95 / p99 / 最大の ms と ops/s、エラー件数）と、その時点の EXPLAIN QUERY PLAN の確認結果を
+JSON で書き出せるので、問い合わせ計画や接続の扱いが変わったときの劣化を比べられる。
+
+使い方（リポジトリ直下で）:
+    python -m bench.storage --json bench_storage.json
+    python -m bench.storage --guilds 5000 --uploads 50000 --bindings 100000 --ops 500 --threads 1,4,16
+    python -m bench.storage --dir /tmp/storage_bench   # DB を残して次回は埋め直さない
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import reaction_db
+import upload_store
+
+FUNCTIONS = (
+    "is_reaction_enabled",
+    "get_reaction_upload",
+    "list_uploads",
+    "list_all_reaction_uploads",
+    "save_upload",
+    "delete_upload",
+)
+# 紐付けのキーに使う絵文字（足りない分は alias 風の ASCII キーにする）
+_EMOJI_KEYS = [chr(c) for c in range(0x1F600, 0x1F650)]
+GUILD_ID_BASE = 10**17
+CHANNEL_ID_BASE = 2 * 10**17
+# 読み込み系の計測用にアップロード名を作る規則（fill と計測で共通）
+_NAME = "sound{:05d}"
+
+
+def _guild_id(i: int) -> int:
+    return GUILD_ID_BASE + i
+
+
+def _key(j: int) -> str:
+    return _EMOJI_KEYS[j] if j < len(_EMOJI_KEYS) else f"key{j}"
+
+
+def _per_guild(total: int, guilds: int, i: int) -> int:
+    """total 件を guilds に均等に配ったときの i 番目の guild の件数。"""
+    return total // guilds + (1 if i < total % guilds else 0)
+
+
+# --- 合成データ ---
+
+
+def _fill(args: argparse.Namespace) -> dict:
+    """両方の DB を init() で最新のスキーマにしてから、1 トランザクションずつで埋める。"""
+    t0 = time.perf_counter()
+    rng = random.Random(args.seed)
+    now = int(time.time())
+    with sqlite3.connect(upload_store.DB_PATH) as c:
+        c.execute("PRAGMA synchronous = OFF")
+        blob_count = max(1, args.uploads // args.dedup)
+        blobs = [hashlib.sha256(str(b).encode()).hexdigest() for b in range(blob_count)]
+        refcount = [0] * blob_count
+        rows = []
+        for i in range(args.guilds):
+            gid = _guild_id(i)
+            for j in range(_per_guild(args.uploads, args.guilds, i)):
+                b = rng.randrange(blob_count)
+                refcount[b] += 1
+                path = str(upload_store.BLOB_DIR / blobs[b][:2] / f"{blobs[b]}.wav")
+                rows.append((gid, _NAME.format(j), path, 1000 + j, now, blobs[b]))
+        c.executemany(
+            "INSERT INTO uploads (guild_id, name, file_path, uploaded_by, uploaded_at, blob_sha) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        c.executemany(
+            "INSERT INTO blobs (sha256, ext, size, refcount, created_at) VALUES (?, 'wav', ?, ?, ?)",
+            ((blobs[b], 50_000 + b % 1000, refcount[b], now) for b in range(blob_count)),
+        )
+        rows = []
+        for i in range(args.guilds):
+            gid = _guild_id(i)
+            names = _per_guild(args.uploads, args.guilds, i)
+            if not names:
+                continue
+            for j in range(_per_guild(args.bindings, args.guilds, i)):
+                rows.append((gid, _key(j), _NAME.format(j % names)))
+        c.executemany("INSERT INTO reaction_upload (guild_id, reaction_key, upload_name) VALUES (?, ?, ?)", rows)
+        bindings = len(rows)
+    with sqlite3.connect(reaction_db.DB_PATH) as c:
+        c.execute("PRAGMA synchronous = OFF")
+        rows = []
+        for i in range(args.guilds):
+            r = rng.random()
+            if r < args.channel_ratio / 2:
+                rows.append((_guild_id(i), 0))
+            elif r < args.channel_ratio:
+                rows += [(_guild_id(i), CHANNEL_ID_BASE + i * 10 + k) for k in range(rng.randint(1, 5))]
+        c.executemany("INSERT INTO reaction_channel (guild_id, channel_id) VALUES (?, ?)", rows)
+        channels = len(rows)
+    for path in (upload_store.DB_PATH, reaction_db.DB_PATH):
+        with sqlite3.connect(path) as c:
+            c.execute("ANALYZE")
+    return {"fill_sec": round(time.perf_counter() - t0, 2), "bindings": bindings, "channel_rows": channels}
+
+
+def _scale() -> dict:
+    with sqlite3.connect(upload_store.DB_PATH) as c:
+        uploads, guilds = c.execute("SELECT COUNT(*), COUNT(DISTINCT guild_id) FROM uploads").fetchone()
+        bindings = c.execute("SELECT COUNT(*) FROM reaction_upload").fetchone()[0]
+        blobs = c.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+    with sqlite3.connect(reaction_db.DB_PATH) as c:
+        channels = c.execute("SELECT COUNT(*) FROM reaction_channel").fetchone()[0]
+    return {
+        "guilds": guilds,
+        "uploads": uploads,
+        "bindings": bindings,
+        "blobs": blobs,
+        "channel_rows": channels,
+        "uploads_db_mb": round(os.path.getsize(upload_store.DB_PATH) / 1024 / 1024, 1),
+        "reaction_db_mb": round(os.path.getsize(reaction_db.DB_PATH) / 1024 / 1024, 1),
+    }
+
+
+# --- ページキャッシュ ---
+
+
+def _drop_page_cache(path: Path) -> bool:
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return True
+
+
+def _warm_page_cache(path: Path) -> None:
+    with open(path, "rb") as f:
+        while f.read(1024 * 1024):
+            pass
+
+
+# --- 計測 ---
+
+
+class _Calls:
+    """関数ごとの呼び出し引数を作る。書き込み系は同じ行を 2 度触らないよう通し番号で払い出す。"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.guilds = args.guilds
+        self.uploads = args.uploads
+        self.bindings = args.bindings
+        self._rng = random.Random(args.seed + 1)
+        self._lock = threading.Lock()
+        self._saved = 0
+        self._deleted = 0
+
+    def _guild(self) -> int:
+        return self._rng.randrange(self.guilds)
+
+    def make(self, fn: str):
+        with self._lock:
+            i = self._guild()
+            gid = _guild_id(i)
+            if fn == "is_reaction_enabled":
+                channel_id = CHANNEL_ID_BASE + i * 10 + self._rng.randint(0, 5)
+                return lambda: reaction_db.is_reaction_enabled(gid, channel_id)
+            if fn == "get_reaction_upload":
+                key = _key(self._rng.randrange(max(1, _per_guild(self.bindings, self.guilds, i))))
+                return lambda: upload_store.get_reaction_upload(gid, key)
+            if fn == "list_uploads":
+                return lambda: upload_store.list_uploads(gid)
+            if fn == "list_all_reaction_uploads":
+                return lambda: upload_store.list_all_reaction_uploads(gid)
+            if fn == "save_upload":
+                self._saved += 1
+                n = self._saved
+                content = b"RIFF" + n.to_bytes(8, "little") + bytes(1024)
+                return lambda: upload_store.save_upload(gid, f"bench{n:07d}", content, "wav", uploaded_by=1)
+            if fn == "delete_upload":
+                # 埋めたアップロードを guild を巡回しながら古い番号から消す
+                k = self._deleted
+                self._deleted += 1
+                i = k % self.guilds
+                return lambda: upload_store.delete_upload(_guild_id(i), _NAME.format(k // self.guilds))
+        raise ValueError(fn)
+
+
+def _percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def _run(calls: list, threads: int) -> tuple[list[float], list[str], float]:
+    times: list[float] = []
+    errors: list[str] = []
+    lock = threading.Lock()
+
+    def one(call) -> None:
+        t = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        elapsed = time.perf_counter() - t
+        with lock:
+            times.append(elapsed)
+
+    wall = time.perf_counter()
+    if threads <= 1:
+        for call in calls:
+            one(call)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, calls))
+    return times, errors, time.perf_counter() - wall
+
+
+def _measure(fn: str, mode: str, threads: int, ops: int, maker: _Calls) -> dict:
+    db_paths = [reaction_db.DB_PATH] if fn == "is_reaction_enabled" else [upload_store.DB_PATH]
+    calls = [maker.make(fn) for _ in range(ops)]
+    dropped = True
+    for path in db_paths:
+        if mode == "cold":
+            dropped = _drop_page_cache(path) and dropped
+        else:
+            _warm_page_cache(path)
+    times, errors, wall = _run(calls, threads)
+    return {
+        "function": fn,
+        "mode": mode if dropped else "cold-unsupported",
+        "threads": threads,
+        "ops": len(times),
+        "ops_per_s": round(len(times) / wall, 1) if wall else 0.0,
+        "p50_ms": round(_percentile(times, 50) * 1000, 3),
+        "p95_ms": round(_percentile(times, 95) * 1000, 3),
+        "p99_ms": round(_percentile(times, 99) * 1000, 3),
+        "max_ms": round(max(times, default=0.0) * 1000, 3),
+        "errors": len(errors),
+        "error_samples": errors[:3],
+    }
+
+
+def _query_plans() -> list[dict]:
+    plans = [("upload_store", r) for r in upload_store.check_query_plans()]
+    plans += [("reaction_db", r) for r in reaction_db.check_query_plans()]
+    return [{"db": db, "query": label, "ok": ok, "plan": detail} for db, (label, ok, detail) in plans]
+
+
+def _parse_args(argv: list[str]) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--guilds", type=int, default=50_000)
+    p.add_argument("--uploads", type=int, default=500_000, help="アップロードの総数（guild に均等に配る）")
+    p.add_argument("--bindings", type=int, default=1_000_000, help="リアクション紐付けの総数（guild に均等に配る）")
+    p.add_argument("--dedup", type=int, default=4, help="同じ内容（blob）を共有するアップロードの平均数")
+    p.add_argument("--channel-ratio", type=float, default=0.2, help="リアクションのチャンネル設定を持つ guild の割合（半分は全 OFF）")
+    p.add_argument("--ops", type=int, default=2000, help="関数・条件ごとの呼び出し回数")
+    p.add_argument("--threads", default="1,8", help="同時に呼ぶスレッド数（カンマ区切り）")
+    p.add_argument("--functions", default=",".join(FUNCTIONS), help="計測する関数（カンマ区切り）")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--dir", help="DB を置くディレクトリ（省略時は一時ディレクトリで、終わったら消す）。既に埋まっていれば埋め直さない")
+    p.add_argument("--json", dest="json_path", help="結果を JSON で書き出すパス")
+    return p.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    functions = [f for f in args.functions.split(",") if f]
+    unknown = set(functions) - set(FUNCTIONS)
+    if unknown:
+        print(f"unknown function: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 1
+    levels = [int(x) for x in args.threads.split(",") if x.strip()]
+    passes = 2 * len(levels) * args.ops
+    if "delete_upload" in functions and passes > args.uploads:
+        print(f"delete_upload には --uploads が {passes} 件以上必要です", file=sys.stderr)
+        return 1
+
+    tmp = None if args.dir else tempfile.mkdtemp(prefix="storage_bench_")
+    base = Path(args.dir or tmp)
+    base.mkdir(parents=True, exist_ok=True)
+    upload_store.DB_PATH = base / "uploads.db"
+    upload_store.UPLOAD_DIR = base / "uploads"
+    upload_store.BLOB_DIR = base / "blobs"
+    reaction_db.DB_PATH = base / "reaction_settings.db"
+    # 容量上限の確認（guild の集計）も save_upload の一部として計測する。合成データで上限に当たらないようにだけする
+    upload_store.QUOTA_FILES = 0
+    try:
+        upload_store.init()
+        reaction_db.init()
+        with sqlite3.connect(upload_store.DB_PATH) as c:
+            filled = c.execute("SELECT EXISTS (SELECT 1 FROM uploads)").fetchone()[0]
+        fill = {"fill_sec": 0.0, "reused": True} if filled else _fill(args)
+        scale = _scale()
+        print(
+            f"guilds={scale['guilds']} uploads={scale['uploads']} bindings={scale['bindings']} "
+            f"blobs={scale['blobs']} channel_rows={scale['channel_rows']} "
+            f"(uploads.db {scale['uploads_db_mb']} MB, fill {fill['fill_sec']}s)"
+        )
+        plans = _query_plans()
+        for p in plans:
+            if not p["ok"]:
+                print(f"full scan: {p['db']} {p['query']}: {p['plan']}", file=sys.stderr)
+
+        maker = _Calls(args)
+        results = []
+        print(f"{'function':26} {'mode':5} {'thr':>3} {'ops/s':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err':>4}")
+        for fn in functions:
+            for threads in levels:
+                for mode in ("cold", "warm"):
+                    r = _measure(fn, mode, threads, args.ops, maker)
+                    results.append(r)
+                    print(
+                        f"{fn:26} {r['mode'][:5]:5} {threads:>3} {r['ops_per_s']:>9.1f} {r['p50_ms']:>6.3f}ms "
+                        f"{r['p95_ms']:>6.3f}ms {r['p99_ms']:>6.3f}ms {r['max_ms']:>6.2f}ms {r['errors']:>4}"
+                    )
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.json_path:
+        report = {
+            "benchmark": "storage",
+            "params": {k: v for k, v in vars(args).items() if k != "json_path"},
+            "scale": scale,
+            "fill": fill,
+            "query_plans": plans,
+            "results": results,
+        }
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
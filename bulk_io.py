@@ -0,0 +1,246 @@
+# coding: utf-8
+"""アップロード音声の一括取り込み・書き出し（zip またはディレクトリ + manifest.json）"""
+
+import itertools
+import json
+import logging
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import artifact_cache
+import upload_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# エントリを blob に流し込むときの 1 回の読み込み量。メモリに載るのはスレッドごとにこの大きさだけ
+CHUNK_BYTES = 256 * 1024
+# 展開・検証・ハッシュ・blob 書き込み（prerender=True なら PCM デコードも）を並行に回すスレッド数
+WORKERS = int(os.environ.get("BULK_IO_WORKERS", str(min(8, (os.cpu_count() or 2) * 2))))
+
+
+def _looks_like_audio(head: bytes, ext: str) -> bool:
+    """ヘッダだけで拡張子どおりの形式か判定する（中身のデコードは PCM 化のときに FFmpeg が行う）。"""
+    if ext == "wav":
+        return head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+    if ext == "mp3":
+        return head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+    return False
+
+
+class _Source:
+    """zip とディレクトリを同じ形で扱う: entries() で (エントリ名, サイズ) を列挙し、chunks() / read() で中身を読む。"""
+
+    def __init__(self, path: Path):
+        if not path.exists():
+            raise FileNotFoundError(f"{path} がありません")
+        self.path = path
+        self._zip = zipfile.ZipFile(path) if path.is_file() else None
+
+    def close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+
+    def entries(self) -> list[tuple[str, int]]:
+        if self._zip is not None:
+            return [(i.filename, i.file_size) for i in self._zip.infolist() if not i.is_dir()]
+        out = []
+        for p in sorted(self.path.rglob("*")):
+            if p.is_file():
+                out.append((p.relative_to(self.path).as_posix(), p.stat().st_size))
+        return out
+
+    def chunks(self, entry: str, max_bytes: int):
+        """entry を CHUNK_BYTES ずつ読む。合計が max_bytes（宣言サイズ）を超える場合（zip bomb 等）は ValueError。"""
+        if self._zip is not None:
+            f = self._zip.open(entry)
+        else:
+            f = open(self.path / entry, "rb")
+        with f:
+            total = 0
+            while chunk := f.read(CHUNK_BYTES):
+                total += len(chunk)
+                if total > max_bytes:
+                    raise ValueError("大きすぎます")
+                yield chunk
+
+    def read(self, entry: str, max_bytes: int) -> bytes:
+        """entry を最大 max_bytes まで読む（manifest 用）。"""
+        return b"".join(self.chunks(entry, max_bytes))
+
+
+def _read_manifest(src: _Source, names: set[str]) -> dict:
+    if MANIFEST_NAME not in names:
+        return {}
+    try:
+        manifest = json.loads(src.read(MANIFEST_NAME, 4 * 1024 * 1024).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"{MANIFEST_NAME} を読めません: {e}") from e
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def import_archive(
+    guild_id: int,
+    path: str | Path,
+    *,
+    uploaded_by: int | None = None,
+    normalize_key=None,
+    prerender: bool = False,
+) -> dict:
+    """
+    zip またはディレクトリの音声を guild に一括登録する。manifest.json があればその名前・投稿者・紐付けを使い、
+    無ければ mp3 / wav をファイル名（拡張子を除く）で登録する。上限は宣言サイズで先に確認してから展開し、
+    展開・検証・ハッシュ・blob 書き込みはスレッドプールでエントリごとに少しずつ流し込む（全体をメモリに載せない）。
+    DB への登録は upload_store.save_uploads_bulk の 1 トランザクションで、登録されなかった新しい blob はその場で消す。
+    normalize_key は紐付けのリアクションキーを保存形式にそろえる関数（None ならそのまま）。
+    prerender=True なら取り込んだ全件を PCM にデコードしてから返す（再生キャッシュを大きく使うので、Cog は使わない）。
+    返り値: imported / names（登録した名前。紐付けのあるものが先）/ skipped（[(エントリ, 理由)]）/ missing / bindings /
+    bytes / prerendered / elapsed。
+    """
+    t0 = time.monotonic()
+    src = _Source(Path(path))
+    try:
+        entries = dict(src.entries())
+        manifest = _read_manifest(src, set(entries))
+        # (エントリ名, 登録名, 投稿者, 投稿日時)
+        wanted: list[tuple[str, str, int | None, int | None]] = []
+        skipped: list[tuple[str, str]] = []
+        if manifest.get("uploads"):
+            for u in manifest["uploads"]:
+                if not isinstance(u, dict) or "file" not in u or "name" not in u:
+                    continue
+                if u["file"] not in entries:
+                    skipped.append((str(u["file"]), "アーカイブにありません"))
+                    continue
+                wanted.append((u["file"], str(u["name"]), u.get("uploaded_by"), u.get("uploaded_at")))
+        else:
+            for entry in entries:
+                if entry == MANIFEST_NAME:
+                    continue
+                stem, _, ext = Path(entry).name.rpartition(".")
+                if ext.lower() in upload_store.ALLOWED_EXT and stem:
+                    wanted.append((entry, stem, None, None))
+                else:
+                    skipped.append((entry, "mp3 / wav ではありません"))
+
+        # 展開前に宣言サイズで上限（件数・容量。既存の分も含む）を確認する。断るときは blob を 1 つも書かない
+        upload_store.check_bulk_quota(guild_id, {name: entries[e] for e, name, _, _ in wanted})
+
+        # この取り込みで新しく書いた blob（sha256 → パス）。登録されなかったものは最後に消す
+        created: dict[str, Path] = {}
+
+        def load(item):
+            entry, name, by, at = item
+            ext = entry.rpartition(".")[2].lower()
+            if ext not in upload_store.ALLOWED_EXT:
+                return entry, None, "mp3 / wav ではありません"
+            chunks = src.chunks(entry, entries[entry])
+            try:
+                head = next(chunks, b"")
+                if not _looks_like_audio(head[:16], ext):
+                    return entry, None, f"{ext} として不正です"
+                sha, blob, size, new = upload_store.store_blob(itertools.chain((head,), chunks), ext)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                return entry, None, f"読めません: {e}"
+            finally:
+                chunks.close()
+            if new:
+                created[sha] = blob
+            return entry, (name, sha, ext, size, by, at, blob), None
+
+        try:
+            with ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="bulk_io") as pool:
+                items = []
+                blobs: dict[str, Path] = {}
+                for entry, item, reason in pool.map(load, wanted):
+                    if item is None:
+                        skipped.append((entry, reason))
+                        continue
+                    items.append(item[:6])
+                    blobs[item[1]] = item[6]
+
+                bindings = []
+                for b in manifest.get("bindings") or ():
+                    if isinstance(b, dict) and b.get("reaction_key") and b.get("upload_name"):
+                        key = str(b["reaction_key"])
+                        bindings.append((normalize_key(key) if normalize_key else key, str(b["upload_name"])))
+                result = upload_store.save_uploads_bulk(guild_id, items, bindings, uploaded_by=uploaded_by)
+
+                prerendered = 0
+                if prerender and artifact_cache.MAX_BYTES > 0:
+                    prerendered = sum(1 for p in pool.map(artifact_cache.render_pcm, map(str, blobs.values())) if p)
+        finally:
+            # 上限・DB エラーで登録されなかった分と、同名の後のエントリに置き換えられた分の blob を残さない
+            if created:
+                upload_store.discard_unreferenced_blobs(created)
+    finally:
+        src.close()
+    bound = {name for _, name in bindings}
+    report = {
+        "imported": len(result["saved"]),
+        "names": sorted(result["saved"], key=lambda n: n not in bound),
+        "skipped": skipped,
+        "missing": result["missing"],
+        "bindings": result["bindings"],
+        "bytes": sum(item[3] for item in items),
+        "prerendered": prerendered,
+        "elapsed": time.monotonic() - t0,
+    }
+    logger.info(
+        "[bulk_io] import guild_id=%s imported=%d skipped=%d bindings=%d prerendered=%d elapsed=%.2fs",
+        guild_id, report["imported"], len(skipped), report["bindings"], prerendered, report["elapsed"],
+    )
+    return report
+
+
+def export_archive(guild_id: int, dest: str | Path) -> dict:
+    """
+    guild のアップロードと紐付けを dest に書き出す。dest が .zip なら zip（無圧縮で 1 ファイルずつ流し込む）、
+    それ以外はディレクトリ。どちらも sounds/<name>.<ext> と manifest.json で、import_archive でそのまま読める。
+    返り値: files / bytes / bindings / missing（実体が見つからず飛ばした名前）。
+    """
+    dest = Path(dest)
+    uploads = upload_store.list_uploads_for_export(guild_id)
+    bindings = upload_store.list_all_reaction_uploads(guild_id)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "guild_id": guild_id,
+        "exported_at": int(time.time()),
+        "uploads": [],
+        "bindings": [{"reaction_key": k, "upload_name": n} for k, n in bindings],
+    }
+    missing: list[str] = []
+    size = 0
+    if dest.suffix.lower() == ".zip":
+        zf = zipfile.ZipFile(dest, "w", zipfile.ZIP_STORED)
+    else:
+        zf = None
+        dest.mkdir(parents=True, exist_ok=True)
+    try:
+        for name, path, by, at in uploads:
+            if not path.is_file():
+                missing.append(name)
+                continue
+            arcname = f"sounds/{name}{path.suffix.lower()}"
+            if zf is not None:
+                zf.write(path, arcname)
+            else:
+                target = dest / arcname
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(path.read_bytes())
+            size += path.stat().st_size
+            manifest["uploads"].append({"name": name, "file": arcname, "uploaded_by": by, "uploaded_at": at})
+        text = json.dumps(manifest, ensure_ascii=False, indent=2)
+        if zf is not None:
+            zf.writestr(MANIFEST_NAME, text)
+        else:
+            (dest / MANIFEST_NAME).write_text(text, encoding="utf-8")
+    finally:
+        if zf is not None:
+            zf.close()
+    logger.info("[bulk_io] export guild_id=%s files=%d bytes=%d dest=%s", guild_id, len(manifest["uploads"]), size, dest)
+    return {"files": len(manifest["uploads"]), "bytes": size, "bindings": len(bindings), "missing": missing}
@@ -0,0 +1,86 @@
+# coding: utf-8
+"""SQLite のスキーマ移行: PRAGMA user_version を版数として、未適用の手順だけを順に 1 回ずつ流す"""
+
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# (手順名, 関数)。リストの i 番目（0 始まり）を流し終えると user_version = i + 1。並べ替え・削除はしないこと
+Step = tuple[str, Callable[[sqlite3.Connection], None]]
+
+
+def _backup(conn: sqlite3.Connection, db_path: Path, version: int) -> Path:
+    """移行前の DB を <DB>.bak.v<版>.<UTC 日時> に複製する（sqlite3 のオンラインバックアップ）。"""
+    bak = db_path.with_name(f"{db_path.name}.bak.v{version}.{time.strftime('%Y%m%d%H%M%S', time.gmtime())}")
+    dst = sqlite3.connect(bak)
+    try:
+        conn.backup(dst)
+    finally:
+        dst.close()
+    return bak
+
+
+def migrate(db_path: Path, steps: list[Step], *, backup: bool = True) -> int:
+    """
+    db_path の user_version より後の手順を 1 つずつ、手順ごとに 1 トランザクションで流す（DDL も含めて失敗すれば巻き戻る）。
+    既存のテーブルがある DB に手順を流すときは、先に backup で複製を取る。返り値は移行後の版数。
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > len(steps):
+            logger.warning(
+                "[db_migrate] %s is at v%d, newer than this build (v%d); leaving schema as is", db_path.name, version, len(steps)
+            )
+            return version
+        if version == len(steps):
+            return version
+        if backup and conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1").fetchone():
+            logger.info("[db_migrate] %s backup -> %s", db_path.name, _backup(conn, db_path, version))
+        for n, (name, step) in enumerate(steps[version:], start=version + 1):
+            t0 = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {n:d}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info("[db_migrate] %s v%d %s (%.0f ms)", db_path.name, n, name, (time.perf_counter() - t0) * 1000)
+        return len(steps)
+    finally:
+        conn.close()
+
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: tuple[tuple[str, str], ...]) -> None:
+    """table に無い列だけ ALTER TABLE ADD COLUMN する（版管理より前に作られた DB を揃える用）。"""
+    have = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for col, col_type in columns:
+        if col not in have:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}")
+
+
+def check_plans(db_path: Path, queries: list[tuple[str, str, tuple | dict]]) -> list[tuple[str, bool, str]]:
+    """
+    (ラベル, SQL, パラメータ) ごとに EXPLAIN QUERY PLAN を取り、テーブルや索引の全件走査（SCAN）が無いかを見る。
+    返り値は (ラベル, 索引だけで引けているか, プランの要約)。行数が増えても遅くならないことの確認用。
+    """
+    results = []
+    conn = sqlite3.connect(db_path)
+    try:
+        for label, sql, params in queries:
+            details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            # CTE・副問い合わせの結果（CO-ROUTINE / MATERIALIZE）を読むのは、その中身が索引で絞れていれば問題ない
+            derived = {d.split()[-1] for d in details if d.startswith(("CO-ROUTINE", "MATERIALIZE"))}
+            ok = not any(
+                d.startswith("SCAN") and d != "SCAN CONSTANT ROW" and d.split()[-1] not in derived for d in details
+            )
+            results.append((label, ok, " / ".join(details)))
+    finally:
+        conn.close()
+    return results
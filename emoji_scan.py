@@ -0,0 +1,143 @@
+# coding: utf-8
+"""on_message 用の本文スキャナ: 絵文字も候補語も無い本文を安く捨て、残りを 1 回の走査でトークンに分ける"""
+
+import re
+from typing import NamedTuple
+
+# サーバー絵文字の記法 <:name:id>（アニメーションは <a:name:id>）
+_CUSTOM_RE = re.compile(r"<a?:(\w+):\d+>")
+_WORD_RE = re.compile(r"\w+")
+# Unicode 絵文字が含まれうる文字。emoji パッケージのどの絵文字も少なくとも 1 文字はこの範囲に入る
+# （キーキャップ 1️⃣ は U+20E3、異体字セレクタ U+FE0F で拾う）。上位集合なので、通したあと何も見つからないことはある
+_EMOJI_HINT_RE = re.compile(
+    "[\u00a9\u00ae\u200d\u203c\u2049\u20e3\u2122\u2139\u2194-\u2199\u21a9\u21aa\u231a-\u23ff\u24c2"
+    "\u25aa-\u25fe\u2600-\u27bf\u2934\u2935\u2b05-\u2b55\u3030\u303d\u3297\u3299\ufe0f\U0001f000-\U0001faff]"
+)
+
+
+def normalize(s: str) -> str:
+    """Variation selector (U+FE0F) を除いて比較用に正規化する。"""
+    return s.replace("\ufe0f", "")
+
+
+def first_word(s: str) -> str | None:
+    """s の最初の \\w の連なり（小文字）。s が本文に語として現れるなら、これは本文の語のどれかと一致する。"""
+    m = _WORD_RE.search(s.lower())
+    return m.group(0) if m else None
+
+
+class MessageScan(NamedTuple):
+    # 出現順の絵文字名: サーバー絵文字は name、Unicode 絵文字は emoji パッケージの英語名（コロン無し）
+    names: list[str]
+    # 出現した Unicode 絵文字（FE0F を除いたもの）を改行で連結した文字列。キーの部分一致照合用
+    emojis: str
+    # 小文字化した本文の語（\w の連なり）
+    words: frozenset[str]
+    # 小文字化して前後の空白を除いた本文（語に分けられない名前の照合用）
+    lower: str
+
+
+def scan(content: str, candidate_words: frozenset[str] = frozenset(), always: bool = False) -> MessageScan | None:
+    """
+    本文をトークンに分ける。サーバー絵文字の記法も絵文字らしい文字も無く、candidate_words のどれも
+    語として含まない本文は、emoji パッケージに渡す前に None を返す（always なら前段の判定をしない）。
+    """
+    found: list[tuple[int, str]] = [(m.start(), m.group(1)) for m in _CUSTOM_RE.finditer(content)] if "<" in content else []
+    has_emoji = not content.isascii() and _EMOJI_HINT_RE.search(content) is not None
+    if not (always or found or has_emoji or candidate_words):
+        return None
+    lower = content.lower().strip()
+    words = frozenset(_WORD_RE.findall(lower))
+    if not (always or found or has_emoji) and candidate_words.isdisjoint(words):
+        return None
+
+    emojis: list[str] = []
+    if has_emoji:
+        import emoji
+        from emoji.tokenizer import EmojiMatch, tokenize
+
+        # demojize と同じ分け方（RGI の ZWJ 並びは 1 つ、それ以外は構成要素ごと）
+        for token in tokenize(content, keep_zwj=emoji.config.demojize_keep_zwj):
+            match = token.value
+            if not isinstance(match, EmojiMatch):
+                continue
+            emojis.append(normalize(match.emoji))
+            name = match.data.get("en") if match.data else None
+            if name:
+                found.append((match.start, name[1:-1]))
+        found.sort(key=lambda x: x[0])
+    return MessageScan([name for _, name in found], "\n".join(emojis), words, lower)
+
+
+class TriggerRules:
+    """
+    guild の reaction_key → upload_name 表から作る、本文照合の規則。表が変わったら作り直す。
+    ・アップロード名が本文に語として含まれる → その名前に紐付いたキー
+    ・キーそのもの（Unicode 絵文字、または ASCII の alias・サーバー絵文字名）が本文に含まれる → そのキー
+    """
+
+    def __init__(self, table: dict[str, str], alias_to_emoji):
+        by_name: dict[str, list[str]] = {}
+        for key, name in table.items():
+            by_name.setdefault(name, []).append(key)
+        # (名前, 照合用の正規表現 or None（\w だけの名前は語の集合で引く）, 紐付いたキー) を名前順に
+        self.uploads: list[tuple[str, re.Pattern | None, list[str]]] = []
+        words: set[str] = set()
+        always = False
+        for name in sorted(by_name):
+            lower = name.lower()
+            pattern = None if _WORD_RE.fullmatch(lower) else re.compile(r"\b" + re.escape(lower) + r"\b")
+            self.uploads.append((name, pattern, sorted(by_name[name])))
+            w = first_word(lower)
+            if w is None:
+                always = True
+            else:
+                words.add(w)
+        # (キー, ASCII キーの照合用の正規表現 or None, キーを Unicode にしたもの（FE0F 除去済み、無ければ None）) を表の順に
+        self.keys: list[tuple[str, re.Pattern | None, str | None]] = []
+        for key in table:
+            if not key:
+                continue
+            if key.isascii():
+                lower = key.lower()
+                pattern = None if _WORD_RE.fullmatch(lower) else re.compile(r"\b" + re.escape(lower) + r"\b")
+                char = alias_to_emoji(key)
+                self.keys.append((key, pattern, normalize(char) if char else None))
+                w = first_word(lower)
+                if w is None:
+                    always = True
+                else:
+                    words.add(w)
+            else:
+                self.keys.append((key, None, normalize(key)))
+        self.words = frozenset(words)
+        self.always = always
+
+    def scan(self, content: str) -> MessageScan | None:
+        return scan(content, self.words, self.always)
+
+    def matched_uploads(self, s: MessageScan) -> list[tuple[str, list[str]]]:
+        """本文に語として含まれるアップロード名と、その名前に紐付いたキー（名前順）。"""
+        hits = []
+        for name, pattern, keys in self.uploads:
+            lower = name.lower()
+            if pattern is None:
+                if lower not in s.words:
+                    continue
+            elif not pattern.search(s.lower) and s.lower != lower:
+                continue
+            hits.append((name, keys))
+        return hits
+
+    def matched_keys(self, s: MessageScan) -> list[str]:
+        """本文に含まれるキー。ASCII のキーは語として、または alias を Unicode にした絵文字として探す。"""
+        hits = []
+        for key, pattern, char in self.keys:
+            if key.isascii():
+                lower = key.lower()
+                if (lower in s.words) if pattern is None else pattern.search(s.lower) is not None:
+                    hits.append(key)
+                    continue
+            if char and char in s.emojis:
+                hits.append(key)
+        return hits
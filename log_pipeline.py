@@ -0,0 +1,146 @@
+# coding: utf-8
+"""ログ出力パイプライン: QueueHandler/QueueListener による非同期出力と [op] ログの間引き"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# [op] ログのカテゴリ（"[op] play | ..." の "play"）ごとの既定レート
+OP_RATE_DEFAULT = 20.0  # 1 秒あたりに通す件数
+OP_BURST_DEFAULT = 40.0  # 瞬間的に通す上限
+QUEUE_MAX_DEFAULT = 10000
+
+
+class SuppressDiscordPlayerWriteError(logging.Filter):
+    """FFmpeg 正常終了(return code 0)直後の discord.py のレースで出る Write error をログから落とす。"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.name != "discord.player":
+            return True
+        # discord.player はフォーマット文字列側に "Write error" を持つので、整形せずに判定できる
+        msg = record.msg
+        if not isinstance(msg, str):
+            try:
+                msg = record.getMessage()
+            except Exception:
+                msg = str(record.msg)
+        if "Write error" not in msg:
+            return True
+        return False
+
+
+class OpLogSampler(logging.Filter):
+    """
+    "[op] <category> | ..." 形式のログをカテゴリ単位のトークンバケットで間引く。
+    判定はフォーマット文字列（record.msg）だけで行い、メッセージは整形しない。
+    落とした件数は次に通したレコードの末尾に [suppressed=N] として付ける。
+    """
+
+    def __init__(self, rate: float = OP_RATE_DEFAULT, burst: float = OP_BURST_DEFAULT):
+        super().__init__()
+        self._rate = rate
+        self._burst = burst
+        self._lock = threading.Lock()
+        # category -> [tokens, last_refill_at, suppressed]
+        self._buckets: dict[str, list] = {}
+        # フォーマット文字列 -> カテゴリ（None は [op] ログではない）
+        self._category_cache: dict[str, str | None] = {}
+
+    def _category(self, msg) -> str | None:
+        if not isinstance(msg, str):
+            return None
+        try:
+            return self._category_cache[msg]
+        except KeyError:
+            pass
+        category = None
+        if msg.startswith("[op] "):
+            category = msg[5:].split(" ", 1)[0]
+        if len(self._category_cache) < 4096:
+            self._category_cache[msg] = category
+        return category
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        category = self._category(record.msg)
+        if category is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(category)
+            if bucket is None:
+                bucket = self._buckets[category] = [self._burst, now, 0]
+            tokens = min(self._burst, bucket[0] + (now - bucket[1]) * self._rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [suppressed={suppressed}]"
+        return True
+
+    def stats(self) -> dict[str, int]:
+        """カテゴリごとの、まだ報告していない間引き件数。"""
+        with self._lock:
+            return {k: b[2] for k, b in self._buckets.items() if b[2]}
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler.prepare() は呼び出し側スレッドでメッセージを整形してしまうので、
+    整形は QueueListener 側のハンドラに任せてレコードをそのまま積む（同一プロセス内のキューなので pickle 不要）。
+    キューが溢れたら待たずに捨てて件数だけ数える。
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_queue_logging(
+    *,
+    level: int = logging.INFO,
+    fmt: str,
+    datefmt: str,
+    op_rate: float = OP_RATE_DEFAULT,
+    op_burst: float = OP_BURST_DEFAULT,
+    queue_max: int = QUEUE_MAX_DEFAULT,
+) -> logging.handlers.QueueListener:
+    """
+    root に QueueHandler を付け、整形と stderr への書き込みは QueueListener のスレッドで行う。
+    イベントループ側でかかるのは [op] 間引きの判定とキューへの put だけ。
+    """
+    q: queue.Queue = queue.Queue(maxsize=queue_max)
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(fmt, datefmt=datefmt))
+    stream.addFilter(SuppressDiscordPlayerWriteError())
+
+    handler = _DeferredQueueHandler(q)
+    handler.addFilter(SuppressDiscordPlayerWriteError())
+    handler.addFilter(OpLogSampler(op_rate, op_burst))
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,176 @@
+# coding: utf-8
+"""イベントループの詰まり監視（--loop-monitor / LOOP_MONITOR=1）: 遅延のヒストグラムと、詰まっている間のスタック採取"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# 心拍の間隔と、ループが止まっているとみなしてスタックを採る遅延（ms）
+INTERVAL_MS = float(os.environ.get("LOOP_MONITOR_INTERVAL_MS", "100"))
+THRESHOLD_MS = float(os.environ.get("LOOP_MONITOR_THRESHOLD_MS", "100"))
+# ヒストグラムと詰まり箇所の集計をログに出す間隔（秒）
+REPORT_INTERVAL_SEC = float(os.environ.get("LOOP_MONITOR_REPORT_SEC", "300"))
+# 遅延ヒストグラムの区間の上端（ms）。最後の区間はそれ以上すべて
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+STACK_DEPTH = 12
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.Lock()
+_histogram = [0] * (len(BUCKETS_MS) + 1)
+_max_lag_ms = 0.0
+_samples = 0
+# 詰まっていた箇所（採取したスタックの末尾フレーム）→ [回数, 最大停止 ms, スタック文字列]
+_stalls: dict[str, list] = {}
+# 監視スレッドが最後にスタックを採った心拍と箇所。止まっていた時間の全体は心拍側で分かるのでそこで補う
+_captured: tuple[float, str] = (0.0, "")
+_last_beat = 0.0
+_loop_thread_id: int | None = None
+_task: asyncio.Task | None = None
+_watchdog: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def is_requested() -> bool:
+    if "--loop-monitor" in sys.argv:
+        return True
+    return os.environ.get("LOOP_MONITOR", "").lower() in ("1", "true", "yes")
+
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+
+def _record_lag(lag_ms: float) -> None:
+    global _max_lag_ms, _samples
+    i = 0
+    while i < len(BUCKETS_MS) and lag_ms > BUCKETS_MS[i]:
+        i += 1
+    with _lock:
+        _histogram[i] += 1
+        _samples += 1
+        if lag_ms > _max_lag_ms:
+            _max_lag_ms = lag_ms
+
+
+async def _heartbeat() -> None:
+    global _last_beat
+    interval = INTERVAL_MS / 1000
+    next_report = time.monotonic() + REPORT_INTERVAL_SEC
+    while True:
+        t = time.perf_counter()
+        _last_beat = t
+        await asyncio.sleep(interval)
+        lag_ms = max(0.0, (time.perf_counter() - t - interval) * 1000)
+        _record_lag(lag_ms)
+        beat, where = _captured
+        if beat == t:
+            with _lock:
+                entry = _stalls.get(where)
+                if entry is not None and lag_ms > entry[1]:
+                    entry[1] = lag_ms
+        if time.monotonic() >= next_report:
+            next_report = time.monotonic() + REPORT_INTERVAL_SEC
+            logger.info("%s", report())
+
+
+def _watch() -> None:
+    """別スレッド: 心拍が THRESHOLD_MS 以上途切れたら、ループのスレッドのスタックを 1 回だけ採る。"""
+    global _captured
+    interval = INTERVAL_MS / 1000
+    threshold = THRESHOLD_MS / 1000
+    poll = max(0.005, min(interval, threshold) / 4)
+    captured_for = 0.0
+    while not _stop.wait(poll):
+        beat = _last_beat
+        stalled = time.perf_counter() - beat - interval
+        if beat == 0.0 or stalled < threshold or beat == captured_for:
+            continue
+        captured_for = beat
+        frame = sys._current_frames().get(_loop_thread_id)
+        if frame is None:
+            continue
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        del frame
+        # 集計のキーは、このリポジトリのコードのうち一番内側のフレーム（無ければ一番内側）
+        ours = [f for f in stack if f.filename.startswith(_REPO_DIR)]
+        top = ours[-1] if ours else (stack[-1] if stack else None)
+        where = f"{os.path.relpath(top.filename, _REPO_DIR) if ours else top.filename}:{top.lineno} {top.name}" if top else "?"
+        text = "".join(traceback.format_list(stack))
+        stalled_ms = stalled * 1000
+        with _lock:
+            entry = _stalls.get(where)
+            if entry is None:
+                _stalls[where] = [1, stalled_ms, text]
+            else:
+                entry[0] += 1
+                entry[1] = max(entry[1], stalled_ms)
+        _captured = (beat, where)
+        logger.warning("[loop_monitor] event loop blocked >= %.0f ms at %s\n%s", stalled_ms, where, text)
+
+
+def start(loop: asyncio.AbstractEventLoop | None = None) -> None:
+    """心拍タスクと監視スレッドを起動する。ループ上（setup_hook など）で呼ぶこと。"""
+    global _task, _watchdog, _loop_thread_id, _last_beat
+    if is_running():
+        return
+    loop = loop or asyncio.get_running_loop()
+    _loop_thread_id = threading.get_ident()
+    _last_beat = 0.0
+    _stop.clear()
+    _task = loop.create_task(_heartbeat(), name="loop_monitor heartbeat")
+    _watchdog = threading.Thread(target=_watch, name="loop_monitor", daemon=True)
+    _watchdog.start()
+    logger.info("[loop_monitor] started interval=%.0fms threshold=%.0fms", INTERVAL_MS, THRESHOLD_MS)
+
+
+def stop() -> None:
+    global _task
+    _stop.set()
+    if _task is not None:
+        _task.cancel()
+        _task = None
+
+
+def stats() -> dict:
+    """遅延ヒストグラム（区間の上端 ms → 回数。None は最後の区間）と詰まり箇所。"""
+    with _lock:
+        histogram = dict(zip(list(BUCKETS_MS) + [None], _histogram))
+        stalls = sorted(((w, e[0], e[1]) for w, e in _stalls.items()), key=lambda x: -x[1])
+        return {"samples": _samples, "max_lag_ms": _max_lag_ms, "histogram": histogram, "stalls": stalls}
+
+
+def _percentile(p: float) -> float | None:
+    """ヒストグラムから p 分位の区間の上端 ms を返す（最後の区間なら最大値）。"""
+    with _lock:
+        total = _samples
+        if not total:
+            return None
+        rank = p * total
+        acc = 0
+        for i, n in enumerate(_histogram):
+            acc += n
+            if acc >= rank:
+                return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else _max_lag_ms
+    return _max_lag_ms
+
+
+def report(top: int = 5) -> str:
+    s = stats()
+    p50, p99 = _percentile(0.5), _percentile(0.99)
+    lines = [
+        f"[loop_monitor] samples={s['samples']} lag p50<={p50 or 0:.0f}ms p99<={p99 or 0:.0f}ms max={s['max_lag_ms']:.1f}ms",
+        "  histogram: " + " ".join(
+            f"{'<=' + str(b) if b is not None else '>' + str(BUCKETS_MS[-1])}ms:{n}" for b, n in s["histogram"].items() if n
+        ),
+    ]
+    if s["stalls"]:
+        lines.append("  blocked at:")
+        for where, count, worst in s["stalls"][:top]:
+            lines.append(f"    {count:5d}x max {worst:7.0f} ms  {where}")
+    return "\n".join(lines)
@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
+import hashlib
+import json
 import logging
 import os
 import sys
+from pathlib import Path
 
-import discord
-from discord.ext import commands
+import startup_profile
+
+# 起動プロファイル（--profile-startup / STARTUP_PROFILE=1）は discord などの重い import より前に計測を始める
+if startup_profile.is_requested():
+    startup_profile.install()
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+import log_pipeline  # noqa: E402
+import loop_monitor  # noqa: E402
+import memory_profile  # noqa: E402
+from log_pipeline import SuppressDiscordPlayerWriteError  # noqa: E402
 
 DISCORD_TOKEN = os.environ.get('DISCORD_TOKEN')
 DEV_GUILD_ID = os.environ.get('DEV_GUILD_ID')
@@ -16,59 +30,154 @@ def _is_dev_mode() -> bool:
     return os.environ.get('DEV_MODE', '').lower() in ('1', 'true', 'yes')
 
 
-class SuppressDiscordPlayerWriteError(logging.Filter):
-    """FFmpeg 正常終了(return code 0)直後の discord.py のレースで出る Write error をログから落とす。"""
-    def filter(self, record: logging.LogRecord) -> bool:
-        if record.name != "discord.player":
-            return True
-        try:
-            msg = record.getMessage()
-        except Exception:
-            msg = str(record.msg)
-        if "Write error" not in msg:
-            return True
-        return False
+# ログキューモード: --log-queue または LOG_QUEUE=1 のとき、整形と stderr 書き込みを別スレッドで行い [op] ログを間引く
+def _is_log_queue_mode() -> bool:
+    if '--log-queue' in sys.argv:
+        return True
+    return os.environ.get('LOG_QUEUE', '').lower() in ('1', 'true', 'yes')
+
+
+# コマンド同期の強制: --force-sync または FORCE_SYNC=1 のとき、コマンドツリーが前回と同じでも同期する
+def _is_force_sync() -> bool:
+    if '--force-sync' in sys.argv:
+        return True
+    return os.environ.get('FORCE_SYNC', '').lower() in ('1', 'true', 'yes')
+
+
+# 前回同期したコマンドツリーのハッシュ。DB と同じ永続ディレクトリに置く（Docker では /app/data）
+COMMAND_SYNC_STATE_PATH = Path(os.environ.get('UPLOAD_STORE_DIR', '.')) / 'command_sync.json'
+
+
+def _load_command_sync_state() -> dict:
+    try:
+        with open(COMMAND_SYNC_STATE_PATH, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_command_sync_state(state: dict) -> None:
+    tmp = COMMAND_SYNC_STATE_PATH.with_suffix('.json.tmp')
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, COMMAND_SYNC_STATE_PATH)
+    except OSError as e:
+        logging.getLogger(__name__).warning('could not save command sync state %s: %s', COMMAND_SYNC_STATE_PATH, e)
+
+
 COMMAND_PREFIX = '$'
 
 
 class Bot(commands.Bot):
-    def __init__(self, *, dev_mode: bool = False):
+    def __init__(self, *, dev_mode: bool = False, force_sync: bool = False, memory_profile_name: str = 'default'):
         self._dev_mode = dev_mode
+        self._force_sync = force_sync
+        self._startup_reported = False
+        self.memory_profile = memory_profile_name
         intents = discord.Intents.default()
         intents.message_content = True
-        intents.members = True  # リアクションしたユーザーの VC 取得（fetch_member）に必要
-        super().__init__(command_prefix=COMMAND_PREFIX, intents=intents)
+        # 全メンバーのキャッシュ用。low ではキャッシュするのが VC にいるメンバー（音声状態のイベントで届く）だけなので要らない
+        intents.members = memory_profile_name != 'low'
+        super().__init__(
+            command_prefix=COMMAND_PREFIX,
+            intents=intents,
+            **memory_profile.client_options(memory_profile_name),
+        )
+
+    def _command_tree_fingerprint(self, guild: discord.abc.Snowflake | None) -> str:
+        """tree.sync() が送るのと同じペイロードを正規化して SHA-256 を取る。"""
+        payload = [cmd.to_dict(self.tree) for cmd in self.tree.get_commands(guild=guild)]
+        payload.sort(key=lambda d: (d.get('type', 1), d.get('name', '')))
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    async def _sync_if_changed(self, guild: discord.abc.Snowflake | None) -> bool:
+        """コマンドツリーが前回同期時から変わったときだけ同期する。同期したら True。"""
+        scope = f"{self.application_id}:{guild.id if guild else 'global'}"
+        fingerprint = self._command_tree_fingerprint(guild)
+        state = _load_command_sync_state()
+        if not self._force_sync and state.get(scope) == fingerprint:
+            return False
+        await self.tree.sync(guild=guild)
+        state[scope] = fingerprint
+        _save_command_sync_state(state)
+        return True
 
     async def setup_hook(self):
-        await self.load_extension('voice')
-
-        if self._dev_mode and DEV_GUILD_ID:
-            guild = discord.Object(id=int(DEV_GUILD_ID))
-            self.tree.copy_global_to(guild=guild)
-            await self.tree.sync(guild=guild)
-            print(f"Synced commands to dev guild {DEV_GUILD_ID} (dev mode)")
-        else:
-            await self.tree.sync()
-            print("Synced commands globally (all guilds)")
-        print("Successfully synced commands")
+        startup_profile.mark('setup_hook begin (since process start)')
+        # イベントループの詰まり監視（--loop-monitor / LOOP_MONITOR=1）
+        if loop_monitor.is_requested():
+            loop_monitor.start()
+        with startup_profile.span('load_extension voice'):
+            await self.load_extension('voice')
+        with startup_profile.span('load_extension admin'):
+            await self.load_extension('admin')
+
+        with startup_profile.span('command tree sync'):
+            if self._dev_mode and DEV_GUILD_ID:
+                guild = discord.Object(id=int(DEV_GUILD_ID))
+                self.tree.copy_global_to(guild=guild)
+                if await self._sync_if_changed(guild):
+                    print(f"Synced commands to dev guild {DEV_GUILD_ID} (dev mode)")
+                else:
+                    print(f"Command tree unchanged, skipped sync to dev guild {DEV_GUILD_ID} (dev mode)")
+            else:
+                if await self._sync_if_changed(None):
+                    print("Synced commands globally (all guilds)")
+                else:
+                    print("Command tree unchanged, skipped global sync")
         print(f"Logged onto {self.user}")
 
-if __name__ == '__main__':
-    # INFO を docker logs（stderr）に出す。指定しないとデフォルト WARNING で [op] が表示されない
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)-8s %(name)s %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    async def on_ready(self):
+        if self._startup_reported:
+            return
+        self._startup_reported = True
+        startup_profile.mark('on_ready (since process start)')
+        startup_profile.log_report()
+        logging.getLogger(__name__).info('%s', memory_profile.snapshot(self, self.memory_profile))
+
+    async def close(self):
+        loop_monitor.stop()
+        await super().close()
+
+LOG_FORMAT = "%(asctime)s %(levelname)-8s %(name)s %(message)s"
+LOG_DATEFMT = "%Y-%m-%d %H:%M:%S"
+
+
+def _setup_logging(queue_mode: bool) -> None:
+    if queue_mode:
+        log_pipeline.setup_queue_logging(
+            level=logging.INFO,
+            fmt=LOG_FORMAT,
+            datefmt=LOG_DATEFMT,
+            op_rate=float(os.environ.get('LOG_OP_RATE', log_pipeline.OP_RATE_DEFAULT)),
+            op_burst=float(os.environ.get('LOG_OP_BURST', log_pipeline.OP_BURST_DEFAULT)),
+        )
+    else:
+        # INFO を docker logs（stderr）に出す。指定しないとデフォルト WARNING で [op] が表示されない
+        logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, datefmt=LOG_DATEFMT)
     # discord が自前ハンドラを持っていると同じログが2行出るので、root に集約する
     for _logger in ("discord", "discord.client", "discord.gateway", "discord.voice_state", "discord.player"):
         log = logging.getLogger(_logger)
         log.handlers.clear()
         log.propagate = True
+    if queue_mode:
+        return
     # 再生終了直後の discord.player "Write error" (dest=bool のレース) をログから除外
     for h in logging.root.handlers[:]:
         h.addFilter(SuppressDiscordPlayerWriteError())
     logging.getLogger("discord.player").addFilter(SuppressDiscordPlayerWriteError())
 
-    bot = Bot(dev_mode=_is_dev_mode())
-    bot.run(DISCORD_TOKEN)
\ No newline at end of file
+
+if __name__ == '__main__':
+    queue_mode = _is_log_queue_mode()
+    _setup_logging(queue_mode)
+
+    bot = Bot(dev_mode=_is_dev_mode(), force_sync=_is_force_sync(), memory_profile_name=memory_profile.selected())
+    if queue_mode:
+        # bot.run 既定の discord ロガー用 StreamHandler を付けない（同期書き込みになるため）
+        bot.run(DISCORD_TOKEN, log_handler=None)
+    else:
+        bot.run(DISCORD_TOKEN)
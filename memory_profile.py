@@ -0,0 +1,81 @@
+# coding: utf-8
+"""ゲートウェイのキャッシュ設定（--low-memory / MEMORY_PROFILE=low）と、RSS・キャッシュ量の記録"""
+
+import logging
+import os
+import sys
+
+import discord
+
+import startup_profile
+
+logger = logging.getLogger(__name__)
+
+PROFILES = ("default", "low")
+# low のときの discord.py のメッセージキャッシュ件数（0 で無効。リアクションの対象は Voice Cog が自前で TTL キャッシュする）
+LOW_MEMORY_MAX_MESSAGES = int(os.environ.get("LOW_MEMORY_MAX_MESSAGES", "0"))
+
+
+def selected() -> str:
+    if "--low-memory" in sys.argv:
+        return "low"
+    profile = os.environ.get("MEMORY_PROFILE", "default").lower()
+    if profile not in PROFILES:
+        logger.warning("[memory] unknown MEMORY_PROFILE=%r, using default", profile)
+        return "default"
+    return profile
+
+
+def client_options(profile: str) -> dict:
+    """
+    commands.Bot に渡すキャッシュ関係の引数。default は discord.py の既定（全メンバーを起動時に chunk してキャッシュ、
+    メッセージ 1000 件）。low は VC にいるメンバーだけをキャッシュし、起動時の chunk とメッセージキャッシュを止める。
+    """
+    if profile != "low":
+        return {}
+    flags = discord.MemberCacheFlags.none()
+    flags.voice = True
+    return {
+        "member_cache_flags": flags,
+        "chunk_guilds_at_startup": False,
+        # discord.py は 0 以下を 1000 件扱いにするので、無効は None で渡す
+        "max_messages": LOW_MEMORY_MAX_MESSAGES if LOW_MEMORY_MAX_MESSAGES > 0 else None,
+    }
+
+
+def rss_bytes() -> int | None:
+    """現在の RSS。/proc が無い環境では最大 RSS（ru_maxrss）で代用する。"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB、macOS は byte
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cache_counts(client: discord.Client) -> dict:
+    """キャッシュしている guild・メンバー・ユーザー・メッセージの件数。"""
+    return {
+        "guilds": len(client.guilds),
+        "members": sum(len(g.members) for g in client.guilds),
+        "users": len(client.users),
+        "messages": len(client.cached_messages),
+    }
+
+
+def snapshot(client: discord.Client, profile: str) -> str:
+    rss = rss_bytes()
+    c = cache_counts(client)
+    return (
+        f"[memory] profile={profile} rss={rss / 1024 / 1024 if rss else 0:.1f}MB guilds={c['guilds']} "
+        f"cached_members={c['members']} users={c['users']} messages={c['messages']} "
+        f"since_start={startup_profile.elapsed():.2f}s"
+    )
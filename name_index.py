@@ -0,0 +1,177 @@
+# coding: utf-8
+"""アップロード名の検索索引（autocomplete 用）: 前方一致 → 部分一致 → 編集距離の順に順位付けして返す"""
+
+import bisect
+
+
+class NameIndex:
+    """
+    1 guild 分のアップロード名。小文字化したキーの昇順リストを持ち、前方一致は bisect、
+    部分一致は連結文字列に対する str.find、編集距離はキー列を暗黙のトライとして辿って求める。
+    編集距離は 1 → 2 の順に名前順で辿り、limit 件埋まった時点で打ち切る（数千件でも 1 回 1 ms を大きく下回る）。
+    """
+
+    def __init__(self, names=()):
+        # (小文字キー, 元の名前) の昇順
+        self._items: list[tuple[str, str]] = []
+        self._keys: list[str] = []
+        # 部分一致用: キーを "\n" で連結したものと各キーの開始位置。変更があったら次の検索で作り直す
+        self._joined: str | None = None
+        self._starts: list[int] = []
+        # 編集距離の枝刈り用: キー長の区間最大を引く疎テーブル（levels[k][i] = max(len(keys[i:i + 2**k]))）。変更があったら作り直す
+        self._len_table: list[list[int]] | None = None
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, name: str) -> bool:
+        item = (name.lower(), name)
+        i = bisect.bisect_left(self._items, item)
+        return i < len(self._items) and self._items[i] == item
+
+    def add(self, name: str) -> None:
+        key = name.lower()
+        item = (key, name)
+        i = bisect.bisect_left(self._items, item)
+        if i < len(self._items) and self._items[i] == item:
+            return
+        self._items.insert(i, item)
+        self._keys.insert(i, key)
+        self._joined = None
+        self._len_table = None
+
+    def remove(self, name: str) -> None:
+        key = name.lower()
+        item = (key, name)
+        i = bisect.bisect_left(self._items, item)
+        if i >= len(self._items) or self._items[i] != item:
+            return
+        del self._items[i]
+        del self._keys[i]
+        self._joined = None
+        self._len_table = None
+
+    def search(self, query: str, limit: int = 25) -> list[str]:
+        """前方一致（名前順）→ 部分一致（出現位置が前のもの優先）→ 編集距離の小さいもの、の順に最大 limit 件。"""
+        q = query.strip().lower()
+        if not q:
+            return [name for _, name in self._items[:limit]]
+        results: list[str] = []
+        seen: set[str] = set()
+        i = bisect.bisect_left(self._keys, q)
+        while i < len(self._keys) and self._keys[i].startswith(q) and len(results) < limit:
+            name = self._items[i][1]
+            results.append(name)
+            seen.add(name)
+            i += 1
+        if len(results) >= limit:
+            return results
+
+        for _, idx in sorted(self._substring_hits(q, seen))[:limit - len(results)]:
+            name = self._items[idx][1]
+            results.append(name)
+            seen.add(name)
+        if len(results) >= limit or len(q) < 3:
+            return results
+
+        max_dist = 1 if len(q) <= 5 else 2
+        for dist in range(1, max_dist + 1):
+            for lo, hi in self._fuzzy_ranges(q, dist):
+                for idx in range(lo, hi):
+                    name = self._items[idx][1]
+                    if name not in seen:
+                        results.append(name)
+                        seen.add(name)
+                        if len(results) >= limit:
+                            return results
+        return results
+
+    def _substring_hits(self, q: str, seen: set[str]) -> list[tuple[int, int]]:
+        """先頭以外に q を含むキーの (出現位置, キー番号)。"""
+        if self._joined is None:
+            self._joined = "\n".join(self._keys)
+            self._starts = []
+            offset = 0
+            for key in self._keys:
+                self._starts.append(offset)
+                offset += len(key) + 1
+        joined, starts = self._joined, self._starts
+        hits = []
+        last_idx = -1
+        at = joined.find(q)
+        while at >= 0:
+            idx = bisect.bisect_right(starts, at) - 1
+            pos = at - starts[idx]
+            if idx != last_idx and pos > 0 and self._items[idx][1] not in seen:
+                hits.append((pos, idx))
+                last_idx = idx
+            at = joined.find(q, at + 1)
+        return hits
+
+    def _max_len(self, lo: int, hi: int) -> int:
+        """keys[lo:hi] の最長のキー長（hi > lo）。"""
+        table = self._len_table
+        if table is None:
+            table = [[len(k) for k in self._keys]]
+            step = 1
+            while step * 2 <= len(self._keys):
+                prev = table[-1]
+                table.append([a if a > b else b for a, b in zip(prev, prev[step:])])
+                step *= 2
+            self._len_table = table
+        k = (hi - lo).bit_length() - 1
+        level = table[k]
+        a, b = level[lo], level[hi - (1 << k)]
+        return a if a > b else b
+
+    def _fuzzy_ranges(self, q: str, max_dist: int):
+        """
+        先頭 1 文字が q と同じで、いずれかの前方部分と q の編集距離がちょうど max_dist になるキー範囲 (lo, hi) を名前順に返す
+        （max_dist 未満のものは手前の距離で返しているので出さない）。昇順のキー列では同じ前方部分を持つキーが連続するので、
+        それをトライの節点とみなして DP の行を親から引き継ぎ、次の枝は打ち切る。
+        ・行の下限（row[i] に、枝で最長のキーの残りでは足りない q の文字数を足したもの）の最小が max_dist を超える
+        ・節点で既に当たっていて、行の最小値から下の節点がそれより近くなり得ない（範囲は節点に含まれる）
+        """
+        keys = self._keys
+        m = len(q)
+        over = max_dist + 1
+        # (前方部分, lo, hi, DP 行: row[i] = 編集距離(q[:i], 前方部分))。名前順に辿るため子は逆順に積む
+        stack = [("", 0, len(keys), [i if i <= max_dist else over for i in range(m + 1)])]
+        while stack:
+            prefix, lo, hi, row = stack.pop()
+            depth = len(prefix)
+            if depth and row[m] <= max_dist:
+                if row[m] == max_dist:
+                    yield lo, hi
+                if min(row) >= row[m]:
+                    continue
+            j = lo
+            while j < hi and len(keys[j]) == depth:
+                j += 1
+            if depth == 0:
+                # 先頭の 1 文字は打ち間違えない前提で、その文字の枝だけ辿る（候補が入力長に対して爆発しないように）
+                j = bisect.bisect_left(keys, q[0], j, hi)
+                hi = bisect.bisect_left(keys, chr(ord(q[0]) + 1), j, hi)
+            children = []
+            while j < hi:
+                c = keys[j][depth]
+                child = prefix + c
+                end = bisect.bisect_left(keys, prefix + chr(ord(c) + 1), j, hi)
+                # 帯 |i - 深さ| <= max_dist の外は max_dist を超えるので over のまま
+                d = depth + 1
+                # 枝で最長のキーが残り rest 文字しかないと、q[i:] のうち m - i - rest 文字は挿入になる
+                need = m - (self._max_len(j, end) - d)
+                new_row = [d if d <= max_dist else over] + [over] * m
+                bound = new_row[0] + need if need > 0 else new_row[0]
+                for i in range(max(1, d - max_dist), min(m, d + max_dist) + 1):
+                    v = min(row[i] + 1, new_row[i - 1] + 1, row[i - 1] + (q[i - 1] != c))
+                    new_row[i] = v if v < over else over
+                    lb = v + need - i if need > i else v
+                    if lb < bound:
+                        bound = lb
+                if bound <= max_dist:
+                    children.append((child, j, end, new_row))
+                j = end
+            stack.extend(reversed(children))
@@ -0,0 +1,185 @@
+# coding: utf-8
+"""過負荷時の段階的な機能縮退: イベントループの遅延・再生キューの長さ・REST の 429 の頻度から縮退レベルを決める"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 0 = 通常。上がるほど多くを諦め、下のレベルで止めたものは上でも止めたまま
+LEVELS = (
+    "normal",
+    "no auto-reactions",  # on_message のランダム ♨️ と自動リアクション（本文の走査ごと）を止める
+    "short queues",  # guild ごとの再生キューを OVERLOAD_QUEUE_MAX 件までにする
+    "no reaction-remove",  # リアクションを外したときの再生をしない
+    "shed busiest guilds",  # 直近の再生要求が多い guild の再生を落とす
+)
+MAX_LEVEL = len(LEVELS) - 1
+
+
+def _enabled() -> bool:
+    return os.environ.get("OVERLOAD_CONTROL", "1").lower() not in ("0", "false", "no")
+
+
+def _thresholds(name: str, default: str) -> tuple[float, ...]:
+    """レベル 1〜MAX_LEVEL に上がる閾値（カンマ区切り、昇順）。"""
+    values = tuple(float(x) for x in os.environ.get(name, default).split(",") if x.strip())
+    if len(values) != MAX_LEVEL or list(values) != sorted(values):
+        logger.warning("[overload] %s must be %d ascending numbers, using %s", name, MAX_LEVEL, default)
+        values = tuple(float(x) for x in default.split(","))
+    return values
+
+
+ENABLED = _enabled()
+# 判定の間隔（秒）。ループの遅延はこの間隔の sleep の遅れで測る
+INTERVAL_SEC = 0.5
+LAG_MS = _thresholds("OVERLOAD_LAG_MS", "50,100,250,500")
+QUEUED = _thresholds("OVERLOAD_QUEUED", "100,250,500,1000")
+RATE_LIMITED_PER_MIN = _thresholds("OVERLOAD_429_PER_MIN", "5,15,40,80")
+# 下がるときは閾値にこの倍率を掛けたものを下回った状態が RECOVER_SEC 続いたら 1 段ずつ下げる（行ったり来たりしないように）
+RECOVER_RATIO = 0.5
+RECOVER_SEC = float(os.environ.get("OVERLOAD_RECOVER_SEC", "30"))
+# ループの遅延は直近この回数の判定の最大値で見る（一瞬の詰まりで下がりきらないように）
+LAG_WINDOW = 4
+# レベル 2 以上での guild ごとの再生キューの上限（件）
+QUEUE_MAX = int(os.environ.get("OVERLOAD_QUEUE_MAX", "3"))
+# レベル 4 で再生を落とす guild の数（直近の再生要求が多い順）と、対象にする最低の要求数（直近の減衰つき件数）
+SHED_GUILDS = int(os.environ.get("OVERLOAD_SHED_GUILDS", "10"))
+SHED_MIN_PLAYS = 5.0
+# guild ごとの再生要求数を判定のたびに掛ける減衰率（0.5 秒ごとに 0.95 → 半減期およそ 7 秒）
+PLAY_DECAY = 0.95
+
+
+class RateLimitCounter(logging.Handler):
+    """discord.py の HTTP クライアントが 429 を受けたときの警告ログを数える（直近 60 秒の件数）。"""
+
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self._times: deque[float] = deque()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        msg = record.msg if isinstance(record.msg, str) else ""
+        if msg.startswith("We are being rate limited") or msg.startswith("Global rate limit"):
+            self._times.append(time.monotonic())
+
+    def per_minute(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        while self._times and now - self._times[0] > 60.0:
+            self._times.popleft()
+        return len(self._times)
+
+
+def _demand(lag_ms: float, queued: int, rate_limited: int, ratio: float = 1.0) -> int:
+    """各指標が要求するレベルの最大。ratio を掛けた閾値で判定する。"""
+    level = 0
+    for value, thresholds in ((lag_ms, LAG_MS), (queued, QUEUED), (rate_limited, RATE_LIMITED_PER_MIN)):
+        n = sum(1 for t in thresholds if value >= t * ratio)
+        level = max(level, n)
+    return level
+
+
+class Controller:
+    """
+    縮退レベルの状態。observe() で指標を渡すと、閾値を超えていれば 1 段上げ、
+    RECOVER_RATIO 倍の閾値を RECOVER_SEC 下回り続けたら 1 段下げる。
+    """
+
+    def __init__(self):
+        self.level = 0
+        self.max_level = 0
+        self.transitions = 0
+        self.last = {"lag_ms": 0.0, "queued": 0, "rate_limited_per_min": 0}
+        self._lags: deque[float] = deque(maxlen=LAG_WINDOW)
+        self._calm_since: float | None = None
+        # guild_id → 直近の再生要求数（判定ごとに減衰）
+        self._plays: dict[int, float] = {}
+        self._shed: frozenset[int] = frozenset()
+        self.dropped = {"auto_reactions": 0, "queue_full": 0, "reaction_remove": 0, "shed": 0}
+
+    def observe(self, lag_ms: float, queued: int, rate_limited: int, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        self._lags.append(lag_ms)
+        lag = max(self._lags)
+        self.last = {"lag_ms": lag, "queued": queued, "rate_limited_per_min": rate_limited}
+        before = self.level
+        if _demand(lag, queued, rate_limited) > self.level:
+            self.level += 1
+            self._calm_since = None
+        elif _demand(lag, queued, rate_limited, RECOVER_RATIO) < self.level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= RECOVER_SEC:
+                self.level -= 1
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        if self.level != before:
+            self.transitions += 1
+            self.max_level = max(self.max_level, self.level)
+            log = logger.warning if self.level > before else logger.info
+            log(
+                "[overload] level %d -> %d (%s) lag=%.0fms queued=%d 429/min=%d",
+                before, self.level, LEVELS[self.level], lag, queued, rate_limited,
+            )
+        self._update_plays()
+        return self.level
+
+    def _update_plays(self) -> None:
+        plays = {g: n * PLAY_DECAY for g, n in self._plays.items() if n * PLAY_DECAY >= 0.5}
+        self._plays = plays
+        if self.level >= 4 and SHED_GUILDS > 0:
+            busiest = sorted((g for g, n in plays.items() if n >= SHED_MIN_PLAYS), key=lambda g: -plays[g])
+            self._shed = frozenset(busiest[:SHED_GUILDS])
+        else:
+            self._shed = frozenset()
+
+    # --- 機能ごとの判定（Voice Cog から呼ぶ） ---
+
+    def allow_auto_reactions(self) -> bool:
+        if self.level >= 1:
+            self.dropped["auto_reactions"] += 1
+            return False
+        return True
+
+    def allow_reaction_remove(self) -> bool:
+        if self.level >= 3:
+            self.dropped["reaction_remove"] += 1
+            return False
+        return True
+
+    def allow_play(self, guild_id: int, queued: int) -> bool:
+        """再生要求を受けるか。受けた要求は guild ごとに数え、レベル 4 で落とす guild の選定に使う。"""
+        self._plays[guild_id] = self._plays.get(guild_id, 0.0) + 1.0
+        if guild_id in self._shed:
+            self.dropped["shed"] += 1
+            return False
+        if self.level >= 2 and queued >= QUEUE_MAX:
+            self.dropped["queue_full"] += 1
+            return False
+        return True
+
+    def snapshot(self) -> dict:
+        return dict(
+            self.last,
+            level=self.level,
+            name=LEVELS[self.level],
+            max_level=self.max_level,
+            transitions=self.transitions,
+            shed_guilds=len(self._shed),
+            dropped=dict(self.dropped),
+        )
+
+
+async def monitor(controller: Controller, queued, counter: RateLimitCounter) -> None:
+    """INTERVAL_SEC ごとにループの遅延・queued()（再生キューの合計件数）・429 の頻度を controller に渡す。"""
+    while True:
+        t = time.perf_counter()
+        await asyncio.sleep(INTERVAL_SEC)
+        lag_ms = max(0.0, (time.perf_counter() - t - INTERVAL_SEC) * 1000)
+        try:
+            controller.observe(lag_ms, queued(), counter.per_minute())
+        except Exception:
+            logger.exception("[overload] observe failed")
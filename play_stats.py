@@ -0,0 +1,205 @@
+# coding: utf-8
+"""再生回数の集計: (guild, 音声) と (guild, 絵文字) ごとにメモリで数え、まとめて SQLite に書く"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import db_migrate
+
+logger = logging.getLogger(__name__)
+
+_STORE_BASE = Path(os.environ.get("UPLOAD_STORE_DIR", "."))
+DB_PATH = _STORE_BASE / "play_stats.db"
+# 音声の種類: upload はアップロード名、file は config・熱盛シーケンスの音源パス（sounds_base からの相対パス）
+KINDS = ("upload", "file")
+
+# record() はイベントループ、flush() は別スレッドから呼ばれる
+_lock = threading.Lock()
+# flush() と forget() の DB 書き込みを 1 つずつにする（flush() が取り出した分を、forget() で消した後に書き戻さないため）
+_write_lock = threading.Lock()
+# (guild_id, kind, sound) → 回数 / (guild_id, emoji) → 回数。flush() までの未書き込み分
+_pending_sounds: Counter = Counter()
+_pending_emojis: Counter = Counter()
+_last_played: dict[tuple, int] = {}
+
+
+def _conn():
+    return sqlite3.connect(DB_PATH)
+
+
+def _migrate_base_schema(c: sqlite3.Connection) -> None:
+    """v1: 音声ごと・絵文字ごとの累計。guild 内の上位は (guild_id, plays) の索引で引く。"""
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sound_plays (
+            guild_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            sound TEXT NOT NULL,
+            plays INTEGER NOT NULL DEFAULT 0,
+            last_played INTEGER,
+            PRIMARY KEY (guild_id, kind, sound)
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sound_plays_top ON sound_plays (guild_id, plays DESC)")
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS emoji_plays (
+            guild_id INTEGER NOT NULL,
+            emoji TEXT NOT NULL,
+            plays INTEGER NOT NULL DEFAULT 0,
+            last_played INTEGER,
+            PRIMARY KEY (guild_id, emoji)
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_emoji_plays_top ON emoji_plays (guild_id, plays DESC)")
+
+
+# 追加するときは末尾に足す（user_version = 流し終えた手順の数）
+_MIGRATIONS: list[db_migrate.Step] = [
+    ("base schema", _migrate_base_schema),
+]
+
+
+def init():
+    """DB を最新の版まで移行する。"""
+    version = db_migrate.migrate(DB_PATH, _MIGRATIONS)
+    logger.debug("play_stats init done (schema v%d)", version)
+
+
+def record(guild_id: int, kind: str, sound: str, emoji: str | None = None) -> None:
+    """1 回の再生を数える（メモリ上だけ。DB には flush() で書く）。emoji は再生のきっかけになった絵文字。"""
+    now = int(time.time())
+    with _lock:
+        _pending_sounds[(guild_id, kind, sound)] += 1
+        _last_played[(guild_id, kind, sound)] = now
+        if emoji:
+            _pending_emojis[(guild_id, emoji)] += 1
+            _last_played[(guild_id, emoji)] = now
+
+
+def pending() -> int:
+    """まだ DB に書いていない件数（音声と絵文字の行数）。"""
+    with _lock:
+        return len(_pending_sounds) + len(_pending_emojis)
+
+
+def flush() -> int:
+    """
+    溜まった回数を 1 トランザクションで DB に足し込む。返り値は書いた行数。
+    書けなかった分はメモリに戻すので、次の flush() で再び書く。
+    """
+    with _write_lock:
+        return _flush()
+
+
+def _flush() -> int:
+    global _pending_sounds, _pending_emojis, _last_played
+    with _lock:
+        sounds, emojis, last = _pending_sounds, _pending_emojis, _last_played
+        _pending_sounds, _pending_emojis, _last_played = Counter(), Counter(), {}
+    if not sounds and not emojis:
+        return 0
+    t0 = time.perf_counter()
+    try:
+        with _conn() as c:
+            c.executemany(
+                """
+                INSERT INTO sound_plays (guild_id, kind, sound, plays, last_played) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (guild_id, kind, sound) DO UPDATE SET
+                    plays = plays + excluded.plays, last_played = MAX(COALESCE(last_played, 0), excluded.last_played)
+                """,
+                [(g, kind, sound, n, last.get((g, kind, sound))) for (g, kind, sound), n in sounds.items()],
+            )
+            c.executemany(
+                """
+                INSERT INTO emoji_plays (guild_id, emoji, plays, last_played) VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id, emoji) DO UPDATE SET
+                    plays = plays + excluded.plays, last_played = MAX(COALESCE(last_played, 0), excluded.last_played)
+                """,
+                [(g, emoji, n, last.get((g, emoji))) for (g, emoji), n in emojis.items()],
+            )
+    except sqlite3.Error:
+        with _lock:
+            _pending_sounds.update(sounds)
+            _pending_emojis.update(emojis)
+            for k, v in last.items():
+                _last_played.setdefault(k, v)
+        raise
+    rows = len(sounds) + len(emojis)
+    logger.debug("[play_stats] flushed %d rows (%.1f ms)", rows, (time.perf_counter() - t0) * 1000)
+    return rows
+
+
+def forget(guild_id: int, kind: str, sound: str) -> int:
+    """
+    音声の再生回数を消す（アップロードを削除したとき）。未書き込みの分も捨てる。返り値は消した DB の行数。
+    絵文字ごとの回数はきっかけの絵文字の集計なので残す。
+    """
+    key = (guild_id, kind, sound)
+    with _write_lock:
+        with _lock:
+            _pending_sounds.pop(key, None)
+            _last_played.pop(key, None)
+        with _conn() as c:
+            return c.execute(
+                "DELETE FROM sound_plays WHERE guild_id = ? AND kind = ? AND sound = ?", (guild_id, kind, sound)
+            ).rowcount
+
+
+def top_sounds(guild_id: int | None = None, limit: int = 10) -> list[tuple[int, str, str, int]]:
+    """
+    再生回数の多い音声 (guild_id, kind, sound, plays)。guild_id を省くと全体で数え、
+    file（どの guild でも同じ音源）は guild をまたいで合算して guild_id=0 で返す。
+    """
+    with _conn() as c:
+        if guild_id is not None:
+            cur = c.execute(
+                "SELECT guild_id, kind, sound, plays FROM sound_plays WHERE guild_id = ? ORDER BY plays DESC LIMIT ?",
+                (guild_id, limit),
+            )
+        else:
+            cur = c.execute(
+                """
+                SELECT CASE kind WHEN 'file' THEN 0 ELSE guild_id END AS g, kind, sound, SUM(plays) AS n
+                FROM sound_plays GROUP BY g, kind, sound ORDER BY n DESC LIMIT ?
+                """,
+                (limit,),
+            )
+        return list(cur.fetchall())
+
+
+def top_emojis(guild_id: int | None = None, limit: int = 10) -> list[tuple[str, int]]:
+    """再生のきっかけになった回数の多い絵文字 (emoji, plays)。guild_id を省くと全体で合算する。"""
+    with _conn() as c:
+        if guild_id is not None:
+            cur = c.execute(
+                "SELECT emoji, plays FROM emoji_plays WHERE guild_id = ? ORDER BY plays DESC LIMIT ?",
+                (guild_id, limit),
+            )
+        else:
+            cur = c.execute(
+                "SELECT emoji, SUM(plays) AS n FROM emoji_plays GROUP BY emoji ORDER BY n DESC LIMIT ?", (limit,)
+            )
+        return list(cur.fetchall())
+
+
+def check_query_plans() -> list[tuple[str, bool, str]]:
+    """guild ごとの上位の EXPLAIN QUERY PLAN（db_migrate.check_plans の結果）。"""
+    return db_migrate.check_plans(
+        DB_PATH,
+        [
+            (
+                "top_sounds (guild)",
+                "SELECT guild_id, kind, sound, plays FROM sound_plays WHERE guild_id = ? ORDER BY plays DESC LIMIT ?",
+                (0, 10),
+            ),
+            ("top_emojis (guild)", "SELECT emoji, plays FROM emoji_plays WHERE guild_id = ? ORDER BY plays DESC LIMIT ?", (0, 10)),
+        ],
+    )
@@ -0,0 +1,77 @@
+# coding: utf-8
+"""リアクショントリガーの流量制御: キー単位のトークンバケットと、同一キーの連続イベントのデバウンス"""
+
+import time
+
+
+class TokenBucket:
+    """
+    キーごとのトークンバケット。rate 件/秒で補充し、最大 burst 件まで貯まる。
+    使われなくなったキーは満タンに戻った時点で prune() により捨てる。
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self._max_keys = max_keys
+        # key -> [tokens, last_refill_at]
+        self._buckets: dict = {}
+
+    def allow(self, key, now: float | None = None) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self._max_keys:
+                self.prune(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def prune(self, now: float | None = None) -> None:
+        """満タンまで回復しているキー（= 最近使われていない）を捨てる。"""
+        now = time.monotonic() if now is None else now
+        full_after = self.burst / self.rate if self.rate > 0 else 0.0
+        stale = [k for k, (_, last) in self._buckets.items() if now - last >= full_after]
+        for k in stale:
+            del self._buckets[k]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class Debouncer:
+    """最後に通したイベントから window 秒以内の同一キーのイベントを落とす。"""
+
+    def __init__(self, window: float, max_keys: int = 100_000):
+        self.window = window
+        self._max_keys = max_keys
+        # key -> last_accepted_at
+        self._last: dict = {}
+
+    def allow(self, key, now: float | None = None) -> bool:
+        if self.window <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        last = self._last.get(key)
+        if last is not None and now - last < self.window:
+            return False
+        if last is None and len(self._last) >= self._max_keys:
+            self.prune(now)
+        self._last[key] = now
+        return True
+
+    def prune(self, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        stale = [k for k, t in self._last.items() if now - t >= self.window]
+        for k in stale:
+            del self._last[k]
+
+    def __len__(self) -> int:
+        return len(self._last)
@@ -5,6 +5,8 @@ import logging
 import sqlite3
 from pathlib import Path
 
+import db_migrate
+
 logger = logging.getLogger(__name__)
 
 # コンテナでも永続化できるようカレントディレクトリに配置（ボリュームマウントで保持可能）
@@ -16,19 +18,39 @@ def _conn():
     return sqlite3.connect(DB_PATH)
 
 
-def init():
-    """テーブルが無ければ作成する。"""
-    with _conn() as c:
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reaction_channel (
-                guild_id INTEGER NOT NULL,
-                channel_id INTEGER NOT NULL,
-                PRIMARY KEY (guild_id, channel_id)
-            )
-            """
+def _migrate_base_schema(c: sqlite3.Connection) -> None:
+    """v1: 版管理を入れる前の init() と同じ内容。"""
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reaction_channel (
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, channel_id)
         )
-    logger.debug("reaction_db init done")
+        """
+    )
+
+
+# 追加するときは末尾に足す（user_version = 流し終えた手順の数）
+_MIGRATIONS: list[db_migrate.Step] = [
+    ("base schema", _migrate_base_schema),
+]
+
+
+def init():
+    """DB を最新の版まで移行する。"""
+    version = db_migrate.migrate(DB_PATH, _MIGRATIONS)
+    logger.debug("reaction_db init done (schema v%d)", version)
+
+
+# 1 回の問い合わせで「全 OFF の行」「このチャンネルの行」「個別指定の行（channel_id > 0）」の有無を引く。
+# チャンネル ID は正の snowflake なので、個別指定の行は主キー (guild_id, channel_id) の範囲検索で 1 件見れば足りる
+_ENABLED_SQL = """
+    SELECT
+        EXISTS (SELECT 1 FROM reaction_channel WHERE guild_id = :guild_id AND channel_id = :all_off),
+        EXISTS (SELECT 1 FROM reaction_channel WHERE guild_id = :guild_id AND channel_id = :channel_id),
+        EXISTS (SELECT 1 FROM reaction_channel WHERE guild_id = :guild_id AND channel_id > :all_off)
+"""
 
 
 def is_reaction_enabled(guild_id: int, channel_id: int) -> bool:
@@ -40,25 +62,14 @@ def is_reaction_enabled(guild_id: int, channel_id: int) -> bool:
     ・上以外で (guild_id, * ) が存在 → 指定チャンネルのみ ON モードなので、この ch は OFF
     """
     with _conn() as c:
-        cur = c.execute(
-            "SELECT 1 FROM reaction_channel WHERE guild_id = ? AND channel_id = ?",
-            (guild_id, _ALL_OFF),
-        )
-        if cur.fetchone():
-            return False
-        cur = c.execute(
-            "SELECT 1 FROM reaction_channel WHERE guild_id = ? AND channel_id = ?",
-            (guild_id, channel_id),
-        )
-        if cur.fetchone():
-            return True
-        cur = c.execute(
-            "SELECT 1 FROM reaction_channel WHERE guild_id = ? AND channel_id != ?",
-            (guild_id, _ALL_OFF),
-        )
-        if cur.fetchone():
-            return False
-    return True
+        all_off, this_channel, any_channel = c.execute(
+            _ENABLED_SQL, {"guild_id": guild_id, "channel_id": channel_id, "all_off": _ALL_OFF}
+        ).fetchone()
+    if all_off:
+        return False
+    if this_channel:
+        return True
+    return not any_channel
 
 
 def set_all_off(guild_id: int) -> None:
@@ -106,3 +117,14 @@ def get_enabled_channels(guild_id: int) -> list[int] | None:
     if len(rows) == 1 and rows[0][0] == _ALL_OFF:
         return []
     return [r[0] for r in rows if r[0] != _ALL_OFF]
+
+
+def check_query_plans() -> list[tuple[str, bool, str]]:
+    """is_reaction_enabled / get_enabled_channels の EXPLAIN QUERY PLAN（db_migrate.check_plans の結果）。"""
+    return db_migrate.check_plans(
+        DB_PATH,
+        [
+            ("is_reaction_enabled", _ENABLED_SQL, {"guild_id": 0, "channel_id": 1, "all_off": _ALL_OFF}),
+            ("get_enabled_channels", "SELECT channel_id FROM reaction_channel WHERE guild_id = ? ORDER BY channel_id", (0,)),
+        ],
+    )
@@ -0,0 +1,134 @@
+# coding: utf-8
+"""起動プロファイル: モジュールごとの import 時間と初期化区間の計測（--profile-startup / STARTUP_PROFILE=1）"""
+
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_t0 = time.perf_counter()
+# module name -> [inclusive_sec, self_sec]
+_imports: dict[str, list[float]] = {}
+# (label, sec) の記録順リスト
+_spans: list[tuple[str, float]] = []
+_import_stack: list[list[float]] = []
+
+
+def is_requested() -> bool:
+    if "--profile-startup" in sys.argv:
+        return True
+    return os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """元の loader の exec_module を包んで、モジュール本体の実行時間（包含・自身のみ）を記録する。"""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        frame = [0.0]  # 子モジュールの包含時間の合計
+        _import_stack.append(frame)
+        t = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - t
+            _import_stack.pop()
+            if _import_stack:
+                _import_stack[-1][0] += elapsed
+            _imports[module.__name__] = [elapsed, elapsed - frame[0]]
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def install() -> None:
+    """以降の import を計測する。重い import より前（main.py の先頭）で呼ぶこと。"""
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    sys.meta_path.insert(0, _TimingFinder())
+
+
+@contextmanager
+def span(label: str):
+    """初期化区間の計測。プロファイル無効時は何もしない。"""
+    if not _enabled:
+        yield
+        return
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        _spans.append((label, time.perf_counter() - t))
+
+
+def mark(label: str) -> None:
+    """プロセス開始（このモジュールの import 時点）からの経過時間を記録する。"""
+    if _enabled:
+        _spans.append((label, time.perf_counter() - _t0))
+
+
+def elapsed() -> float:
+    """プロセス開始（このモジュールの import 時点）からの経過秒。プロファイル無効でも使える。"""
+    return time.perf_counter() - _t0
+
+
+def report(top: int = 25) -> str:
+    """import 時間（トップレベルパッケージ単位 + 自身の時間が大きいモジュール）と初期化区間の一覧。"""
+    lines = ["[startup] profile"]
+    by_package: dict[str, float] = {}
+    for name, (inclusive, _self) in _imports.items():
+        pkg = name.split(".", 1)[0]
+        if name == pkg:
+            by_package[pkg] = by_package.get(pkg, 0.0) + inclusive
+    lines.append("  imports by top-level package (inclusive):")
+    for pkg, sec in sorted(by_package.items(), key=lambda x: -x[1])[:top]:
+        lines.append(f"    {sec * 1000:9.1f} ms  {pkg}")
+    lines.append("  slowest modules (self):")
+    for name, (_inclusive, self_sec) in sorted(_imports.items(), key=lambda x: -x[1][1])[:top]:
+        lines.append(f"    {self_sec * 1000:9.1f} ms  {name}")
+    lines.append("  init spans:")
+    for label, sec in _spans:
+        lines.append(f"    {sec * 1000:9.1f} ms  {label}")
+    return "\n".join(lines)
+
+
+def log_report() -> None:
+    if _enabled:
+        logger.info("%s", report())
+
+
+def timed(label: str, fn, *args, **kwargs):
+    """fn(*args, **kwargs) を呼ぶ関数を返す。span(label) で包むので asyncio.to_thread にそのまま渡せる。"""
+    def run():
+        with span(label):
+            return fn(*args, **kwargs)
+    return run
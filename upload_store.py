@@ -1,21 +1,37 @@
 # coding: utf-8
 """ユーザーアップロード音声の保存とリアクション紐付け（SQLite + ファイル）"""
 
+import hashlib
 import logging
 import os
 import re
 import sqlite3
+import threading
 import time
 from pathlib import Path
 
+import db_migrate
+
 logger = logging.getLogger(__name__)
 
 # 永続化用の親ディレクトリ（Docker では /app/data をボリュームマウントして使用）
 _STORE_BASE = Path(os.environ.get("UPLOAD_STORE_DIR", "."))
-UPLOAD_DIR = _STORE_BASE / "uploads"
+UPLOAD_DIR = _STORE_BASE / "uploads"  # 旧形式（uploads/<guild_id>/<name>.<ext>）。gc() で blobs に移す
+BLOB_DIR = _STORE_BASE / "blobs"  # 内容ハッシュで共有する実体（blobs/<sha256 先頭 2 桁>/<sha256>.<ext>）
 DB_PATH = _STORE_BASE / "uploads.db"
 NAME_MAX_LEN = 64
 ALLOWED_EXT = frozenset({"mp3", "wav"})
+# guild ごとの上限（0 は無制限）。/upload_files・/import_files の保存時に確認する。
+# 既定は無制限（既に多く登録しているサーバーが突然保存できなくならないように、上限は運用者が決めて設定する）
+QUOTA_FILES = int(os.environ.get("UPLOAD_QUOTA_FILES", "0"))
+QUOTA_BYTES = int(float(os.environ.get("UPLOAD_QUOTA_MB", "0")) * 1024 * 1024)
+# gc() が DB に無いファイルを消すまでの猶予（書き込み途中のファイルを消さないため）
+ORPHAN_GRACE_SEC = 3600
+# 行が指すファイルの欠損がこの割合を超えたら、ボリューム未マウント等とみなして gc() は行を消さない
+MISSING_ABORT_RATIO = 0.5
+
+# blobs の参照カウントとファイルの増減を直列化する（同一プロセス内の save / delete / gc）
+_blob_lock = threading.Lock()
 
 
 def _conn():
@@ -28,38 +44,142 @@ def _sanitize_name(name: str) -> str:
     return s[:NAME_MAX_LEN] if s else "unnamed"
 
 
-def init():
-    """テーブルが無ければ作成する。"""
-    UPLOAD_DIR.mkdir(exist_ok=True)
-    with _conn() as c:
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS uploads (
-                guild_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                PRIMARY KEY (guild_id, name)
-            )
-            """
+def _migrate_base_schema(c: sqlite3.Connection) -> None:
+    """v1: 版管理を入れる前の init() と同じ内容。古い DB には後から足した列を補う。"""
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS uploads (
+            guild_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            uploaded_by INTEGER,
+            uploaded_at INTEGER,
+            blob_sha TEXT,
+            PRIMARY KEY (guild_id, name)
         )
-        for col in ("uploaded_by", "uploaded_at"):
-            try:
-                c.execute(f"ALTER TABLE uploads ADD COLUMN {col} INTEGER")
-            except sqlite3.OperationalError as e:
-                if "duplicate column" not in str(e).lower():
-                    raise
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reaction_upload (
-                guild_id INTEGER NOT NULL,
-                reaction_key TEXT NOT NULL,
-                upload_name TEXT NOT NULL,
-                PRIMARY KEY (guild_id, reaction_key),
-                FOREIGN KEY (guild_id, upload_name) REFERENCES uploads (guild_id, name)
-            )
-            """
+        """
+    )
+    db_migrate.add_missing_columns(
+        c, "uploads", (("uploaded_by", "INTEGER"), ("uploaded_at", "INTEGER"), ("blob_sha", "TEXT"))
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reaction_upload (
+            guild_id INTEGER NOT NULL,
+            reaction_key TEXT NOT NULL,
+            upload_name TEXT NOT NULL,
+            PRIMARY KEY (guild_id, reaction_key),
+            FOREIGN KEY (guild_id, upload_name) REFERENCES uploads (guild_id, name)
+        )
+        """
+    )
+    # 内容ハッシュごとの実体。refcount は uploads.blob_sha から参照している行数
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            ext TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER
         )
-    logger.debug("upload_store init done")
+        """
+    )
+
+
+def _migrate_lookup_indexes(c: sqlite3.Connection) -> None:
+    """v2: 主キー以外の絞り込みに使う索引。"""
+    # アップロード名 → 紐付いたリアクション（一覧表示の JOIN、紐付けの列挙、削除で使う。reaction_key まで含めて表を引かない）
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reaction_upload_upload ON reaction_upload (guild_id, upload_name, reaction_key)"
+    )
+    # blob → 参照している行（gc() の refcount 数え直しと旧形式の行の洗い出し）
+    c.execute("CREATE INDEX IF NOT EXISTS idx_uploads_blob ON uploads (blob_sha)")
+    # 参照 0 の blob だけを持つ部分索引（gc() の削除対象探し）
+    c.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (refcount) WHERE refcount <= 0")
+
+
+def _migrate_alias_reaction_keys(c: sqlite3.Connection) -> None:
+    """
+    v3: ASCII の alias（例: coffin）で保存された reaction_key を Unicode 絵文字に揃える
+    （docs/REACTION_KEY_MIGRATION.md にあった手動スクリプトと同じ規則）。
+    同じ guild で変換先のキーが同じ音声に紐付いていれば alias の行を消し、別の音声に紐付いていれば残す。
+    """
+    from emoji import emojize
+
+    rows = c.execute(
+        "SELECT guild_id, reaction_key, upload_name FROM reaction_upload ORDER BY guild_id, reaction_key"
+    ).fetchall()
+    converted = skipped = 0
+    for guild_id, key, name in rows:
+        if not key or not key.isascii():
+            continue
+        unicode_key = emojize(f":{key}:", language="alias")
+        if not unicode_key or unicode_key == f":{key}:":
+            continue
+        existing = c.execute(
+            "SELECT upload_name FROM reaction_upload WHERE guild_id = ? AND reaction_key = ?", (guild_id, unicode_key)
+        ).fetchone()
+        if existing is None:
+            c.execute(
+                "UPDATE reaction_upload SET reaction_key = ? WHERE guild_id = ? AND reaction_key = ?",
+                (unicode_key, guild_id, key),
+            )
+        elif existing[0] == name:
+            c.execute("DELETE FROM reaction_upload WHERE guild_id = ? AND reaction_key = ?", (guild_id, key))
+        else:
+            logger.warning(
+                "[upload_store] keep alias reaction_key guild_id=%s %r: %r is already bound to %r",
+                guild_id, key, unicode_key, existing[0],
+            )
+            skipped += 1
+            continue
+        converted += 1
+    if converted or skipped:
+        logger.info("[upload_store] alias reaction_key -> unicode converted=%d skipped=%d", converted, skipped)
+
+
+# 追加するときは末尾に足す（user_version = 流し終えた手順の数）
+_MIGRATIONS: list[db_migrate.Step] = [
+    ("base schema", _migrate_base_schema),
+    ("lookup indexes", _migrate_lookup_indexes),
+    ("alias reaction_key -> unicode", _migrate_alias_reaction_keys),
+]
+
+
+def init():
+    """ディレクトリを用意し、DB を最新の版まで移行する。"""
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    BLOB_DIR.mkdir(exist_ok=True)
+    version = db_migrate.migrate(DB_PATH, _MIGRATIONS)
+    logger.debug("upload_store init done (schema v%d)", version)
+
+
+# 件数が増えても索引だけで引けるべき問い合わせ（check_query_plans() で確認する）
+_HOT_QUERIES = [
+    ("get_upload_path", "SELECT file_path FROM uploads WHERE guild_id = ? AND name = ?", (0, "")),
+    ("get_reaction_upload", "SELECT upload_name FROM reaction_upload WHERE guild_id = ? AND reaction_key = ?", (0, "")),
+    (
+        "list_reaction_keys_for_upload",
+        "SELECT reaction_key FROM reaction_upload WHERE guild_id = ? AND upload_name = ?",
+        (0, ""),
+    ),
+    ("delete_upload (bindings)", "DELETE FROM reaction_upload WHERE guild_id = ? AND upload_name = ?", (0, "")),
+    ("list_upload_names", "SELECT name FROM uploads WHERE guild_id = ? ORDER BY name", (0,)),
+    (
+        "list_all_reaction_uploads",
+        "SELECT reaction_key, upload_name FROM reaction_upload WHERE guild_id = ? ORDER BY reaction_key, upload_name",
+        (0,),
+    ),
+    ("blob lookup", "SELECT ext, refcount FROM blobs WHERE sha256 = ?", ("",)),
+    ("gc: legacy rows", "SELECT guild_id, name, file_path FROM uploads WHERE blob_sha IS NULL", ()),
+    ("gc: unreferenced blobs", "SELECT sha256 FROM blobs WHERE refcount <= 0", ()),
+]
+
+
+def check_query_plans() -> list[tuple[str, bool, str]]:
+    """_HOT_QUERIES の EXPLAIN QUERY PLAN（db_migrate.check_plans の結果）。全件走査があれば ok=False。"""
+    return db_migrate.check_plans(DB_PATH, _HOT_QUERIES + [("list_uploads_page", *_page_query(0, None, None, 15))])
 
 
 def _guild_dir(guild_id: int) -> Path:
@@ -68,6 +188,91 @@ def _guild_dir(guild_id: int) -> Path:
     return d
 
 
+def _blob_path(sha: str, ext: str) -> Path:
+    return BLOB_DIR / sha[:2] / f"{sha}.{ext}"
+
+
+def _existing_blob_path(sha: str, ext: str) -> Path:
+    """同じ内容の blob が既にあればそのパス（拡張子は最初に保存されたもの）、無ければ新しいパス。"""
+    with _conn() as c:
+        row = c.execute("SELECT ext FROM blobs WHERE sha256 = ?", (sha,)).fetchone()
+    return _blob_path(sha, row[0] if row else ext)
+
+
+def _write_blob(path: Path, content: bytes) -> None:
+    """一時ファイルに書いてから rename する（途中まで書かれた blob を他から見せない）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _release_blob(c: sqlite3.Connection, sha: str) -> None:
+    """参照を 1 つ減らす（呼び出し側のトランザクション内）。0 になった blob の削除は _purge_blob で行う。"""
+    c.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ? AND refcount > 0", (sha,))
+
+
+def _purge_blob(sha: str) -> bool:
+    """参照 0 の blob のファイルと行を消す。ファイルを消せなければ行を残して False（gc() が再試行する）。"""
+    with _conn() as c:
+        row = c.execute("SELECT ext, refcount FROM blobs WHERE sha256 = ?", (sha,)).fetchone()
+    if not row or row[1] > 0:
+        return False
+    path = _blob_path(sha, row[0])
+    try:
+        path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning("[upload_store] could not unlink blob %s: %s", path, e)
+        return False
+    with _conn() as c:
+        c.execute("DELETE FROM blobs WHERE sha256 = ? AND refcount = 0", (sha,))
+    return True
+
+
+def _usage(c: sqlite3.Connection, guild_id: int, exclude_name: str | None = None) -> tuple[int, int]:
+    cur = c.execute(
+        """
+        SELECT COUNT(*), COALESCE(SUM(b.size), 0)
+        FROM uploads u LEFT JOIN blobs b ON b.sha256 = u.blob_sha
+        WHERE u.guild_id = ? AND u.name IS NOT ?
+        """,
+        (guild_id, exclude_name),
+    )
+    files, size = cur.fetchone()
+    return files, size
+
+
+def guild_usage(guild_id: int) -> tuple[int, int]:
+    """その guild のアップロード数と合計バイト数（同じ内容を共有していても guild ごとに数える）。"""
+    with _conn() as c:
+        return _usage(c, guild_id)
+
+
+def storage_usage() -> dict[str, int]:
+    """全体の使用量。logical_bytes は guild ごとに数えた合計、physical_bytes は blobs/ の実体の合計。"""
+    with _conn() as c:
+        uploads, logical = c.execute(
+            "SELECT COUNT(*), COALESCE(SUM(b.size), 0) FROM uploads u LEFT JOIN blobs b ON b.sha256 = u.blob_sha"
+        ).fetchone()
+        blobs, physical = c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+    return {"uploads": uploads, "logical_bytes": logical, "blobs": blobs, "physical_bytes": physical}
+
+
+def _check_quota(guild_id: int, name: str, size: int) -> None:
+    """name を size バイトで保存（上書き）したときに guild の上限を超えるなら ValueError。"""
+    if not QUOTA_FILES and not QUOTA_BYTES:
+        return
+    with _conn() as c:
+        files, used = _usage(c, guild_id, exclude_name=name)
+    if QUOTA_FILES and files + 1 > QUOTA_FILES:
+        raise ValueError(f"このサーバーのアップロード数の上限（{QUOTA_FILES} 件）に達しています。`/delete_files` で削除してください。")
+    if QUOTA_BYTES and used + size > QUOTA_BYTES:
+        raise ValueError(
+            f"このサーバーの容量上限（{QUOTA_BYTES / 1024 / 1024:.0f} MB）を超えます。"
+            f"（使用中 {used / 1024 / 1024:.1f} MB + {size / 1024 / 1024:.1f} MB）"
+        )
+
+
 def save_upload(
     guild_id: int,
     name: str,
@@ -78,6 +283,7 @@ def save_upload(
     """
     アップロードを保存する。name はサニタイズされる。
     ext は mp3 または wav。uploaded_by は Discord の user_id。返り値はサニタイズ後の name。
+    実体は内容の SHA-256 で blobs/ に 1 つだけ置き、guild ごとの名前の行がそれを参照する。
     """
     ext = ext.lower()
     if ext not in ALLOWED_EXT:
@@ -85,18 +291,212 @@ def save_upload(
     safe_name = _sanitize_name(name)
     if not safe_name:
         raise ValueError("名前が空になりました")
-    path = _guild_dir(guild_id) / f"{safe_name}.{ext}"
-    path.write_bytes(content)
+    sha = hashlib.sha256(content).hexdigest()
     uploaded_at = int(time.time())
-    with _conn() as c:
-        c.execute(
-            "INSERT OR REPLACE INTO uploads (guild_id, name, file_path, uploaded_by, uploaded_at) VALUES (?, ?, ?, ?, ?)",
-            (guild_id, safe_name, str(path), uploaded_by, uploaded_at),
-        )
-    logger.info("[upload_store] save guild_id=%s name=%s path=%s by=%s", guild_id, safe_name, path, uploaded_by)
+    with _blob_lock:
+        _check_quota(guild_id, safe_name, len(content))
+        path = _existing_blob_path(sha, ext)
+        if not path.is_file():
+            _write_blob(path, content)
+        with _conn() as c:
+            old = c.execute(
+                "SELECT blob_sha, file_path FROM uploads WHERE guild_id = ? AND name = ?",
+                (guild_id, safe_name),
+            ).fetchone()
+            c.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, ext, size, refcount, created_at) VALUES (?, ?, ?, 0, ?)",
+                (sha, ext, len(content), uploaded_at),
+            )
+            c.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha,))
+            if old and old[0]:
+                _release_blob(c, old[0])
+            c.execute(
+                "INSERT OR REPLACE INTO uploads (guild_id, name, file_path, uploaded_by, uploaded_at, blob_sha) VALUES (?, ?, ?, ?, ?, ?)",
+                (guild_id, safe_name, str(path), uploaded_by, uploaded_at, sha),
+            )
+        if old and old[0] and old[0] != sha:
+            _purge_blob(old[0])
+    if old and not old[0] and old[1] != str(path):
+        # 旧形式のファイルを上書きした場合は元ファイルを消す（失敗しても gc() が拾う）
+        try:
+            Path(old[1]).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("[upload_store] save: could not unlink legacy file %s: %s", old[1], e)
+    logger.info("[upload_store] save guild_id=%s name=%s blob=%s by=%s", guild_id, safe_name, sha[:12], uploaded_by)
     return safe_name
 
 
+def store_blob(chunks, ext: str) -> tuple[str, Path, int, bool]:
+    """
+    chunks（bytes の反復）を blobs/tmp/ に流し込みながらハッシュを取り、blobs/ に置いて (sha256, パス, サイズ, 新しく書いたか) を返す。
+    同じ内容が既にあれば一時ファイルを捨てる。chunks が例外を投げたら一時ファイルを消してそのまま投げる。
+    行はまだ作らないので、save_uploads_bulk で参照されなかった blob は discard_unreferenced_blobs で消す
+    （落ちて残った一時ファイル・blob は ORPHAN_GRACE_SEC 後に gc() が消す）。
+    """
+    tmp_dir = BLOB_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp = tmp_dir / f".{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.tmp"
+    h = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                h.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha = h.hexdigest()
+        path = _existing_blob_path(sha, ext.lower())
+        if path.is_file():
+            tmp.unlink()
+            return sha, path, size, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return sha, path, size, True
+
+
+def discard_unreferenced_blobs(blobs: dict[str, Path]) -> int:
+    """store_blob で新しく書いた blob（sha256 → パス）のうち、blobs 行が無い（どの行からも参照されていない）ものを消す。"""
+    removed = 0
+    with _blob_lock:
+        with _conn() as c:
+            known = {sha for sha in blobs if c.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha,)).fetchone()}
+        for sha, path in blobs.items():
+            if sha in known:
+                continue
+            try:
+                path.unlink(missing_ok=True)
+                removed += 1
+            except OSError as e:
+                logger.warning("[upload_store] could not unlink unreferenced blob %s: %s", path, e)
+    return removed
+
+
+def _check_bulk_quota(c: sqlite3.Connection, guild_id: int, sizes: dict[str, int]) -> None:
+    """sizes（サニタイズ済みの名前 → バイト数）を登録（上書き）したときに guild の上限を超えるなら ValueError。"""
+    if not QUOTA_FILES and not QUOTA_BYTES:
+        return
+    kept_files, kept_bytes = 0, 0
+    for name, size in c.execute(
+        "SELECT u.name, COALESCE(b.size, 0) FROM uploads u LEFT JOIN blobs b ON b.sha256 = u.blob_sha WHERE u.guild_id = ?",
+        (guild_id,),
+    ):
+        if name not in sizes:
+            kept_files += 1
+            kept_bytes += size
+    files = kept_files + len(sizes)
+    used = kept_bytes + sum(sizes.values())
+    if QUOTA_FILES and files > QUOTA_FILES:
+        raise ValueError(f"取り込むとこのサーバーのアップロード数の上限（{QUOTA_FILES} 件）を超えます（{files} 件）。")
+    if QUOTA_BYTES and used > QUOTA_BYTES:
+        raise ValueError(
+            f"取り込むとこのサーバーの容量上限（{QUOTA_BYTES / 1024 / 1024:.0f} MB）を超えます（{used / 1024 / 1024:.1f} MB）。"
+        )
+
+
+def check_bulk_quota(guild_id: int, sizes: dict[str, int]) -> None:
+    """一括取り込みの前に、名前 → 宣言サイズで上限を確認する（blob を書く前に断るため）。名前はここでサニタイズする。"""
+    merged: dict[str, int] = {}
+    for name, size in sizes.items():
+        merged[_sanitize_name(name)] = size
+    with _conn() as c:
+        _check_bulk_quota(c, guild_id, merged)
+
+
+def save_uploads_bulk(
+    guild_id: int,
+    items: list[tuple[str, str, str, int, int | None, int | None]],
+    bindings: list[tuple[str, str]] = (),
+    uploaded_by: int | None = None,
+) -> dict[str, list[str] | int]:
+    """
+    store_blob 済みのアップロードをまとめて登録する。items は (name, sha256, ext, size, uploaded_by, uploaded_at)
+    （uploaded_by / uploaded_at が None なら引数の uploaded_by と現在時刻）、bindings は (reaction_key, upload_name)。
+    uploads・blobs・reaction_upload の更新は 1 トランザクション。上限を超える場合は何もせず ValueError。
+    返り値: saved（登録した名前）、missing（blob が消えていて登録できなかった名前）、bindings（紐付け件数）。
+    """
+    now = int(time.time())
+    by_name: dict[str, tuple[str, str, int, int | None, int | None]] = {}
+    for name, sha, ext, size, by, at in items:
+        by_name[_sanitize_name(name)] = (sha, ext.lower(), size, by, at)
+    saved: list[str] = []
+    missing: list[str] = []
+    purge: set[str] = set()
+    legacy_files: list[str] = []
+    with _blob_lock:
+        with _conn() as c:
+            existing = {
+                row[0]: (row[1], row[2], row[3] or 0)
+                for row in c.execute(
+                    """
+                    SELECT u.name, u.blob_sha, u.file_path, b.size
+                    FROM uploads u LEFT JOIN blobs b ON b.sha256 = u.blob_sha
+                    WHERE u.guild_id = ?
+                    """,
+                    (guild_id,),
+                )
+            }
+            kept = {n: v for n, v in existing.items() if n not in by_name}
+            _check_bulk_quota(c, guild_id, {n: v[2] for n, v in by_name.items()})
+            for name, (sha, ext, size, by, at) in by_name.items():
+                path = _existing_blob_path(sha, ext)
+                if not path.is_file():
+                    missing.append(name)
+                    continue
+                c.execute(
+                    "INSERT OR IGNORE INTO blobs (sha256, ext, size, refcount, created_at) VALUES (?, ?, ?, 0, ?)",
+                    (sha, ext, size, now),
+                )
+                c.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha,))
+                old = existing.get(name)
+                if old and old[0]:
+                    _release_blob(c, old[0])
+                    if old[0] != sha:
+                        purge.add(old[0])
+                elif old and old[1] != str(path):
+                    legacy_files.append(old[1])
+                c.execute(
+                    "INSERT OR REPLACE INTO uploads (guild_id, name, file_path, uploaded_by, uploaded_at, blob_sha) VALUES (?, ?, ?, ?, ?, ?)",
+                    (guild_id, name, str(path), by if by is not None else uploaded_by, at or now, sha),
+                )
+                saved.append(name)
+            names = set(kept) | set(saved)
+            bound = [(key, _sanitize_name(upload_name)) for key, upload_name in bindings]
+            bound = [(key, upload_name) for key, upload_name in bound if key and upload_name in names]
+            c.executemany(
+                "INSERT OR REPLACE INTO reaction_upload (guild_id, reaction_key, upload_name) VALUES (?, ?, ?)",
+                [(guild_id, key, upload_name) for key, upload_name in bound],
+            )
+        for sha in purge:
+            _purge_blob(sha)
+    for old_path in legacy_files:
+        try:
+            Path(old_path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("[upload_store] bulk save: could not unlink legacy file %s: %s", old_path, e)
+    logger.info(
+        "[upload_store] bulk save guild_id=%s saved=%d missing=%d bindings=%d by=%s",
+        guild_id, len(saved), len(missing), len(bound), uploaded_by,
+    )
+    return {"saved": saved, "missing": missing, "bindings": len(bound)}
+
+
+def list_uploads_for_export(guild_id: int) -> list[tuple[str, Path, int | None, int | None]]:
+    """その guild のアップロード (name, 実体のパス, uploaded_by, uploaded_at) の昇順（エクスポート用）。"""
+    with _conn() as c:
+        rows = c.execute(
+            "SELECT name, file_path, uploaded_by, uploaded_at FROM uploads WHERE guild_id = ? ORDER BY name",
+            (guild_id,),
+        ).fetchall()
+    out = []
+    for name, file_path, by, at in rows:
+        p = Path(file_path)
+        out.append((name, p if p.is_absolute() else Path.cwd() / p, by, at))
+    return out
+
+
 def get_upload_path(guild_id: int, name: str) -> Path | None:
     """登録済みのアップロードの絶対パス。無ければ None。"""
     with _conn() as c:
@@ -131,6 +531,54 @@ def list_uploads_with_meta(guild_id: int) -> list[tuple[str, int | None, int | N
         return [(r[0], r[1], r[2]) for r in cur.fetchall()]
 
 
+def _page_query(guild_id: int, after: str | None, before: str | None, limit: int) -> tuple[str, tuple]:
+    """list_uploads_page の SQL とパラメータ（before があれば逆順に読む）。"""
+    if before is not None:
+        cond, order, cursor = "name < ?", "DESC", before
+    else:
+        cond, order, cursor = "name > ?", "ASC", after or ""
+    sql = f"""
+        WITH page AS (
+            SELECT name, uploaded_by, uploaded_at FROM uploads
+            WHERE guild_id = ? AND {cond}
+            ORDER BY name {order}
+            LIMIT ?
+        )
+        SELECT page.name, page.uploaded_by, page.uploaded_at, r.reaction_key
+        FROM page
+        LEFT JOIN reaction_upload AS r ON r.guild_id = ? AND r.upload_name = page.name
+        ORDER BY page.name, r.reaction_key
+    """
+    return sql, (guild_id, cursor, limit + 1, guild_id)
+
+
+def list_uploads_page(
+    guild_id: int,
+    *,
+    after: str | None = None,
+    before: str | None = None,
+    limit: int = 15,
+) -> tuple[list[tuple[str, int | None, int | None, list[str]]], bool]:
+    """
+    アップロード一覧の 1 ページ（名前の昇順、キーセット方式）。after を渡すとその名前より後、
+    before を渡すとその名前より前の limit 件。各行は (name, uploaded_by, uploaded_at, [reaction_key...])。
+    返り値の 2 つ目は、同じ向きにまだ続きがあるか。読むのはページ分の行とその紐付けだけ。
+    """
+    with _conn() as c:
+        cur = c.execute(*_page_query(guild_id, after, before, limit))
+        rows: list[tuple[str, int | None, int | None, list[str]]] = []
+        for name, uploaded_by, uploaded_at, reaction_key in cur.fetchall():
+            if not rows or rows[-1][0] != name:
+                rows.append((name, uploaded_by, uploaded_at, []))
+            if reaction_key is not None:
+                rows[-1][3].append(reaction_key)
+    has_more = len(rows) > limit
+    if has_more:
+        # 余分に 1 件読んだのは続きの有無を知るため。向きに応じて端を落とす
+        rows = rows[1:] if before is not None else rows[:limit]
+    return rows, has_more
+
+
 def set_reaction_upload(guild_id: int, reaction_key: str, upload_name: str) -> None:
     """リアクション reaction_key で upload_name を再生するように設定。"""
     with _conn() as c:
@@ -174,21 +622,171 @@ def list_all_reaction_uploads(guild_id: int) -> list[tuple[str, str]]:
 
 def delete_upload(guild_id: int, name: str) -> bool:
     """
-    アップロードを削除する。ファイル削除・reaction_upload の該当行削除・uploads の行削除。
+    アップロードを削除する。reaction_upload の該当行・uploads の行を 1 トランザクションで削除し、
+    参照が無くなった blob（旧形式ならそのファイル）を消す。ファイルが消せなくても DB は整合し、残りは gc() が回収する。
     存在しない name の場合は ValueError。返り値は True。
     """
-    path = get_upload_path(guild_id, name)
-    if not path:
-        raise ValueError(f"`{name}` というアップロードは見つかりません。")
-    with _conn() as c:
-        c.execute(
-            "DELETE FROM reaction_upload WHERE guild_id = ? AND upload_name = ?",
-            (guild_id, name),
-        )
-        c.execute("DELETE FROM uploads WHERE guild_id = ? AND name = ?", (guild_id, name))
+    with _blob_lock:
+        with _conn() as c:
+            row = c.execute(
+                "SELECT blob_sha, file_path FROM uploads WHERE guild_id = ? AND name = ?",
+                (guild_id, name),
+            ).fetchone()
+            if not row:
+                raise ValueError(f"`{name}` というアップロードは見つかりません。")
+            c.execute(
+                "DELETE FROM reaction_upload WHERE guild_id = ? AND upload_name = ?",
+                (guild_id, name),
+            )
+            c.execute("DELETE FROM uploads WHERE guild_id = ? AND name = ?", (guild_id, name))
+            if row[0]:
+                _release_blob(c, row[0])
+        if row[0]:
+            _purge_blob(row[0])
+    if not row[0]:
+        path = Path(row[1])
+        try:
+            path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("[upload_store] delete: could not unlink %s: %s", path, e)
+    logger.info("[upload_store] delete guild_id=%s name=%s", guild_id, name)
+    return True
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _old_enough(path: Path, now: float) -> bool:
     try:
-        path.unlink(missing_ok=True)
+        return now - path.stat().st_mtime > ORPHAN_GRACE_SEC
+    except OSError:
+        return False
+
+
+def _adopt_legacy(guild_id: int, name: str, src: Path, now: float) -> bool:
+    """旧形式の 1 行を blobs に移す。ハッシュ計算はロックの外で行う。"""
+    ext = src.suffix.lstrip(".").lower()
+    try:
+        sha = _file_sha256(src)
     except OSError as e:
-        logger.warning("[upload_store] delete: could not unlink %s: %s", path, e)
-    logger.info("[upload_store] delete guild_id=%s name=%s", guild_id, name)
+        logger.warning("[upload_store] gc: could not hash %s: %s", src, e)
+        return False
+    with _blob_lock:
+        with _conn() as c:
+            row = c.execute(
+                "SELECT file_path FROM uploads WHERE guild_id = ? AND name = ? AND blob_sha IS NULL",
+                (guild_id, name),
+            ).fetchone()
+        if not row or Path(row[0]) != src:
+            return False
+        dst = _existing_blob_path(sha, ext)
+        try:
+            if not dst.is_file():
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, dst)
+            size = dst.stat().st_size
+        except OSError as e:
+            logger.warning("[upload_store] gc: could not adopt %s: %s", src, e)
+            return False
+        with _conn() as c:
+            c.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, ext, size, refcount, created_at) VALUES (?, ?, ?, 0, ?)",
+                (sha, ext, size, int(now)),
+            )
+            c.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha,))
+            c.execute(
+                "UPDATE uploads SET blob_sha = ?, file_path = ? WHERE guild_id = ? AND name = ?",
+                (sha, str(dst), guild_id, name),
+            )
+    if src.exists():
+        try:
+            src.unlink()
+        except OSError:
+            pass
     return True
+
+
+def gc() -> dict[str, int]:
+    """
+    DB とディスクの突き合わせ（fsck + GC）。返り値は各処理の件数。
+    1) 旧形式の行を blobs に移す（同じ内容は 1 つにまとめる）
+    2) refcount を uploads から数え直す
+    3) ファイルが無い uploads 行（と紐付け）を消す（欠損が多すぎるときは中止）
+    4) 参照 0 の blob を消す
+    5) DB から参照されていない blobs/ ・ uploads/ 以下のファイルを消す（ORPHAN_GRACE_SEC より古いもの）
+    ロックは段階ごとに取り、ハッシュ計算やディレクトリ走査の間は save_upload / delete_upload を止めない。
+    """
+    report = {"adopted": 0, "refcount_fixed": 0, "missing_rows": 0, "purged_blobs": 0, "orphan_files": 0}
+    now = time.time()
+
+    # 1) 旧形式（blob_sha が NULL）の行を blobs に移す
+    with _conn() as c:
+        legacy = c.execute("SELECT guild_id, name, file_path FROM uploads WHERE blob_sha IS NULL").fetchall()
+    for guild_id, name, file_path in legacy:
+        src = Path(file_path)
+        if src.is_file() and _adopt_legacy(guild_id, name, src, now):
+            report["adopted"] += 1
+
+    with _blob_lock:
+        # 2) refcount を数え直す
+        with _conn() as c:
+            cur = c.execute(
+                """
+                UPDATE blobs SET refcount = (SELECT COUNT(*) FROM uploads u WHERE u.blob_sha = blobs.sha256)
+                WHERE refcount != (SELECT COUNT(*) FROM uploads u WHERE u.blob_sha = blobs.sha256)
+                """
+            )
+            report["refcount_fixed"] = cur.rowcount
+
+        # 3) ファイルが無い uploads 行
+        with _conn() as c:
+            rows = c.execute("SELECT guild_id, name, file_path, blob_sha FROM uploads").fetchall()
+        missing = [(g, n, sha) for g, n, p, sha in rows if not Path(p).is_file()]
+        if missing and len(missing) > len(rows) * MISSING_ABORT_RATIO:
+            logger.error(
+                "[upload_store] gc: %d/%d upload files missing; storage not mounted? skipping row cleanup",
+                len(missing), len(rows),
+            )
+        elif missing:
+            with _conn() as c:
+                for guild_id, name, sha in missing:
+                    c.execute("DELETE FROM reaction_upload WHERE guild_id = ? AND upload_name = ?", (guild_id, name))
+                    c.execute("DELETE FROM uploads WHERE guild_id = ? AND name = ?", (guild_id, name))
+                    if sha:
+                        _release_blob(c, sha)
+                    logger.warning("[upload_store] gc: removed row with missing file guild_id=%s name=%s", guild_id, name)
+            report["missing_rows"] = len(missing)
+
+        # 4) 参照 0 の blob
+        with _conn() as c:
+            zero = [r[0] for r in c.execute("SELECT sha256 FROM blobs WHERE refcount <= 0").fetchall()]
+        for sha in zero:
+            if _purge_blob(sha):
+                report["purged_blobs"] += 1
+
+    # 5) DB から参照されていないファイル（走査はロックの外、削除判定は DB を読み直してロック内で）
+    on_disk = []
+    if BLOB_DIR.is_dir():
+        on_disk += [p for p in BLOB_DIR.glob("*/*") if p.is_file() and _old_enough(p, now)]
+    if UPLOAD_DIR.is_dir():
+        on_disk += [p for p in UPLOAD_DIR.glob("*/*") if p.is_file() and _old_enough(p, now)]
+    if on_disk:
+        with _blob_lock:
+            with _conn() as c:
+                known = {_blob_path(sha, ext) for sha, ext in c.execute("SELECT sha256, ext FROM blobs")}
+                known.update(Path(r[0]) for r in c.execute("SELECT file_path FROM uploads"))
+            for p in on_disk:
+                if p in known:
+                    continue
+                try:
+                    p.unlink()
+                    report["orphan_files"] += 1
+                except OSError as e:
+                    logger.warning("[upload_store] gc: could not unlink orphan %s: %s", p, e)
+    logger.info("[upload_store] gc %s", " ".join(f"{k}={v}" for k, v in report.items()))
+    return report
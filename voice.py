@@ -6,122 +6,687 @@ import json
 import logging
 import os
 import random
-import re
+import tempfile
 import time
-from datetime import datetime, timezone
-
-from emoji import demojize, emojize
+import zipfile
+from datetime import datetime, timedelta, timezone
 
 import discord
 from discord import app_commands
-from discord.ext import commands
-
+from discord.ext import commands, tasks
+
+import artifact_cache
+import bulk_io
+import emoji_scan
+import name_index
+import overload
+import play_stats
+import ratelimit
 import reaction_db
+import startup_profile
 import upload_store
+import voice_session
 
 CONFIG_PATH = "config.json"
 SOUNDS_BASE_DEFAULT = "/app"  # Docker の WORKDIR 想定
+# 熱盛シーケンス（SPEC §7）で使う音源（sounds_base/sounds 以下）
+ATSUMORI_FILES = (
+    "atsumori_std.wav",
+    "atsumori_long.wav",
+    "apologize.wav",
+    "apologize_1.wav",
+    "apologize_3.wav",
+    "situreisimasita.wav",
+    "situreisimasita_1.wav",
+    "situreisimasita_3.wav",
+    "ussr.wav",
+)
+# on_ready 後の warmup: 先読みする guild 数と、ページキャッシュに載せる音源の合計上限
+WARMUP_GUILDS = int(os.environ.get("WARMUP_GUILDS", "50"))
+WARMUP_MAX_BYTES = int(os.environ.get("WARMUP_MAX_MB", "256")) * 1024 * 1024
+# 再生回数（play_stats）を DB に書く間隔（秒）
+PLAY_STATS_FLUSH_SEC = float(os.environ.get("PLAY_STATS_FLUSH_SEC", "60"))
+# 再生回数の多い音声を再生キャッシュに先読みする件数: 起動時（全体の上位）と、VC に参加したとき（その guild の上位）
+PREFETCH_TOP = int(os.environ.get("PREFETCH_TOP", "20"))
+PREFETCH_GUILD_TOP = int(os.environ.get("PREFETCH_GUILD_TOP", "5"))
+# 同じ guild の先読みをやり直すまでの間隔（秒）
+PREFETCH_GUILD_INTERVAL_SEC = 3600.0
+# アップロード保存領域の GC / fsck（upload_store.gc）を回す間隔
+UPLOAD_GC_INTERVAL_HOURS = float(os.environ.get("UPLOAD_GC_INTERVAL_HOURS", "6"))
+# リアクショントリガーの流量制御（件/秒・瞬間最大件数）と、同じメッセージ・ユーザー・絵文字の付け外しを 1 回とみなす窓（秒）
+TRIGGER_USER_RATE = float(os.environ.get("TRIGGER_USER_RATE", "0.5"))
+TRIGGER_USER_BURST = float(os.environ.get("TRIGGER_USER_BURST", "4"))
+TRIGGER_GUILD_RATE = float(os.environ.get("TRIGGER_GUILD_RATE", "3"))
+TRIGGER_GUILD_BURST = float(os.environ.get("TRIGGER_GUILD_BURST", "15"))
+TRIGGER_DEBOUNCE_SEC = float(os.environ.get("TRIGGER_DEBOUNCE_SEC", "2"))
+# VC が意図せず切れたとき（4006 / 4017 / 音声サーバー移動など）に同じチャンネルへ入り直す間隔（秒）。全部失敗したら諦める
+RECONNECT_DELAYS = (0.5, 1.0, 2.0, 4.0, 8.0, 15.0)
+# 再接続できてからこの秒数以内にまた切れたら、サーバー管理者による切断とみなして入り直さない
+RECONNECT_COOLDOWN_SEC = 60.0
+# 切断の前後この秒数以内に作られた「メンバーの切断」の監査ログがあれば、管理者による切断とみなす（監査ログの閲覧権限があるとき）
+DISCONNECT_AUDIT_WINDOW_SEC = 10.0
+# 再接続後もキューに残す音声の古さの上限（秒）。これより前に積まれたものは捨てる
+QUEUE_MAX_AGE_SEC = float(os.environ.get("VOICE_QUEUE_MAX_AGE_SEC", "15"))
+# /show_files の 1 ページの件数と、ページのキャッシュ期間（秒。アップロード・削除・紐付け変更で破棄）
+FILES_PAGE_SIZE = 15
+FILES_PAGE_TTL = 30.0
+# /show_all_emojis の 1 ページの本文の上限（文字数。見出しの分を Discord の 2000 文字から引いたもの）
+EMOJIS_PAGE_CHARS = 1900
 
 logger = logging.getLogger(__name__)
 
+# emoji パッケージは import だけで数十 ms かかるので、最初に使うときに読み込む
+_emoji_module = None
+
+
+def _emoji():
+    global _emoji_module
+    if _emoji_module is None:
+        with startup_profile.span("import emoji (lazy)"):
+            import emoji
+        _emoji_module = emoji
+    return _emoji_module
+
+
+def demojize(string: str, **kwargs) -> str:
+    return _emoji().demojize(string, **kwargs)
+
+
+def emojize(string: str, **kwargs) -> str:
+    return _emoji().emojize(string, **kwargs)
+
 
 def _load_config():
     with open(CONFIG_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def _warm_emoji_tables() -> None:
+    """emoji パッケージの import と、初回呼び出し時に作られる内部辞書の構築を済ませておく。"""
+    emojize(":hot_springs:", language="alias")
+    demojize("\u2668\ufe0f", delimiters=("", ""))
+
+
+def _warm_files(paths: list[str], budget: int) -> tuple[int, int]:
+    """音源ファイルを読み捨ててページキャッシュに載せる。返り値は (読んだファイル数, バイト数)。"""
+    count = 0
+    total = 0
+    for path in paths:
+        if total >= budget:
+            break
+        try:
+            with open(path, "rb") as f:
+                while total < budget:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+            count += 1
+        except OSError:
+            continue
+    return count, total
+
+
+class CachedPCMAudio(discord.PCMAudio):
+    """artifact_cache のデコード済み PCM を読む AudioSource。FFmpeg を起動しない。"""
+
+    def cleanup(self) -> None:
+        self.stream.close()
+
+
+def make_audio_source(path: str) -> discord.AudioSource:
+    """
+    再生用の AudioSource を作る。Cog とベンチマーク（bench/audio_pacing.py）で共通。
+    デコード済み PCM がキャッシュにあればそれを、無ければ FFmpeg でデコードしながら再生する。
+    """
+    pcm = artifact_cache.lookup_pcm(path)
+    if pcm is not None:
+        try:
+            return CachedPCMAudio(open(pcm, "rb"))
+        except OSError:
+            pass
+    return discord.FFmpegPCMAudio(path, stderr=False)
+
+
+class UploadListView(discord.ui.View):
+    """/show_files のページ送りボタン。押されたページだけ読み込んで描画する。"""
+
+    def __init__(self, cog: "Voice", guild: discord.Guild, rows: list, has_next: bool):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.guild = guild
+        self.page = 1
+        self.first_name = rows[0][0]
+        self.last_name = rows[-1][0]
+        self.message: discord.Message | None = None
+        self._set_buttons(has_prev=False, has_next=has_next)
+
+    def _set_buttons(self, *, has_prev: bool, has_next: bool) -> None:
+        self.prev_page.disabled = not has_prev
+        self.next_page.disabled = not has_next
+
+    async def _show(self, interaction: discord.Interaction, *, after: str | None = None, before: str | None = None) -> None:
+        rows, has_more = await self.cog._upload_page(self.guild.id, after=after, before=before)
+        if before is not None:
+            self.page = self.page - 1 if has_more else 1
+            has_prev, has_next = has_more, True
+        else:
+            self.page += 1
+            has_prev, has_next = True, has_more
+        if not rows:
+            # 表示中に削除されて前後が無くなった → 先頭ページから出し直す
+            rows, has_more = await self.cog._upload_page(self.guild.id)
+            self.page = 1
+            has_prev, has_next = False, has_more
+        if not rows:
+            await interaction.response.edit_message(content="アップロードされた音声はありません。", view=None)
+            self.stop()
+            return
+        self.first_name, self.last_name = rows[0][0], rows[-1][0]
+        self._set_buttons(has_prev=has_prev, has_next=has_next)
+        await interaction.response.edit_message(content=self.cog._render_upload_page(self.guild, rows, self.page), view=self)
+
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, before=self.first_name)
+
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, after=self.last_name)
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        self._set_buttons(has_prev=False, has_next=False)
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
+
+
+def paginate_lines(lines: list[str], limit: int = EMOJIS_PAGE_CHARS) -> list[list[str]]:
+    """行を、改行込みで limit 文字に収まるページに分ける（行の途中では切らない。limit を超える 1 行はそのまま 1 ページ）。"""
+    pages: list[list[str]] = []
+    page: list[str] = []
+    size = 0
+    for line in lines:
+        if page and size + len(line) + 1 > limit:
+            pages.append(page)
+            page, size = [], 0
+        page.append(line)
+        size += len(line) + 1
+    if page:
+        pages.append(page)
+    return pages
+
+
+class EmojiListView(discord.ui.View):
+    """/show_all_emojis のページ送りボタン。一覧は送信時に組み立て、1 メッセージに収まるページに分けて持つ。"""
+
+    def __init__(self, pages: list[list[str]]):
+        super().__init__(timeout=300)
+        self.pages = pages
+        self.index = 0
+        self.message: discord.Message | None = None
+        self._set_buttons()
+
+    def render(self) -> str:
+        header = f"**反応する絵文字一覧**（{self.index + 1} / {len(self.pages)} ページ）"
+        return "\n".join([header, *self.pages[self.index]])
+
+    def _set_buttons(self) -> None:
+        self.prev_page.disabled = self.index == 0
+        self.next_page.disabled = self.index >= len(self.pages) - 1
+
+    async def _show(self, interaction: discord.Interaction, index: int) -> None:
+        self.index = max(0, min(index, len(self.pages) - 1))
+        self._set_buttons()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary)
+    async def prev_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.index - 1)
+
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.index + 1)
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        self.prev_page.disabled = self.next_page.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
+
+
 class Voice(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        config = _load_config()
-        self._emoji_list = config.get("emoji_list", {})
-        self._server_emoji_list = config.get("server_emoji_list", {})
-        raw_base = config.get("sounds_base", os.environ.get("SOUNDS_BASE", SOUNDS_BASE_DEFAULT))
-        self._sounds_base = os.path.abspath(raw_base) if raw_base in (".", "") else raw_base
-        # 再生キューは guild 単位で管理（SPEC §5.1, §9.2）
-        self._queue: dict[int, list[str]] = {}
+        # config の読み込みと DB の初期化は cog_load でスレッドに逃がして並行に行う
+        self._emoji_list: dict = {}
+        self._server_emoji_list: dict = {}
+        self._sounds_base = SOUNDS_BASE_DEFAULT
+        # VC セッション（(guild, チャンネル) ごとの VoiceClient・再生キュー・状態。SPEC §5.1, §9.2）。
+        # connect / 退出 / 切断イベントで更新し、bot.voice_clients は走査しない
+        self._sessions = voice_session.Registry()
+        self._session_counts = {"drops": 0, "reconnects": 0, "gave_up": 0, "kicked": 0, "recover_sec_total": 0.0, "recover_sec_max": 0.0}
+        # guild_id → {監査ログ「メンバーの切断」のエントリ ID: 件数}。同じ管理者の切断は 1 つのエントリの件数が増えるだけなので、
+        # 接続時に控えておき、切れたときに増えていれば管理者による切断とみなす
+        self._disconnect_audit: dict[int, dict[int, int]] = {}
         # 429 対策: message_id → (Message, 取得時刻). TTL 30s, 最大 100 件
         self._message_cache: dict[tuple[int, int], tuple[discord.Message, float]] = {}
         self._message_cache_ttl = 30.0
         self._message_cache_max = 100
-        reaction_db.init()
-        upload_store.init()
+        # guild_id → {reaction_key: upload_name}。初回参照時（または warmup）に DB から読み、書き込み時に更新する
+        self._trigger_tables: dict[int, dict[str, str]] = {}
+        # guild_id → (元にしたトリガー表, on_message の照合規則)。表のオブジェクトが変われば作り直す
+        self._message_rule_cache: dict[int, tuple[dict[str, str], emoji_scan.TriggerRules]] = {}
+        # guild_id → アップロード名の索引（autocomplete 用）。初回参照時（または warmup）に DB から読み、保存・削除時に更新する
+        self._upload_names: dict[int, name_index.NameIndex] = {}
+        # guild_id → {(after, before): (取得時刻, (rows, has_more))}。/show_files のページ
+        self._file_pages: dict[int, dict[tuple[str | None, str | None], tuple[float, tuple[list, bool]]]] = {}
+        # guild_id → {サーバー絵文字名: Emoji}。guild.emojis の線形探索を避ける。絵文字更新イベントで破棄
+        self._guild_emoji_index: dict[int, dict[str, discord.Emoji]] = {}
+        self._warmup_task: asyncio.Task | None = None
+        # 裏で走らせるだけのタスク（PCM デコード・先読み・再生開始待ち）。参照を持っていないと途中で GC されるので、終わるまでここに置く
+        self._background_tasks: set[asyncio.Task] = set()
+        # PCM デコード中の元ファイル（同じファイルを二重にデコードしない）
+        self._prerendering: set[str] = set()
+        # guild_id → 最後に再生回数の上位を先読みした時刻
+        self._prefetched_at: dict[int, float] = {}
+        # リアクショントリガーの流量制御。fetch_message / fetch_member / DB / キューより前で落とす
+        self._trigger_debounce = ratelimit.Debouncer(TRIGGER_DEBOUNCE_SEC)
+        self._trigger_user_bucket = ratelimit.TokenBucket(TRIGGER_USER_RATE, TRIGGER_USER_BURST)
+        self._trigger_guild_bucket = ratelimit.TokenBucket(TRIGGER_GUILD_RATE, TRIGGER_GUILD_BURST)
+        self._trigger_counts = {"accepted": 0, "debounced": 0, "user_limited": 0, "guild_limited": 0}
+        # 過負荷時の縮退（OVERLOAD_CONTROL=0 で無効。そのときはレベル 0 のまま）
+        self.overload = overload.Controller()
+        self._rate_limit_counter = overload.RateLimitCounter()
+        self._overload_task: asyncio.Task | None = None
+
+    async def cog_load(self):
+        config, _, _, _, _ = await asyncio.gather(
+            asyncio.to_thread(startup_profile.timed("voice: load config", _load_config)),
+            asyncio.to_thread(startup_profile.timed("voice: reaction_db.init", reaction_db.init)),
+            asyncio.to_thread(startup_profile.timed("voice: upload_store.init", upload_store.init)),
+            asyncio.to_thread(startup_profile.timed("voice: artifact_cache.init", artifact_cache.init)),
+            asyncio.to_thread(startup_profile.timed("voice: play_stats.init", play_stats.init)),
+        )
+        self._emoji_list = config.get("emoji_list", {})
+        self._server_emoji_list = config.get("server_emoji_list", {})
+        raw_base = config.get("sounds_base", os.environ.get("SOUNDS_BASE", SOUNDS_BASE_DEFAULT))
+        self._sounds_base = os.path.abspath(raw_base) if raw_base in (".", "") else raw_base
+        self._upload_gc_loop.start()
+        self._play_stats_loop.start()
+        if overload.ENABLED:
+            logging.getLogger("discord.http").addHandler(self._rate_limit_counter)
+            self._overload_task = asyncio.create_task(
+                overload.monitor(self.overload, self._queued_total, self._rate_limit_counter)
+            )
+
+    async def cog_unload(self):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        for task in list(self._background_tasks):
+            task.cancel()
+        for session in self._sessions:
+            if session.reconnect_task is not None:
+                session.reconnect_task.cancel()
+        self._upload_gc_loop.cancel()
+        self._play_stats_loop.cancel()
+        if self._overload_task is not None:
+            self._overload_task.cancel()
+            logging.getLogger("discord.http").removeHandler(self._rate_limit_counter)
+        await self._flush_play_stats()
+
+    @tasks.loop(hours=UPLOAD_GC_INTERVAL_HOURS)
+    async def _upload_gc_loop(self):
+        try:
+            report = await asyncio.to_thread(upload_store.gc)
+        except Exception:
+            logger.exception("[upload_store] gc failed")
+            return
+        if report["missing_rows"]:
+            # gc が uploads / reaction_upload の行を消したので読み直させる
+            self._trigger_tables.clear()
+            self._upload_names.clear()
+            self._file_pages.clear()
+
+    @_upload_gc_loop.before_loop
+    async def _before_upload_gc_loop(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(seconds=PLAY_STATS_FLUSH_SEC)
+    async def _play_stats_loop(self):
+        await self._flush_play_stats()
+
+    async def _flush_play_stats(self) -> None:
+        try:
+            await asyncio.to_thread(play_stats.flush)
+        except Exception:
+            logger.exception("[play_stats] flush failed")
 
     def _resolve_path(self, path: str) -> str:
         if os.path.isabs(path):
             return path
         return os.path.join(self._sounds_base, path)
 
-    @staticmethod
-    def _normalize_emoji_text(s: str) -> str:
-        """Variation selector (U+FE0F) を除いて比較用に正規化する。"""
-        return s.replace("\ufe0f", "")
+    def _trigger_table(self, guild_id: int) -> dict[str, str]:
+        """その guild の reaction_key → upload_name。未読み込みなら DB から読む。"""
+        table = self._trigger_tables.get(guild_id)
+        if table is None:
+            table = dict(upload_store.list_all_reaction_uploads(guild_id))
+            self._trigger_tables[guild_id] = table
+        return table
 
-    def _content_contains_reaction(self, content_raw: str, rk: str) -> bool:
-        """
-        本文に reaction_key が含まれるか。後方互換のため
-        1) rk がそのまま含まれる 2) rk が ASCII alias なら emojize した文字が含まれる
-        3) variation selector の有無を吸収して比較する。
-        """
-        if not rk:
-            return False
-        if rk in content_raw:
-            return True
-        if rk.isascii():
-            emoji_char = emojize(f":{rk}:", language="alias")
-            if emoji_char and emoji_char != f":{rk}:":
-                if emoji_char in content_raw:
-                    return True
-                if self._normalize_emoji_text(emoji_char) in self._normalize_emoji_text(content_raw):
-                    return True
-        return False
+    @staticmethod
+    def _alias_to_emoji(key: str) -> str | None:
+        """ASCII の alias（例: cat）を Unicode 絵文字にしたもの。alias でなければ None。"""
+        char = emojize(f":{key}:", language="alias")
+        return char if char and char != f":{key}:" else None
+
+    def _message_rules(self, guild_id: int) -> emoji_scan.TriggerRules:
+        """その guild の本文照合の規則。トリガー表が作り直されたか、書き換えで捨てられたら作り直す。"""
+        table = self._trigger_table(guild_id)
+        cached = self._message_rule_cache.get(guild_id)
+        if cached is not None and cached[0] is table:
+            return cached[1]
+        rules = emoji_scan.TriggerRules(table, self._alias_to_emoji)
+        self._message_rule_cache[guild_id] = (table, rules)
+        return rules
+
+    def _upload_name_index(self, guild_id: int) -> name_index.NameIndex:
+        """その guild のアップロード名の索引。未読み込みなら DB から読む。"""
+        index = self._upload_names.get(guild_id)
+        if index is None:
+            index = name_index.NameIndex(upload_store.list_uploads(guild_id))
+            self._upload_names[guild_id] = index
+        return index
+
+    def _build_guild_emoji_index(self, guild: discord.Guild) -> dict[str, discord.Emoji]:
+        index: dict[str, discord.Emoji] = {}
+        for em in guild.emojis:
+            index.setdefault(em.name, em)
+        self._guild_emoji_index[guild.id] = index
+        return index
+
+    def _guild_emoji(self, guild: discord.Guild, name: str) -> discord.Emoji | None:
+        """guild のサーバー絵文字を名前で引く。同名が複数あれば guild.emojis の先頭。"""
+        index = self._guild_emoji_index.get(guild.id)
+        if index is None:
+            index = self._build_guild_emoji_index(guild)
+        return index.get(name)
 
     # --- Voice 接続管理（SPEC §4） ---
 
     def get_guild_vc(self, guild: discord.Guild):
         """同一 guild 内で接続中の VC を 1 つ返す。なければ None。"""
-        for vc in self.bot.voice_clients:
-            if vc.guild and vc.guild.id == guild.id:
-                return vc
-        return None
+        session = self._sessions.connected(guild.id)
+        return session.vc if session is not None else None
 
     def get_vc(self, voice_channel: discord.VoiceChannel):
-        for vc in self.bot.voice_clients:
-            if vc.channel == voice_channel:
-                return vc
+        session = self._sessions.get(voice_channel.guild.id, voice_channel.id)
+        if session is not None and session.state == voice_session.CONNECTED:
+            return session.vc
         return None
 
     async def _connect(self, voice_channel: discord.VoiceChannel | None):
         if not voice_channel:
             return None
+        for recovering in self._sessions.in_guild(voice_channel.guild.id):
+            if recovering.is_recovering():
+                # 再接続中に二重に connect しない。終わるのを待ってから改めて判定する。
+                # 再接続が諦め・退出で cancel されても、その CancelledError は呼び出し側に持ち込まない（asyncio.wait は結果を投げない）
+                await asyncio.wait({recovering.reconnect_task})
         vc = self.get_vc(voice_channel)
-        if not vc:
-            logger.info("[op] connect | begin guild_id=%s channel_id=%s", voice_channel.guild.id, voice_channel.id)
+        if vc:
+            return vc
+        session = self._sessions.open(voice_channel.guild.id, voice_channel.id)
+        # connect は 1 つのタスクにして、同じチャンネルへ同時に来た呼び出しはそれを待つ。
+        # 待つのは asyncio.wait なので、どれか 1 つの呼び出し（最初の呼び出しも含む）が cancel されても connect は止まらない
+        task = session.connect_task
+        owner = not (session.state == voice_session.CONNECTING and task is not None)
+        if owner:
+            session.transition(voice_session.CONNECTING)
+            task = session.connect_task = self._spawn(self._open_session(session, voice_channel))
+        await asyncio.wait({task})
+        if task.cancelled():
+            return self.get_vc(voice_channel)
+        if task.exception() is not None:
+            # 失敗は connect を始めた呼び出しにだけ投げる（待っていた側は接続できなかったものとして扱う）
+            if owner:
+                raise task.exception()
+            return self.get_vc(voice_channel)
+        return task.result()
+
+    async def _open_session(self, session: voice_session.VoiceSession, voice_channel: discord.VoiceChannel) -> discord.VoiceClient:
+        logger.info("[op] connect | begin guild_id=%s channel_id=%s", voice_channel.guild.id, voice_channel.id)
+        try:
             vc = await voice_channel.connect(reconnect=False)
-            self._queue[vc.guild.id] = []
-            await asyncio.sleep(0.8)
-            logger.info("[op] connect | done guild_id=%s channel_id=%s at=%.3f", vc.guild.id, vc.channel.id if vc.channel else None, time.monotonic())
+        except BaseException:
+            if session.state == voice_session.CONNECTING:
+                self._sessions.remove(session)
+            raise
+        finally:
+            session.connect_task = None
+        session.attach(vc)
+        self._trim_queue(session)
+        self._schedule_guild_prefetch(vc.guild.id)
+        self._spawn(self._snapshot_disconnect_audit(vc.guild))
+        await asyncio.sleep(0.8)
+        logger.info("[op] connect | done guild_id=%s channel_id=%s at=%.3f", vc.guild.id, vc.channel.id if vc.channel else None, time.monotonic())
         return vc
 
-    def _clear_queue_for_guild(self, guild_id: int) -> None:
-        if guild_id in self._queue:
-            del self._queue[guild_id]
+    async def _disconnect(self, vc: discord.VoiceClient) -> None:
+        """自分から退出する（コマンドによる退出）。セッション監視は再接続しない。"""
+        session = self._sessions.of(vc)
+        if session is not None:
+            session.left_at = time.monotonic()
+            session.detach(voice_session.LEAVING)
+            session.queue.clear()
+            if session.reconnect_task is not None:
+                session.reconnect_task.cancel()
+                session.reconnect_task = None
+        await vc.disconnect()
 
-    # --- 再生キュー管理（SPEC §5.1） ---
+    def _queued_total(self) -> int:
+        """全セッションの再生キューに積まれている件数（過負荷の判定用）。"""
+        return self._sessions.queued_total()
 
-    def _dequeue(self, guild_id: int) -> str | None:
-        if guild_id not in self._queue or not self._queue[guild_id]:
+    def _admit_play(self, vc: discord.VoiceClient) -> bool:
+        """過負荷の縮退レベルに応じて、再生要求を受けるか（キューが詰まったセッション・要求の多い guild を落とす）。"""
+        session = self._sessions.of(vc)
+        if self.overload.allow_play(vc.guild.id, len(session.queue) if session is not None else 0):
+            return True
+        logger.info("[op] play_shed | guild_id=%s level=%d", vc.guild.id, self.overload.level)
+        return False
+
+    def _trim_queue(self, session: voice_session.VoiceSession) -> int:
+        """QUEUE_MAX_AGE_SEC より前に積まれた音声を捨てる。残った件数を返す。"""
+        dropped = session.trim(QUEUE_MAX_AGE_SEC)
+        if dropped:
+            logger.info("[op] queue_trim | guild_id=%s dropped=%d kept=%d", session.guild_id, dropped, len(session.queue))
+        return len(session.queue)
+
+    # --- セッション監視（意図しない切断からの復帰） ---
+
+    def _on_voice_dropped(self, guild: discord.Guild, channel_id: int) -> None:
+        session = self._sessions.get(guild.id, channel_id)
+        if session is None:
+            logger.debug("[op] voice_disconnected | no session guild_id=%s channel_id=%s", guild.id, channel_id)
+            return
+        if session.state == voice_session.LEAVING:
+            self._sessions.remove(session)
+            return
+        left_at, session.left_at = session.left_at, None
+        if left_at is not None and time.monotonic() - left_at < 30.0:
+            # 退出してすぐ入り直した。この切断イベントは前の接続のもの
+            return
+        if session.state != voice_session.CONNECTED:
+            return
+        self._session_counts["drops"] += 1
+        last = session.last_recovered
+        if last is not None and time.monotonic() - last < RECONNECT_COOLDOWN_SEC:
+            # 戻った直後にまた切られた = 管理者による切断の可能性が高いので追いかけない
+            logger.info("[op] reconnect | skip (dropped again within %.0fs) guild_id=%s", RECONNECT_COOLDOWN_SEC, guild.id)
+            self._sessions.remove(session)
+            return
+        session.detach(voice_session.RECOVERING)
+        session.reconnect_task = self.bot.loop.create_task(self._recover_session(guild, session, time.monotonic()))
+
+    async def _fetch_disconnect_audit(self, guild: discord.Guild) -> list[discord.AuditLogEntry] | None:
+        """監査ログの「メンバーの切断」の新しいものから数件。閲覧権限が無い・取得に失敗したときは None。"""
+        me = guild.me
+        if me is None or not me.guild_permissions.view_audit_log:
+            return None
+        try:
+            return [e async for e in guild.audit_logs(limit=5, action=discord.AuditLogAction.member_disconnect)]
+        except (discord.Forbidden, discord.HTTPException) as e:
+            logger.debug("[op] audit_log | fetch failed guild_id=%s: %s", guild.id, e)
             return None
-        return self._queue[guild_id].pop(0)
 
-    def _enqueue_and_play(self, vc: discord.VoiceClient, path: str) -> None:
-        guild_id = vc.guild.id
-        if guild_id not in self._queue:
-            self._queue[guild_id] = []
-        self._queue[guild_id].append(path)
+    async def _snapshot_disconnect_audit(self, guild: discord.Guild) -> None:
+        """接続できたときに「メンバーの切断」の件数を控えておく（_kicked_by_moderator で増えたかを見る）。"""
+        entries = await self._fetch_disconnect_audit(guild)
+        if entries is None:
+            self._disconnect_audit.pop(guild.id, None)
+            return
+        self._disconnect_audit[guild.id] = {e.id: e.extra.count for e in entries}
+
+    async def _kicked_by_moderator(self, guild: discord.Guild, dropped_at: float) -> bool:
+        """
+        切断が管理者の操作によるものか。監査ログに切断時刻の近くに作られたエントリがあるか、控えておいたエントリの件数が増えていればそうみなす。
+        エントリには切断された相手が載らないので、同じ頃に他のメンバーが切断されていても管理者による切断と判定する（入り直さない側に倒す）。
+        閲覧権限が無ければ分からないので False（RECONNECT_COOLDOWN_SEC の判定だけになる）。
+        """
+        entries = await self._fetch_disconnect_audit(guild)
+        if entries is None:
+            return False
+        seen = self._disconnect_audit.get(guild.id, {})
+        self._disconnect_audit[guild.id] = {e.id: e.extra.count for e in entries}
+        since = discord.utils.utcnow() - timedelta(seconds=time.monotonic() - dropped_at + DISCONNECT_AUDIT_WINDOW_SEC)
+        for e in entries:
+            if e.id in seen:
+                if e.extra.count > seen[e.id]:
+                    return True
+            elif e.created_at >= since:
+                return True
+        return False
+
+    async def _recover_session(self, guild: discord.Guild, session: voice_session.VoiceSession, dropped_at: float) -> None:
+        """切れたチャンネルに人が残っている間、RECONNECT_DELAYS の間隔で入り直す。戻れたらキューの続きを流す。"""
+        try:
+            for attempt, delay in enumerate(RECONNECT_DELAYS, 1):
+                await asyncio.sleep(delay)
+                if session.state != voice_session.RECOVERING:
+                    # 退出・移動などで別の経路から状態が変わった
+                    break
+                if attempt == 1 and await self._kicked_by_moderator(guild, dropped_at):
+                    logger.info("[op] reconnect | skip (disconnected by a moderator, audit log) guild_id=%s channel_id=%s", guild.id, session.channel_id)
+                    self._session_counts["kicked"] += 1
+                    self._sessions.remove(session)
+                    return
+                if session.state != voice_session.RECOVERING:
+                    # 監査ログを待つ間に状態が変わった
+                    break
+                channel_id = session.channel_id
+                channel = guild.get_channel(channel_id)
+                if not isinstance(channel, discord.VoiceChannel) or not any(not m.bot for m in channel.members):
+                    logger.info("[op] reconnect | give up (channel empty) guild_id=%s channel_id=%s", guild.id, channel_id)
+                    self._session_counts["gave_up"] += 1
+                    self._sessions.remove(session)
+                    return
+                try:
+                    logger.info("[op] reconnect | attempt=%d guild_id=%s channel_id=%s", attempt, guild.id, channel_id)
+                    vc = await channel.connect(reconnect=False)
+                except (asyncio.TimeoutError, discord.ClientException, discord.HTTPException, OSError) as e:
+                    logger.warning("[op] reconnect | attempt=%d failed guild_id=%s: %s", attempt, guild.id, e)
+                    continue
+                session.attach(vc)
+                session.last_recovered = time.monotonic()
+                self._spawn(self._snapshot_disconnect_audit(guild))
+                recover = time.monotonic() - dropped_at
+                counts = self._session_counts
+                counts["reconnects"] += 1
+                counts["recover_sec_total"] += recover
+                counts["recover_sec_max"] = max(counts["recover_sec_max"], recover)
+                pending = self._trim_queue(session)
+                logger.info("[op] reconnect | done guild_id=%s channel_id=%s attempt=%d recover=%.2fs pending=%d", guild.id, channel_id, attempt, recover, pending)
+                if pending:
+                    self._spawn(self._delayed_play(vc))
+                return
+            else:
+                logger.warning("[op] reconnect | give up after %d attempts guild_id=%s", len(RECONNECT_DELAYS), guild.id)
+                self._session_counts["gave_up"] += 1
+                self._sessions.remove(session)
+        finally:
+            if session.reconnect_task is asyncio.current_task():
+                session.reconnect_task = None
+
+    def session_stats(self) -> dict:
+        """意図しない切断・再接続の件数（起動から累計）と復帰までの時間、状態ごとのセッション数。"""
+        counts = self._session_counts
+        states = self._sessions.counts()
+        return dict(
+            counts,
+            recover_sec_avg=counts["recover_sec_total"] / counts["reconnects"] if counts["reconnects"] else 0.0,
+            recovering=sum(1 for s in self._sessions if s.is_recovering()),
+            sessions=len(self._sessions),
+            states=states,
+        )
+
+    def structure_sizes(self) -> tuple[dict[int, dict[str, int]], dict[str, int]]:
+        """guild ごとの内部構造の件数と、guild に分けられない構造の件数（$sizes 用。リークの当たりを付ける）。"""
+        per_guild: dict[int, dict[str, int]] = {}
+
+        def add(guild_id: int, name: str, n: int) -> None:
+            if n:
+                sizes = per_guild.setdefault(guild_id, {})
+                sizes[name] = sizes.get(name, 0) + n
+
+        for session in self._sessions:
+            add(session.guild_id, "voice_session", 1)
+            add(session.guild_id, "queue", len(session.queue))
+            add(session.guild_id, "voice_client", session.vc is not None)
+            add(session.guild_id, "reconnect_task", session.reconnect_task is not None)
+        for msg, _ in self._message_cache.values():
+            add(msg.guild.id if msg.guild else 0, "message_cache", 1)
+        for guild_id, table in self._trigger_tables.items():
+            add(guild_id, "trigger_table", len(table))
+        for guild_id, index in self._upload_names.items():
+            add(guild_id, "name_index", len(index))
+        for guild_id, pages in self._file_pages.items():
+            add(guild_id, "file_pages", len(pages))
+        for guild_id, emojis in self._guild_emoji_index.items():
+            add(guild_id, "emoji_index", len(emojis))
+        shared = {
+            "debounce_keys": len(self._trigger_debounce),
+            "user_buckets": len(self._trigger_user_bucket),
+            "guild_buckets": len(self._trigger_guild_bucket),
+            "prerendering": len(self._prerendering),
+            "background_tasks": len(self._background_tasks),
+            "prefetched_guilds": len(self._prefetched_at),
+            "disconnect_audit_guilds": len(self._disconnect_audit),
+            # 登録簿に無い VoiceClient（あればセッションの取りこぼし）
+            "untracked_voice_clients": sum(1 for vc in self.bot.voice_clients if self._sessions.of(vc) is None),
+        }
+        return per_guild, shared
+
+    # --- 再生キュー管理（SPEC §5.1） ---
+
+    def _enqueue_and_play(self, vc: discord.VoiceClient, path: str) -> bool:
+        """再生キューに積む。積めなかったら False（再生回数は積めたものだけ数える）。"""
+        session = self._sessions.of(vc)
+        if session is None:
+            logger.debug("[op] enqueue skipped (no session) guild_id=%s", vc.guild.id)
+            return False
+        session.push(path)
         if not vc.is_playing():
             # 再生開始は handshake 直後より少し遅らせる（UDP/speaking/SSRC の安定待ち）
-            self.bot.loop.create_task(self._delayed_play(vc))
+            self._spawn(self._delayed_play(vc))
+        return True
 
     async def _delayed_play(self, vc: discord.VoiceClient) -> None:
         await asyncio.sleep(0.3)
@@ -132,7 +697,8 @@ class Voice(commands.Cog):
         if not vc.is_connected():
             logger.debug("[op] _vc_play skipped (not connected) guild_id=%s", vc.guild.id if vc.guild else None)
             return
-        path = self._dequeue(vc.guild.id)
+        session = self._sessions.of(vc)
+        path = session.pop() if session is not None else None
         if not path:
             return
         resolved = self._resolve_path(path)
@@ -146,16 +712,39 @@ class Voice(commands.Cog):
         def after(err):
             if err:
                 logger.warning("[op] after | Playback error: %s | guild_id=%s", err, vc.guild.id)
-                self._clear_queue_for_guild(vc.guild.id)
+                session.queue.clear()
                 return
             if vc.is_connected():
                 self._vc_play(vc)
             else:
                 logger.info("[op] after | skipped next (VC disconnected) guild_id=%s", vc.guild.id)
 
-        source = discord.FFmpegPCMAudio(resolved, stderr=False)
+        source = make_audio_source(resolved)
+        if not isinstance(source, CachedPCMAudio):
+            # 次回からは FFmpeg を起動せずに済むよう、裏で PCM にデコードしておく（_vc_play は再生スレッドからも呼ばれる）
+            self.bot.loop.call_soon_threadsafe(self._schedule_prerender, resolved)
         vc.play(source, after=after)
 
+    def _spawn(self, coro) -> asyncio.Task:
+        """裏で走らせるタスクを作り、終わるまで _background_tasks に参照を持っておく（イベントループのスレッドから呼ぶ）。"""
+        task = self.bot.loop.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def _schedule_prerender(self, path: str) -> None:
+        if artifact_cache.MAX_BYTES <= 0 or path in self._prerendering:
+            return
+        self._prerendering.add(path)
+
+        async def run():
+            try:
+                await asyncio.to_thread(artifact_cache.render_pcm, path)
+            finally:
+                self._prerendering.discard(path)
+
+        self._spawn(run())
+
     # --- 絵文字 → 音声解決（SPEC §6, §7） ---
 
     def _pick_source_from_list(self, entries: list[dict]) -> str:
@@ -171,6 +760,15 @@ class Voice(commands.Cog):
                 return e["source"]
         return entries[-1]["source"]
 
+    def _config_sound_paths(self) -> list[str]:
+        """config と熱盛シーケンスで参照する音源の絶対パス（重複なし）。"""
+        paths = [os.path.join(self._sounds_base, "sounds", name) for name in ATSUMORI_FILES]
+        for table in (self._emoji_list, self._server_emoji_list):
+            for entries in table.values():
+                for e in entries:
+                    paths.append(self._resolve_path(e["source"]))
+        return list(dict.fromkeys(paths))
+
     def _atsumori_sequence(self) -> list[str]:
         """SPEC §7: 熱盛の連続再生用シーケンス（通常・ロング・特殊の確率バリエーション）"""
         base = self._sounds_base
@@ -201,14 +799,104 @@ class Voice(commands.Cog):
             ls.append(normal)
         return ls
 
-    def play_atsumori(self, vc: discord.VoiceClient) -> None:
+    def _sound_id(self, path: str) -> str:
+        """再生回数を数えるときの音源の名前。sounds_base 以下なら相対パス（config の source と同じ形）。"""
+        rel = os.path.relpath(path, self._sounds_base)
+        return path if rel.startswith("..") else rel
+
+    def play_atsumori(self, vc: discord.VoiceClient, emoji: str | None = None) -> None:
+        if not self._admit_play(vc):
+            return
         seq = self._atsumori_sequence()
         logger.info("[op] play_atsumori | guild_id=%s files=%s", vc.guild.id, [os.path.basename(p) for p in seq])
+        counted_emoji = False
         for path in seq:
-            self._enqueue_and_play(vc, path)
+            if not self._enqueue_and_play(vc, path):
+                continue
+            # 絵文字はシーケンス 1 回につき 1 回だけ数える
+            play_stats.record(vc.guild.id, "file", self._sound_id(path), None if counted_emoji else emoji)
+            counted_emoji = True
+
+    def play_single(self, vc: discord.VoiceClient, path: str, *, upload_name: str | None = None, emoji: str | None = None) -> None:
+        if not self._admit_play(vc):
+            return
+        resolved = self._resolve_path(path)
+        if not self._enqueue_and_play(vc, resolved):
+            return
+        if upload_name:
+            play_stats.record(vc.guild.id, "upload", upload_name, emoji)
+        else:
+            play_stats.record(vc.guild.id, "file", self._sound_id(resolved), emoji)
 
-    def play_single(self, vc: discord.VoiceClient, path: str) -> None:
-        self._enqueue_and_play(vc, self._resolve_path(path))
+    # --- 再生回数の多い音声の先読み ---
+
+    def _popular_paths(self, rows: list[tuple[int, str, str, int]]) -> list[str]:
+        """play_stats.top_sounds の行を音源パスにし、再生キャッシュに無いものだけを返す（スレッドで呼ぶ）。"""
+        paths: list[str] = []
+        for guild_id, kind, sound, _plays in rows:
+            if kind == "upload":
+                found = upload_store.get_upload_path(guild_id, sound)
+                path = str(found) if found else None
+            else:
+                path = self._resolve_path(sound)
+            if path and path not in paths and os.path.isfile(path) and not artifact_cache.has_pcm(path):
+                paths.append(path)
+        return paths
+
+    async def _prefetch(self, rows: list[tuple[int, str, str, int]]) -> int:
+        """再生回数の多い音声を、再生される前に PCM にデコードしておく。FFmpeg を並べて起動しないよう 1 つずつ行う。"""
+        if artifact_cache.MAX_BYTES <= 0 or not rows:
+            return 0
+        rendered = 0
+        for path in await asyncio.to_thread(self._popular_paths, rows):
+            if path in self._prerendering:
+                continue
+            self._prerendering.add(path)
+            try:
+                if await asyncio.to_thread(artifact_cache.render_pcm, path) is not None:
+                    rendered += 1
+            finally:
+                self._prerendering.discard(path)
+        return rendered
+
+    def _schedule_guild_prefetch(self, guild_id: int) -> None:
+        """VC に参加した guild の上位の音声を裏で先読みする（同じ guild は PREFETCH_GUILD_INTERVAL_SEC に 1 回）。"""
+        if PREFETCH_GUILD_TOP <= 0:
+            return
+        now = time.monotonic()
+        last = self._prefetched_at.get(guild_id)
+        if last is not None and now - last < PREFETCH_GUILD_INTERVAL_SEC:
+            return
+        self._prefetched_at[guild_id] = now
+
+        async def run():
+            try:
+                rows = await asyncio.to_thread(play_stats.top_sounds, guild_id, PREFETCH_GUILD_TOP)
+                rendered = await self._prefetch(rows)
+            except Exception:
+                logger.exception("[prefetch] guild_id=%s failed", guild_id)
+                return
+            if rendered:
+                logger.info("[prefetch] guild_id=%s rendered=%d/%d", guild_id, rendered, len(rows))
+
+        self._spawn(run())
+
+    def _schedule_import_prefetch(self, guild_id: int, names: list[str]) -> None:
+        """一括取り込みした音声のうち先頭 PREFETCH_GUILD_TOP 件（紐付けのあるものが先）を裏で先読みする。全件はデコードしない。"""
+        if PREFETCH_GUILD_TOP <= 0 or not names:
+            return
+        rows = [(guild_id, "upload", name, 0) for name in names[:PREFETCH_GUILD_TOP]]
+
+        async def run():
+            try:
+                rendered = await self._prefetch(rows)
+            except Exception:
+                logger.exception("[prefetch] import guild_id=%s failed", guild_id)
+                return
+            if rendered:
+                logger.info("[prefetch] import guild_id=%s rendered=%d/%d", guild_id, rendered, len(rows))
+
+        self._spawn(run())
 
     # --- 429 対策: メッセージキャッシュ（fetch_message 回数削減） ---
 
@@ -264,8 +952,7 @@ class Voice(commands.Cog):
             await interaction.response.send_message("ボイスチャンネルに参加していません。", ephemeral=True)
             return
         await interaction.response.send_message("退出しています…", ephemeral=True)
-        self._clear_queue_for_guild(vc.guild.id)
-        await vc.disconnect()
+        await self._disconnect(vc)
         await interaction.edit_original_response(content="退出しました。")
         logger.info("[op] slash_leave | done guild_id=%s", interaction.guild_id)
 
@@ -313,6 +1000,9 @@ class Voice(commands.Cog):
             "`/show_files` — このサーバーでアップロードした音声一覧を表示する",
             "`/set_reaction_files` — 指定したリアクションでアップロード音声を再生するように紐付ける",
             "`/delete_files` — アップロードした音声を削除する",
+            "`/show_storage` — このサーバーのアップロード容量と上限を表示する",
+            "`/import_files` — zip の音声と紐付けをまとめて取り込む（サーバー管理権限）",
+            "`/export_files` — アップロード音声と紐付けを zip で書き出す（サーバー管理権限）",
             "",
             "絵文字でリアクションすると対応する音声を VC で再生します。チャンネル単位で ON/OFF 可能。",
         ]
@@ -332,14 +1022,14 @@ class Voice(commands.Cog):
         except Exception:
             pass
         if guild:
-            for em in guild.emojis:
-                if em.name == reaction_key:
-                    return f"{em} `:{reaction_key}:`"
+            em = self._guild_emoji(guild, reaction_key)
+            if em:
+                return f"{em} `:{reaction_key}:`"
         return f"`:{reaction_key}:`"
 
     @app_commands.command(name="show_all_emojis", description="反応する絵文字をすべてチャットに投稿する")
     async def slash_show_all_emojis(self, interaction: discord.Interaction):
-        lines = ["**反応する絵文字一覧**", ""]
+        lines = []
         # 熱盛（固定）
         lines.append("**熱盛**")
         lines.append("♨️ `♨` / サーバー絵文字 `atsumori`")
@@ -364,7 +1054,7 @@ class Voice(commands.Cog):
             for name in sorted(self._server_emoji_list.keys()):
                 custom = None
                 if interaction.guild:
-                    custom = next((e for e in interaction.guild.emojis if e.name == name), None)
+                    custom = self._guild_emoji(interaction.guild, name)
                 if custom:
                     lines.append(f"{str(custom)} `:{name}:`")
                 else:
@@ -372,7 +1062,7 @@ class Voice(commands.Cog):
         lines.append("")
         lines.append("**アップロード音声（独自）**")
         if interaction.guild:
-            custom_pairs = upload_store.list_all_reaction_uploads(interaction.guild_id)
+            custom_pairs = list(self._trigger_table(interaction.guild_id).items())
             if not custom_pairs:
                 lines.append("（なし）")
             else:
@@ -381,10 +1071,13 @@ class Voice(commands.Cog):
                     lines.append(f"{disp} → `{upload_name}`")
         else:
             lines.append("（なし）")
-        text = "\n".join(lines)
-        if len(text) > 2000:
-            text = text[:1997] + "..."
-        await interaction.response.send_message(text)
+        # 紐付けの多いサーバーでも切り捨てずに、ページ送りで全件を見せる
+        view = EmojiListView(paginate_lines(lines))
+        if len(view.pages) == 1:
+            await interaction.response.send_message(view.render())
+            return
+        await interaction.response.send_message(view.render(), view=view)
+        view.message = await interaction.original_response()
 
     @app_commands.command(name="reaction_all_on", description="すべての見えるテキストチャンネルで絵文字→リアクションを ON にする")
     async def slash_reaction_all_on(self, interaction: discord.Interaction):
@@ -465,9 +1158,12 @@ class Voice(commands.Cog):
             await interaction.followup.send(f"ファイルの取得に失敗しました: {e}", ephemeral=True)
             return
         try:
-            safe_name = upload_store.save_upload(
-                interaction.guild_id, name, content, ext, uploaded_by=interaction.user.id
+            safe_name = await asyncio.to_thread(
+                upload_store.save_upload, interaction.guild_id, name, content, ext, uploaded_by=interaction.user.id
             )
+            if interaction.guild_id in self._upload_names:
+                self._upload_names[interaction.guild_id].add(safe_name)
+            self._file_pages.pop(interaction.guild_id, None)
             await interaction.followup.send(f"音声を `{safe_name}` として保存しました。", ephemeral=True)
         except ValueError as e:
             await interaction.followup.send(str(e), ephemeral=True)
@@ -479,11 +1175,26 @@ class Voice(commands.Cog):
     ) -> list[app_commands.Choice[str]]:
         if not interaction.guild_id:
             return []
-        names = upload_store.list_uploads(interaction.guild_id)
-        if not current:
-            return [app_commands.Choice(name=n, value=n) for n in names[:25]]
-        cur = current.lower()
-        return [app_commands.Choice(name=n, value=n) for n in names if cur in n.lower()][:25]
+        names = self._upload_name_index(interaction.guild_id).search(current, limit=25)
+        return [app_commands.Choice(name=n, value=n) for n in names]
+
+    @staticmethod
+    def _storage_reaction_key(reaction: str) -> str:
+        """入力されたリアクションを保存形式にする。Unicode 絵文字に統一（ASCII alias なら emojize で変換、非 ASCII はそのまま）。"""
+        reaction_key = reaction.strip()
+        if reaction_key.startswith(":") and reaction_key.endswith(":"):
+            reaction_key = reaction_key[1:-1].strip()
+        if reaction_key.isascii():
+            emoji_char = emojize(f":{reaction_key}:", language="alias")
+            if emoji_char and emoji_char != f":{reaction_key}:":
+                reaction_key = emoji_char
+        return reaction_key
+
+    def _invalidate_uploads(self, guild_id: int) -> None:
+        """一括取り込みなどでアップロード・紐付けがまとめて変わったとき、その guild の索引とページを捨てる。"""
+        self._trigger_tables.pop(guild_id, None)
+        self._upload_names.pop(guild_id, None)
+        self._file_pages.pop(guild_id, None)
 
     @app_commands.command(name="set_reaction_files", description="指定したリアクションでアップロード音声を再生する")
     @app_commands.describe(
@@ -504,64 +1215,88 @@ class Voice(commands.Cog):
         if not path or not path.is_file():
             await interaction.response.send_message(f"`{name}` という音声が見つかりません。`/show_files` で一覧を確認してください。", ephemeral=True)
             return
-        reaction_key = reaction.strip()
-        if reaction_key.startswith(":") and reaction_key.endswith(":"):
-            reaction_key = reaction_key[1:-1].strip()
+        reaction_key = self._storage_reaction_key(reaction)
         if not reaction_key:
             await interaction.response.send_message("リアクションを指定してください（絵文字または :name:）。", ephemeral=True)
             return
-        # 保存形式は Unicode 絵文字に統一（ASCII alias なら emojize で変換、非 ASCII はそのまま）
-        if reaction_key.isascii():
-            emoji_char = emojize(f":{reaction_key}:", language="alias")
-            if emoji_char and emoji_char != f":{reaction_key}:":
-                reaction_key = emoji_char
         upload_store.set_reaction_upload(interaction.guild_id, reaction_key, name)
+        self._trigger_table(interaction.guild_id)[reaction_key] = name
+        self._message_rule_cache.pop(interaction.guild_id, None)
+        self._file_pages.pop(interaction.guild_id, None)
         await interaction.response.send_message(f"リアクション `{reaction_key}` で `{name}` が再生されるように設定しました。", ephemeral=True)
 
-    @app_commands.command(name="show_files", description="このサーバーでアップロードした音声一覧を表示する")
-    async def slash_show_files(self, interaction: discord.Interaction):
-        if not interaction.guild:
-            await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
-            return
-        rows = upload_store.list_uploads_with_meta(interaction.guild_id)
-        if not rows:
-            await interaction.response.send_message("アップロードされた音声はありません。`/upload_files` で追加できます。", ephemeral=True)
-            return
-        lines = ["**アップロード音声一覧**"]
-        for name, user_id, uploaded_at in rows:
+    async def _upload_page(
+        self, guild_id: int, *, after: str | None = None, before: str | None = None
+    ) -> tuple[list, bool]:
+        """upload_store.list_uploads_page の結果を guild ごとに FILES_PAGE_TTL 秒キャッシュする。"""
+        pages = self._file_pages.setdefault(guild_id, {})
+        key = (after, before)
+        now = time.monotonic()
+        cached = pages.get(key)
+        if cached is not None and now - cached[0] < FILES_PAGE_TTL:
+            return cached[1]
+        page = await asyncio.to_thread(
+            upload_store.list_uploads_page, guild_id, after=after, before=before, limit=FILES_PAGE_SIZE
+        )
+        # 古いページはここで捨てる（ページ数はボタンを押された回数しか増えない）
+        for k in [k for k, (t, _) in pages.items() if now - t >= FILES_PAGE_TTL]:
+            del pages[k]
+        pages[key] = (now, page)
+        return page
+
+    def _reaction_key_short(self, reaction_key: str, guild: discord.Guild) -> str:
+        """一覧の行に付けるリアクション表示（絵文字そのもの。無ければ `:key:`）。"""
+        if not reaction_key.isascii():
+            return reaction_key
+        em = self._guild_emoji(guild, reaction_key)
+        if em:
+            return str(em)
+        try:
+            ch = emojize(f":{reaction_key}:", language="alias")
+            if ch and ch != f":{reaction_key}:":
+                return ch
+        except Exception:
+            pass
+        return f"`:{reaction_key}:`"
+
+    def _render_upload_page(self, guild: discord.Guild, rows: list, page: int) -> str:
+        lines = [f"**アップロード音声一覧**（{page} ページ目）"]
+        for name, user_id, uploaded_at, reaction_keys in rows:
             uploader = "不明"
             if user_id:
-                member = interaction.guild.get_member(user_id)
-                uploader = member.display_name if member else str(user_id)
+                # メンバーをキャッシュしていない（MEMORY_PROFILE=low 等）ときはメンションで表示し、名前の解決は Discord 側に任せる
+                member = guild.get_member(user_id)
+                uploader = member.display_name if member else f"<@{user_id}>"
             date_str = "不明"
             if uploaded_at:
                 dt = datetime.fromtimestamp(uploaded_at, tz=timezone.utc)
                 date_str = dt.strftime("%Y/%m/%d %H:%M")
-            reaction_keys = upload_store.list_reaction_keys_for_upload(interaction.guild_id, name)
-            emoji_parts = []
-            for rk in reaction_keys:
-                if not rk.isascii():
-                    emoji_parts.append(rk)
-                else:
-                    try:
-                        ch = emojize(f":{rk}:", language="alias")
-                        if ch and ch != f":{rk}:":
-                            emoji_parts.append(ch)
-                        else:
-                            emoji_parts.append(f"`:{rk}:`")
-                    except Exception:
-                        emoji_parts.append(f"`:{rk}:`")
-                    if interaction.guild:
-                        for em in interaction.guild.emojis:
-                            if em.name == rk:
-                                emoji_parts[-1] = str(em)
-                                break
+            emoji_parts = [self._reaction_key_short(rk, guild) for rk in reaction_keys]
             reaction_str = " ".join(emoji_parts) if emoji_parts else "—"
             lines.append(f"・`{name}` — {uploader}（{date_str}) {reaction_str}")
         text = "\n".join(lines)
         if len(text) > 2000:
             text = text[:1997] + "..."
-        await interaction.response.send_message(text)
+        return text
+
+    @app_commands.command(name="show_files", description="このサーバーでアップロードした音声一覧を表示する")
+    async def slash_show_files(self, interaction: discord.Interaction):
+        if not interaction.guild:
+            await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
+            return
+        rows, has_next = await self._upload_page(interaction.guild_id)
+        if not rows:
+            await interaction.response.send_message("アップロードされた音声はありません。`/upload_files` で追加できます。", ephemeral=True)
+            return
+        text = self._render_upload_page(interaction.guild, rows, 1)
+        # 投稿者をメンションで出すことがあるので通知は飛ばさない
+        no_ping = discord.AllowedMentions.none()
+        if not has_next:
+            await interaction.response.send_message(text, allowed_mentions=no_ping)
+            return
+        view = UploadListView(self, interaction.guild, rows, has_next)
+        await interaction.response.send_message(text, view=view, allowed_mentions=no_ping)
+        view.message = await interaction.original_response()
 
     @app_commands.command(name="delete_files", description="アップロードした音声を削除する")
     @app_commands.describe(name="削除する音声の名前")
@@ -571,11 +1306,124 @@ class Voice(commands.Cog):
             await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
             return
         try:
-            upload_store.delete_upload(interaction.guild_id, name)
+            await asyncio.to_thread(upload_store.delete_upload, interaction.guild_id, name)
+            # 同じ名前で上げ直したときに前の音声の回数を引き継がないよう、再生回数も消す
+            await asyncio.to_thread(play_stats.forget, interaction.guild_id, "upload", name)
+            self._trigger_tables.pop(interaction.guild_id, None)
+            if interaction.guild_id in self._upload_names:
+                self._upload_names[interaction.guild_id].remove(name)
+            self._file_pages.pop(interaction.guild_id, None)
             await interaction.response.send_message(f"`{name}` を削除しました。", ephemeral=True)
         except ValueError as e:
             await interaction.response.send_message(str(e), ephemeral=True)
 
+    @app_commands.command(name="import_files", description="zip に入った音声（と manifest.json の紐付け）をまとめて取り込む")
+    @app_commands.describe(file="mp3 / wav を入れた zip（/export_files で書き出したものもそのまま使える）")
+    @app_commands.default_permissions(manage_guild=True)
+    async def slash_import_files(self, interaction: discord.Interaction, file: discord.Attachment):
+        if not interaction.guild:
+            await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
+            return
+        if not (file.filename or "").lower().endswith(".zip"):
+            await interaction.response.send_message("zip ファイルを添付してください。", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        fd, tmp = tempfile.mkstemp(suffix=".zip")
+        os.close(fd)
+        try:
+            await file.save(tmp)
+            report = await asyncio.to_thread(
+                bulk_io.import_archive,
+                interaction.guild_id,
+                tmp,
+                uploaded_by=interaction.user.id,
+                normalize_key=self._storage_reaction_key,
+            )
+        except (ValueError, zipfile.BadZipFile) as e:
+            await interaction.followup.send(f"取り込めませんでした: {e}", ephemeral=True)
+            return
+        except (discord.HTTPException, OSError) as e:
+            await interaction.followup.send(f"ファイルの取得に失敗しました: {e}", ephemeral=True)
+            return
+        except Exception as e:
+            # DB エラーなど。途中まで保存した分があるかもしれないのでキャッシュは捨て、defer した応答を閉じる
+            logger.exception("[op] import_files | error guild_id=%s: %s", interaction.guild_id, e)
+            self._invalidate_uploads(interaction.guild_id)
+            await interaction.followup.send("取り込み中にエラーが発生しました。途中まで取り込まれている場合があります。", ephemeral=True)
+            return
+        finally:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        self._invalidate_uploads(interaction.guild_id)
+        self._schedule_import_prefetch(interaction.guild_id, report["names"])
+        lines = [
+            f"{report['imported']} 件取り込みました（{report['bytes'] / 1024 / 1024:.1f} MB、紐付け {report['bindings']} 件、{report['elapsed']:.1f} 秒）。"
+        ]
+        skipped = report["skipped"] + [(name, "保存中に実体が消えました") for name in report["missing"]]
+        if skipped:
+            lines.append(f"スキップ {len(skipped)} 件:")
+            lines += [f"・`{entry}` {reason}" for entry, reason in skipped[:10]]
+            if len(skipped) > 10:
+                lines.append(f"…ほか {len(skipped) - 10} 件")
+        await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+    @app_commands.command(name="export_files", description="このサーバーのアップロード音声と紐付けを zip で書き出す")
+    @app_commands.default_permissions(manage_guild=True)
+    async def slash_export_files(self, interaction: discord.Interaction):
+        if not interaction.guild:
+            await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        fd, tmp = tempfile.mkstemp(suffix=".zip")
+        os.close(fd)
+        try:
+            report = await asyncio.to_thread(bulk_io.export_archive, interaction.guild_id, tmp)
+            size = os.path.getsize(tmp)
+            if size > interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    f"書き出した zip（{size / 1024 / 1024:.1f} MB）がこのサーバーで添付できる上限"
+                    f"（{interaction.guild.filesize_limit / 1024 / 1024:.0f} MB）を超えました。BOT の管理者に依頼してください。",
+                    ephemeral=True,
+                )
+                return
+            await interaction.followup.send(
+                f"{report['files']} 件（紐付け {report['bindings']} 件）を書き出しました。`/import_files` で取り込めます。",
+                file=discord.File(tmp, filename=f"atsumori_{interaction.guild_id}.zip"),
+                ephemeral=True,
+            )
+        except Exception as e:
+            logger.exception("[op] export_files | error guild_id=%s: %s", interaction.guild_id, e)
+            await interaction.followup.send("書き出し中にエラーが発生しました。", ephemeral=True)
+        finally:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    @app_commands.command(name="show_storage", description="このサーバーのアップロード容量と上限を表示する")
+    async def slash_show_storage(self, interaction: discord.Interaction):
+        if not interaction.guild:
+            await interaction.response.send_message("サーバー内で実行してください。", ephemeral=True)
+            return
+        files, used = await asyncio.to_thread(upload_store.guild_usage, interaction.guild_id)
+        files_limit = f"{upload_store.QUOTA_FILES} 件" if upload_store.QUOTA_FILES else "無制限"
+        bytes_limit = f"{upload_store.QUOTA_BYTES / 1024 / 1024:.0f} MB" if upload_store.QUOTA_BYTES else "無制限"
+        cache = artifact_cache.stats()
+        lookups = cache["hits"] + cache["misses"]
+        hit_rate = f"{cache['hits'] / lookups:.0%}" if lookups else "—"
+        lines = [
+            "**アップロード容量**",
+            f"・ファイル数: {files} / {files_limit}",
+            f"・容量: {used / 1024 / 1024:.1f} MB / {bytes_limit}",
+            "",
+            "**再生キャッシュ（全体）**",
+            f"・{cache['entries']} 件 {cache['bytes'] / 1024 / 1024:.1f} / {cache['max_bytes'] / 1024 / 1024:.0f} MB",
+            f"・ヒット率 {hit_rate}（hit {cache['hits']} / miss {cache['misses']} / 追い出し {cache['evictions']}）",
+        ]
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
     # --- 従来のプレフィックスコマンド（互換のため残す） ---
 
     @commands.command()
@@ -591,53 +1439,111 @@ class Voice(commands.Cog):
     async def leave(self, ctx: commands.Context):
         vc = self.get_guild_vc(ctx.guild)
         if vc:
-            self._clear_queue_for_guild(vc.guild.id)
-            await vc.disconnect()
+            await self._disconnect(vc)
             await ctx.send("退出しました。")
 
+    # --- 起動後 warmup（初回トリガーのキャッシュミスを先に払う） ---
+
+    def _warmup_guild_order(self, limit: int) -> list[discord.Guild]:
+        """warmup 対象の guild。VC にいるメンバーが多い順、次にメンバー数の多い順。"""
+        def score(g: discord.Guild):
+            in_voice = sum(len(ch.members) for ch in g.voice_channels)
+            return (in_voice, g.member_count or 0)
+        return sorted(self.bot.guilds, key=score, reverse=True)[:limit]
+
+    async def _warmup(self) -> None:
+        t0 = time.monotonic()
+        try:
+            await asyncio.to_thread(_warm_emoji_tables)
+            paths = self._config_sound_paths()
+            files, size = await asyncio.to_thread(_warm_files, paths, WARMUP_MAX_BYTES)
+            budget = WARMUP_MAX_BYTES - size
+            logger.info("[warmup] emoji tables + config sounds %d/%d files %.1fMB (%.2fs)", files, len(paths), size / 1e6, time.monotonic() - t0)
+            guilds = self._warmup_guild_order(WARMUP_GUILDS)
+            # 同じ内容のアップロードは blobs/ の 1 ファイルを共有するので、読むのは一度だけ
+            seen_paths: set[str] = set(paths)
+            for i, guild in enumerate(guilds, 1):
+                rows = await asyncio.to_thread(upload_store.list_all_reaction_uploads, guild.id)
+                table = self._trigger_tables.setdefault(guild.id, dict(rows))
+                if guild.id not in self._upload_names:
+                    names = await asyncio.to_thread(upload_store.list_uploads, guild.id)
+                    self._upload_names.setdefault(guild.id, name_index.NameIndex(names))
+                self._build_guild_emoji_index(guild)
+                if budget > 0 and table:
+                    upload_paths = await asyncio.to_thread(
+                        lambda: [str(p) for p in (upload_store.get_upload_path(guild.id, n) for n in set(table.values())) if p]
+                    )
+                    upload_paths = [p for p in upload_paths if p not in seen_paths]
+                    seen_paths.update(upload_paths)
+                    g_files, g_size = await asyncio.to_thread(_warm_files, upload_paths, budget)
+                    files += g_files
+                    budget -= g_size
+                if i % 10 == 0 or i == len(guilds):
+                    logger.info("[warmup] guilds %d/%d (%.2fs)", i, len(guilds), time.monotonic() - t0)
+            logger.info(
+                "[warmup] done guilds=%d sound_files=%d sound_mb=%.1f elapsed=%.2fs",
+                len(guilds), files, (WARMUP_MAX_BYTES - budget) / 1e6, time.monotonic() - t0,
+            )
+            if PREFETCH_TOP > 0:
+                t1 = time.monotonic()
+                rows = await asyncio.to_thread(play_stats.top_sounds, None, PREFETCH_TOP)
+                rendered = await self._prefetch(rows)
+                logger.info("[prefetch] startup top=%d rendered=%d (%.2fs)", len(rows), rendered, time.monotonic() - t1)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("[warmup] failed")
+
     # --- イベントハンドリング（SPEC §5.2, §8） ---
 
     @commands.Cog.listener(name="on_ready")
     async def on_ready_method(self):
         await self.bot.change_presence(activity=discord.Game("/join"))
+        # warmup はバックグラウンドで行い、on_ready（ゲートウェイの準備完了）を待たせない
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup())
+
+    @commands.Cog.listener(name="on_guild_emojis_update")
+    async def on_guild_emojis_update(self, guild: discord.Guild, before, after):
+        self._guild_emoji_index.pop(guild.id, None)
 
     @commands.Cog.listener(name="on_message")
     async def on_message_atsumori(self, message: discord.Message):
         if message.author.bot or not message.guild:
             return
-        if not reaction_db.is_reaction_enabled(message.guild.id, message.channel.id):
+        # 過負荷時はランダムの ♨️ と自動リアクションを本文の走査ごと止める
+        if not self.overload.allow_auto_reactions():
             return
         try:
-            text = demojize(message.content or "", delimiters=("<:", ":>"))
-            res = re.findall(r"<:([^<>]+?):[0-9]*?>", text)
-            for x in res:
+            rules = self._message_rules(message.guild.id)
+            # 絵文字も候補語も無い本文（大半のチャット）は、ランダムの ♨️ に当たらなければ DB も見ずに終わる
+            scan = rules.scan(message.content or "")
+            lucky = random.randint(1, 100) <= 10
+            if scan is None and not lucky:
+                return
+            if not reaction_db.is_reaction_enabled(message.guild.id, message.channel.id):
+                return
+            triggers = self._trigger_table(message.guild.id)
+            for x in scan.names if scan else ():
                 if x in self._emoji_list or x == "hot_springs":
                     await message.add_reaction(emojize(":" + x + ":"))
                 if x in self._server_emoji_list or x == "atsumori":
-                    for em in message.guild.emojis:
-                        if em.name == x:
-                            await message.add_reaction(em)
+                    em = self._guild_emoji(message.guild, x)
+                    if em:
+                        await message.add_reaction(em)
                 # アップロード音声に設定されたサーバー絵文字が本文に含まれる場合もリアクション
-                if upload_store.get_reaction_upload(message.guild.id, x):
-                    for em in message.guild.emojis:
-                        if em.name == x:
-                            await message.add_reaction(em)
-                            break
-            if random.randint(1, 100) <= 10:
-                atsumori_emoji = "♨️"
-                for em in message.guild.emojis:
-                    if em.name == "atsumori":
-                        atsumori_emoji = em
-                        break
+                if x in triggers:
+                    em = self._guild_emoji(message.guild, x)
+                    if em:
+                        await message.add_reaction(em)
+            if lucky:
+                atsumori_emoji = self._guild_emoji(message.guild, "atsumori") or "♨️"
                 await message.add_reaction(atsumori_emoji)
-            content_raw = message.content or ""
-            content_lower = content_raw.lower().strip()
+            if scan is None:
+                return
             # アップロード名が本文に単語として含まれるとき、紐付いたリアクションを付ける（例: "cat" → 🐱）
-            for upload_name in upload_store.list_uploads(message.guild.id):
-                pattern = r"\b" + re.escape(upload_name) + r"\b"
-                if not re.search(pattern, content_lower, re.IGNORECASE) and content_lower != upload_name.lower():
-                    continue
-                for rk in upload_store.list_reaction_keys_for_upload(message.guild.id, upload_name):
+            for _, keys in rules.matched_uploads(scan):
+                for rk in keys:
                     try:
                         if not rk.isascii():
                             await message.add_reaction(rk)
@@ -646,17 +1552,14 @@ class Voice(commands.Cog):
                         if emoji_char and emoji_char != f":{rk}:":
                             await message.add_reaction(emoji_char)
                             break
-                        for em in message.guild.emojis:
-                            if em.name == rk:
-                                await message.add_reaction(em)
-                                break
+                        em = self._guild_emoji(message.guild, rk)
+                        if em:
+                            await message.add_reaction(em)
                     except (discord.HTTPException, ValueError):
                         pass
-            # 本文にアップロード設定の絵文字（Unicode や :name:）が含まれるときもリアクションを付ける（後方互換: ASCII alias と variation selector 吸収）
-            for rk, _ in upload_store.list_all_reaction_uploads(message.guild.id):
+            # 本文にアップロード設定の絵文字（Unicode や ASCII alias・サーバー絵文字名）が含まれるときもリアクションを付ける
+            for rk in rules.matched_keys(scan):
                 try:
-                    if not self._content_contains_reaction(content_raw, rk):
-                        continue
                     if not rk.isascii():
                         await message.add_reaction(rk)
                     else:
@@ -664,22 +1567,38 @@ class Voice(commands.Cog):
                         if emoji_char and emoji_char != f":{rk}:":
                             await message.add_reaction(emoji_char)
                         else:
-                            for em in message.guild.emojis:
-                                if em.name == rk:
-                                    await message.add_reaction(em)
-                                    break
+                            em = self._guild_emoji(message.guild, rk)
+                            if em:
+                                await message.add_reaction(em)
                 except (discord.HTTPException, ValueError):
                     pass
         except Exception as e:
             logger.exception("on_message: %s", e)
 
+    @staticmethod
+    def _member_voice_channel(guild: discord.Guild, user_id: int):
+        """
+        user_id がいる VC（いなければ None）。メンバーがキャッシュに無くても（MEMORY_PROFILE=low など）
+        guild の音声状態から引けるので、API で fetch_member しない。
+        """
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member.voice.channel if member.voice else None
+        for channel in guild.voice_channels:
+            if user_id in channel.voice_states:
+                return channel
+        for channel in guild.stage_channels:
+            if user_id in channel.voice_states:
+                return channel
+        return None
+
     async def _reaction_get_vc(self, message: discord.Message, user_id: int):
-        member = await message.guild.fetch_member(user_id)
-        if not member.voice:
-            member = await message.guild.fetch_member(message.author.id)
-        if not member.voice:
+        channel = self._member_voice_channel(message.guild, user_id)
+        if channel is None:
+            channel = self._member_voice_channel(message.guild, message.author.id)
+        if channel is None:
             return None
-        return await self._connect(member.voice.channel)
+        return await self._connect(channel)
 
     def _is_atsumori_emoji(self, emoji: discord.PartialEmoji | discord.Emoji) -> bool:
         """atsumori/熱盛トリガーか。emoji ライブラリで正規化して判定する。"""
@@ -690,8 +1609,21 @@ class Voice(commands.Cog):
         key = demojize(str(emoji), delimiters=("", "")).strip(":").lower()
         return key == "hot_springs"
 
+    def _is_trigger_emoji(self, guild_id: int, emoji: discord.PartialEmoji | discord.Emoji) -> bool:
+        """その絵文字で何か鳴るか（_on_reaction_trigger と同じ照合）。鳴らないリアクションは流量制御にも数えない。"""
+        if self._is_atsumori_emoji(emoji):
+            return True
+        emoji_name = getattr(emoji, "name", str(emoji))
+        key_unicode = demojize(str(emoji), delimiters=("", "")).strip(":")
+        triggers = self._trigger_table(guild_id)
+        if str(emoji) in triggers or key_unicode in triggers or emoji_name in triggers:
+            return True
+        return key_unicode in self._emoji_list or emoji_name in self._server_emoji_list
+
     async def _on_reaction_trigger(self, message: discord.Message, user_id: int, emoji: discord.PartialEmoji | discord.Emoji):
         emoji_name = getattr(emoji, "name", str(emoji))
+        # 再生回数の集計に使う絵文字の名前（サーバー絵文字は名前、Unicode 絵文字は FE0F を除いた文字）
+        emoji_key = emoji_name if getattr(emoji, "id", None) else emoji_scan.normalize(str(emoji))
         logger.info("[op] reaction_trigger | begin user_id=%s guild_id=%s emoji=%s message_id=%s", user_id, message.guild.id if message.guild else None, emoji_name, message.id)
         vc = await self._reaction_get_vc(message, user_id)
         if vc is None:
@@ -699,60 +1631,110 @@ class Voice(commands.Cog):
             return
         if self._is_atsumori_emoji(emoji):
             logger.info("[op] reaction | emoji=%s → atsumori (sequence) guild_id=%s", emoji_name, vc.guild.id)
-            self.play_atsumori(vc)
+            self.play_atsumori(vc, emoji=emoji_key)
             return
         key_unicode = demojize(str(emoji), delimiters=("", "")).strip(":")
         # ユーザーアップロード音声（/set_reaction_files で紐付けたもの）を優先。Unicode 保存と alias 保存の両方に照合する。
+        triggers = self._trigger_table(vc.guild.id)
         for rk in (str(emoji), key_unicode, emoji_name):
-            upload_name = upload_store.get_reaction_upload(vc.guild.id, rk)
+            upload_name = triggers.get(rk)
             if upload_name:
                 path = upload_store.get_upload_path(vc.guild.id, upload_name)
                 if path and path.is_file():
                     logger.info("[op] reaction | emoji=%s → upload=%s guild_id=%s", emoji_name, upload_name, vc.guild.id)
-                    self.play_single(vc, str(path))
+                    self.play_single(vc, str(path), upload_name=upload_name, emoji=emoji_key)
                     return
         if key_unicode in self._emoji_list:
             path = self._pick_source_from_list(self._emoji_list[key_unicode])
             logger.info("[op] reaction | emoji=%s → file=%s guild_id=%s", emoji_name or key_unicode, path, vc.guild.id)
-            self.play_single(vc, path)
+            self.play_single(vc, path, emoji=emoji_key)
             return
         if emoji_name in self._server_emoji_list:
             path = self._pick_source_from_list(self._server_emoji_list[emoji_name])
             logger.info("[op] reaction | emoji=%s → file=%s guild_id=%s", emoji_name, path, vc.guild.id)
-            self.play_single(vc, path)
+            self.play_single(vc, path, emoji=emoji_key)
 
-    @commands.Cog.listener(name="on_raw_reaction_add")
-    async def on_reaction_add(self, payload: discord.RawReactionActionEvent):
+    def _admit_reaction(self, payload: discord.RawReactionActionEvent) -> bool:
+        """
+        リアクションイベントを処理するか。付け外しの連打（デバウンス）→ ユーザー単位 → guild 単位の順に判定する。
+        自 BOT のリアクションは判定しない（on_message で付けた分は本文の照合で流量が決まっており、guild の枠を食わせない）。
+        """
+        counts = self._trigger_counts
+        now = time.monotonic()
+        if self.bot.user is not None and payload.user_id == self.bot.user.id:
+            counts["accepted"] += 1
+            return True
+        if not self._trigger_debounce.allow((payload.message_id, payload.user_id, str(payload.emoji)), now):
+            counts["debounced"] += 1
+            return False
+        if not self._trigger_user_bucket.allow((payload.guild_id, payload.user_id), now):
+            counts["user_limited"] += 1
+            logger.debug("[op] reaction_suppressed | reason=user guild_id=%s user_id=%s", payload.guild_id, payload.user_id)
+            return False
+        if not self._trigger_guild_bucket.allow(payload.guild_id, now):
+            counts["guild_limited"] += 1
+            logger.debug("[op] reaction_suppressed | reason=guild guild_id=%s", payload.guild_id)
+            return False
+        counts["accepted"] += 1
+        return True
+
+    def trigger_stats(self) -> dict[str, int]:
+        """リアクショントリガーの通過・抑止件数（起動からの累計）と、流量制御が保持しているキー数。"""
+        return dict(
+            self._trigger_counts,
+            debounce_keys=len(self._trigger_debounce),
+            user_buckets=len(self._trigger_user_bucket),
+            guild_buckets=len(self._trigger_guild_bucket),
+        )
+
+    # OpLogSampler はフォーマット文字列の先頭でカテゴリを決めるので、カテゴリは引数にせず文字列に書いておく
+    _RAW_REACTION_LOGS = {
+        "reaction_add": (
+            "[op] reaction_add | message_id=%s user_id=%s channel_id=%s",
+            "[op] reaction_add | error: %s",
+        ),
+        "reaction_remove": (
+            "[op] reaction_remove | message_id=%s user_id=%s channel_id=%s",
+            "[op] reaction_remove | error: %s",
+        ),
+    }
+
+    async def _handle_raw_reaction(self, payload: discord.RawReactionActionEvent, op: str) -> None:
+        begin_fmt, error_fmt = self._RAW_REACTION_LOGS[op]
         try:
+            if payload.guild_id is None:
+                return
+            # 自 BOT が自分の投稿に付けたリアクション（add のときは投稿者がペイロードで分かる）は取得前に捨てる
+            if payload.user_id == self.bot.user.id and payload.message_author_id == self.bot.user.id:
+                return
             channel = self.bot.get_channel(payload.channel_id)
             if not channel or not isinstance(channel, discord.TextChannel):
                 return
+            # 鳴らない絵文字は流量制御の枠を使わずにここで捨てる
+            if not self._is_trigger_emoji(payload.guild_id, payload.emoji):
+                return
+            if not self._admit_reaction(payload):
+                return
             message = await self._get_message_cached(channel, payload.message_id)
             if not message:
                 return
             # このBotが自分の投稿（show_all_emojis／show_files 等）にリアクションしたときだけトリガーしない
             if payload.user_id == self.bot.user.id and message.author.id == self.bot.user.id:
                 return
-            logger.info("[op] reaction_add | message_id=%s user_id=%s channel_id=%s", payload.message_id, payload.user_id, payload.channel_id)
+            logger.info(begin_fmt, payload.message_id, payload.user_id, payload.channel_id)
             await self._on_reaction_trigger(message, payload.user_id, payload.emoji)
         except Exception as e:
-            logger.exception("[op] reaction_add | error: %s", e)
+            logger.exception(error_fmt, e)
+
+    @commands.Cog.listener(name="on_raw_reaction_add")
+    async def on_reaction_add(self, payload: discord.RawReactionActionEvent):
+        await self._handle_raw_reaction(payload, "reaction_add")
 
     @commands.Cog.listener(name="on_raw_reaction_remove")
     async def on_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        try:
-            channel = self.bot.get_channel(payload.channel_id)
-            if not channel or not isinstance(channel, discord.TextChannel):
-                return
-            message = await self._get_message_cached(channel, payload.message_id)
-            if not message:
-                return
-            if payload.user_id == self.bot.user.id and message.author.id == self.bot.user.id:
-                return
-            logger.info("[op] reaction_remove | message_id=%s user_id=%s channel_id=%s", payload.message_id, payload.user_id, payload.channel_id)
-            await self._on_reaction_trigger(message, payload.user_id, payload.emoji)
-        except Exception as e:
-            logger.exception("[op] reaction_remove | error: %s", e)
+        if not self.overload.allow_reaction_remove():
+            return
+        await self._handle_raw_reaction(payload, "reaction_remove")
 
     @commands.Cog.listener(name="on_voice_state_update")
     async def on_voice_state_update(
@@ -761,17 +1743,26 @@ class Voice(commands.Cog):
         before: discord.VoiceState,
         after: discord.VoiceState,
     ):
-        # BOT 自身が VC から外れたとき（4006 / 4017 等）をログで追えるようにする
+        # BOT 自身が VC から外れたとき（4006 / 4017 等）をログで追えるようにし、意図しない切断ならセッション監視が入り直す
         # 4017 = DAVE 非対応クライアントとしてサーバーから切断（3月以降必須）
         if member.id != self.bot.user.id:
             return
         if before.channel and not after.channel:
+            session = self._sessions.get(member.guild.id, before.channel.id)
             logger.info(
-                "[op] voice_disconnected | guild_id=%s channel_id=%s at=%.3f",
+                "[op] voice_disconnected | guild_id=%s channel_id=%s at=%.3f intentional=%s",
                 member.guild.id,
                 before.channel.id,
                 time.monotonic(),
+                session is not None and session.state == voice_session.LEAVING,
             )
+            self._on_voice_dropped(member.guild, before.channel.id)
+        elif before.channel and after.channel and before.channel.id != after.channel.id:
+            # 管理者に別のチャンネルへ移された。キューと状態はそのまま移動先のセッションとして引き継ぐ
+            session = self._sessions.get(member.guild.id, before.channel.id)
+            if session is not None:
+                logger.info("[op] voice_moved | guild_id=%s channel_id=%s -> %s", member.guild.id, before.channel.id, after.channel.id)
+                self._sessions.move(session, after.channel.id)
 
 
 async def setup(bot: commands.Bot):
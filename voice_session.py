@@ -0,0 +1,196 @@
+# coding: utf-8
+"""VC セッションの登録簿: (guild, チャンネル) ごとに VoiceClient・再生キュー・時刻・状態をまとめて持ち、走査せずに引く（SPEC §9.2, §9.4）"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# セッションの状態
+# connecting: connect 待ち / connected: 再生できる / recovering: 意図しない切断から入り直し中 / leaving: 自分で退出して切断イベント待ち
+# connecting → connected ⇄ recovering、connected / recovering → leaving。leaving のまま入り直すと connecting に戻る。
+# 切断イベントの処理を終えたとき・入り直しを諦めたとき・connect に失敗したときに登録簿から外す
+CONNECTING = "connecting"
+CONNECTED = "connected"
+RECOVERING = "recovering"
+LEAVING = "leaving"
+STATES = (CONNECTING, CONNECTED, RECOVERING, LEAVING)
+
+
+class VoiceSession:
+    """1 つのボイスチャンネルへの接続。切断から入り直している間も、キューと時刻はこのオブジェクトに残る。"""
+
+    __slots__ = (
+        "guild_id", "channel_id", "vc", "state", "state_since", "opened_at", "connected_at",
+        "queue", "plays", "last_played_at", "left_at", "last_recovered",
+        "connect_task", "reconnect_task",
+    )
+
+    def __init__(self, guild_id: int, channel_id: int):
+        now = time.monotonic()
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        # connected の間だけ入る（切断されたら None。discord.py 側では後始末済み）
+        self.vc: discord.VoiceClient | None = None
+        self.state = CONNECTING
+        self.state_since = now
+        self.opened_at = now
+        self.connected_at: float | None = None
+        # 再生待ちの音声 (音源パス, 積んだ時刻)。再生スレッドの after からも取り出すので deque（append / popleft は原子的）
+        self.queue: deque[tuple[str, float]] = deque()
+        self.plays = 0
+        self.last_played_at: float | None = None
+        # 自分で退出した時刻（その前の接続の切断イベントを意図しない切断と取り違えないため）/ 最後に入り直せた時刻
+        self.left_at: float | None = None
+        self.last_recovered: float | None = None
+        # 進行中の connect（同時に来たトリガーは同じ connect を待つ）/ 入り直しのタスク
+        self.connect_task: asyncio.Task | None = None
+        self.reconnect_task: asyncio.Task | None = None
+
+    def __repr__(self) -> str:
+        return f"<VoiceSession guild_id={self.guild_id} channel_id={self.channel_id} state={self.state} queued={len(self.queue)}>"
+
+    def transition(self, state: str) -> None:
+        if state not in STATES:
+            raise ValueError(f"unknown voice session state: {state!r}")
+        if state != self.state:
+            logger.debug("[voice_session] guild_id=%s channel_id=%s %s -> %s", self.guild_id, self.channel_id, self.state, state)
+            self.state = state
+            self.state_since = time.monotonic()
+
+    def attach(self, vc: discord.VoiceClient) -> None:
+        """connect / 入り直しに成功した VoiceClient を持たせて connected にする。"""
+        self.vc = vc
+        self.connected_at = time.monotonic()
+        self.transition(CONNECTED)
+
+    def detach(self, state: str) -> None:
+        """VoiceClient を手放して state にする（切断・退出時）。"""
+        self.vc = None
+        self.transition(state)
+
+    def is_recovering(self) -> bool:
+        return self.reconnect_task is not None and not self.reconnect_task.done()
+
+    # --- 再生キュー（SPEC §5.1） ---
+
+    def push(self, path: str) -> None:
+        self.queue.append((path, time.monotonic()))
+
+    def pop(self) -> str | None:
+        try:
+            path, _ = self.queue.popleft()
+        except IndexError:
+            return None
+        self.plays += 1
+        self.last_played_at = time.monotonic()
+        return path
+
+    def trim(self, max_age: float) -> int:
+        """max_age 秒より前に積まれた音声を捨てる。捨てた件数を返す（積んだ順なので先頭から見ればよい）。"""
+        cutoff = time.monotonic() - max_age
+        dropped = 0
+        while self.queue and self.queue[0][1] < cutoff:
+            self.queue.popleft()
+            dropped += 1
+        return dropped
+
+
+class Registry:
+    """
+    VoiceSession の登録簿。(guild_id, channel_id) と guild_id の両方から dict で引く。
+    1 guild に複数チャンネルのセッションを持てる（discord.py の接続は今のところ guild に 1 つなので、通常は 1 件）。
+    """
+
+    def __init__(self):
+        self._sessions: dict[tuple[int, int], VoiceSession] = {}
+        # guild_id → {channel_id: VoiceSession}
+        self._by_guild: dict[int, dict[int, VoiceSession]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def get(self, guild_id: int, channel_id: int) -> VoiceSession | None:
+        return self._sessions.get((guild_id, channel_id))
+
+    def in_guild(self, guild_id: int) -> list[VoiceSession]:
+        return list(self._by_guild.get(guild_id, {}).values())
+
+    def connected(self, guild_id: int) -> VoiceSession | None:
+        """guild 内で connected のセッションを 1 つ（最初に開いたもの）。なければ None。"""
+        for session in self.in_guild(guild_id):
+            if session.state == CONNECTED:
+                return session
+        return None
+
+    def of(self, vc: discord.VoiceClient) -> VoiceSession | None:
+        """vc を持っているセッション。移動直後で vc.channel と登録のキーがずれていても引ける。"""
+        guild_id = vc.guild.id
+        channel = vc.channel
+        session = self._sessions.get((guild_id, channel.id)) if channel is not None else None
+        if session is not None and session.vc is vc:
+            return session
+        for session in self.in_guild(guild_id):
+            if session.vc is vc:
+                return session
+        return None
+
+    def open(self, guild_id: int, channel_id: int) -> VoiceSession:
+        """(guild, チャンネル) のセッション。無ければ connecting で作る。"""
+        session = self._sessions.get((guild_id, channel_id))
+        if session is None:
+            session = VoiceSession(guild_id, channel_id)
+            self._sessions[(guild_id, channel_id)] = session
+            self._by_guild.setdefault(guild_id, {})[channel_id] = session
+        return session
+
+    def move(self, session: VoiceSession, channel_id: int) -> None:
+        """BOT が別のチャンネルへ移された。同じセッションのまま登録のキーを付け替える（移動先に別のセッションがあれば置き換える）。"""
+        if channel_id == session.channel_id:
+            return
+        self._unlink(session)
+        session.channel_id = channel_id
+        replaced = self._sessions.get((session.guild_id, channel_id))
+        if replaced is not None:
+            self.remove(replaced)
+        self._sessions[(session.guild_id, channel_id)] = session
+        self._by_guild.setdefault(session.guild_id, {})[channel_id] = session
+
+    def remove(self, session: VoiceSession) -> None:
+        """登録簿から外す。キューは捨て、入り直しのタスクは止める。"""
+        if self._sessions.get((session.guild_id, session.channel_id)) is not session:
+            return
+        self._unlink(session)
+        session.vc = None
+        session.queue.clear()
+        task = session.reconnect_task
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+
+    def _unlink(self, session: VoiceSession) -> None:
+        key = (session.guild_id, session.channel_id)
+        if self._sessions.get(key) is session:
+            del self._sessions[key]
+        channels = self._by_guild.get(session.guild_id)
+        if channels is not None and channels.get(session.channel_id) is session:
+            del channels[session.channel_id]
+            if not channels:
+                del self._by_guild[session.guild_id]
+
+    def queued_total(self) -> int:
+        """全セッションの再生キューに積まれている件数。"""
+        return sum(len(s.queue) for s in self._sessions.values())
+
+    def counts(self) -> dict[str, int]:
+        """状態ごとのセッション数。"""
+        out = dict.fromkeys(STATES, 0)
+        for session in self._sessions.values():
+            out[session.state] += 1
+        return out